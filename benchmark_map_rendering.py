@@ -0,0 +1,96 @@
+import argparse
+import csv
+import os
+import random
+import tempfile
+import time
+
+import matplotlib
+matplotlib.use("Agg")
+from core_data_modules.logging import Logger
+
+from src.geometry_cache import GeometryCache
+from src.map_render_queue import COUNTIES_GEOJSON_PATH, CONSTITUENCIES_GEOJSON_PATH, LAKES_GEOJSON_PATH, \
+    CONSTITUENCY_INSET, _geometry_levels
+from src.mapping_utils import FrequencyMapRenderer
+
+log = Logger(__name__)
+
+# (map format, dpi, simplification tolerance), using the same meanings as the AutomatedAnalysis configuration.
+DEFAULT_MODES = [
+    ("png", 1200, 0),
+    ("png", 1200, None),
+    ("png", 600, None),
+    ("png", 300, None),
+    ("svg", 300, None),
+    ("pdf", 300, None)
+]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the render time and output size of the automated "
+                                                 "analysis maps in each supported output mode. "
+                                                 "This script must be run from its parent directory.")
+
+    parser.add_argument("--maps-per-mode", type=int, default=5,
+                        help="Number of maps of each geography to render in each mode")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed for the random frequencies to plot")
+    parser.add_argument("--csv-output-path", default=None,
+                        help="Path to write the benchmark results to as a CSV, in addition to the log")
+
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    geometry_cache = GeometryCache()
+    output_dir = tempfile.mkdtemp()
+
+    results = []
+    for map_format, dpi, tolerance in DEFAULT_MODES:
+        for geography, geojson_path, admin_id_column, inset in [
+            ("county", COUNTIES_GEOJSON_PATH, "ADM1_AVF", None),
+            ("constituency", CONSTITUENCIES_GEOJSON_PATH, "ADM2_AVF", CONSTITUENCY_INSET)
+        ]:
+            levels = dict(_geometry_levels(dpi, tolerance))
+
+            load_start = time.time()
+            geo_data = geometry_cache.load(geojson_path, **levels[geojson_path])
+            lakes_map = geometry_cache.load(LAKES_GEOJSON_PATH, **levels[LAKES_GEOJSON_PATH])
+            lakes_map = lakes_map[lakes_map.LAKE_AVF.isin({"lake_turkana", "lake_victoria"})]
+            load_seconds = time.time() - load_start
+
+            setup_start = time.time()
+            renderer = FrequencyMapRenderer(geo_data, admin_id_column, water_bodies=lakes_map, inset=inset)
+            setup_seconds = time.time() - setup_start
+
+            render_start = time.time()
+            total_bytes = 0
+            for i in range(args.maps_per_mode):
+                frequencies = {admin_id: rng.randint(0, 500) for admin_id in geo_data[admin_id_column]}
+                output_path = f"{output_dir}/{geography}_{map_format}_{dpi}_{i}.{map_format}"
+                renderer.render(frequencies, output_path, dpi=dpi)
+                total_bytes += os.path.getsize(output_path)
+                os.remove(output_path)
+            render_seconds = time.time() - render_start
+            renderer.close()
+
+            result = {
+                "Geography": geography,
+                "Format": map_format,
+                "DPI": dpi,
+                "Simplification": "none" if tolerance == 0 else ("auto" if tolerance is None else tolerance),
+                "Load Seconds": round(load_seconds, 3),
+                "Setup Seconds": round(setup_seconds, 3),
+                "Seconds per Map": round(render_seconds / args.maps_per_mode, 3),
+                "KB per Map": round(total_bytes / args.maps_per_mode / 1024, 1)
+            }
+            log.info(", ".join(f"{k}: {v}" for k, v in result.items()))
+            results.append(result)
+
+    os.rmdir(output_dir)
+
+    if args.csv_output_path is not None:
+        with open(args.csv_output_path, "w") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0].keys()), lineterminator="\n")
+            writer.writeheader()
+            for result in results:
+                writer.writerow(result)
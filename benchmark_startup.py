@@ -0,0 +1,113 @@
+import argparse
+import csv
+import json
+import subprocess
+import sys
+
+from core_data_modules.logging import Logger
+
+log = Logger(__name__)
+
+DEFAULT_MODULES = ["automated_analysis", "generate_outputs"]
+
+# Modules which are slow to import and should only be imported once they are needed, not at startup.
+DEFERRED_MODULES = ["matplotlib", "geopandas", "mapclassify", "pandas", "mpl_toolkits", "shapely"]
+
+# Run in a fresh interpreter by `measure_startup_time`, with the module to import and the (possibly empty) path of the
+# configuration file to load as arguments. Prints the timings and the names of the modules imported by the end, as json.
+_MEASURE_STARTUP_SCRIPT = """
+import json
+import sys
+import time
+
+start_time = time.perf_counter()
+__import__(sys.argv[1])
+import_seconds = time.perf_counter() - start_time
+
+configuration_seconds = None
+if sys.argv[2] != "":
+    from src.lib import PipelineConfiguration
+    start_time = time.perf_counter()
+    with open(sys.argv[2]) as f:
+        PipelineConfiguration.from_configuration_file(f)
+    configuration_seconds = time.perf_counter() - start_time
+
+print(json.dumps({
+    "ImportSeconds": import_seconds,
+    "ConfigurationSeconds": configuration_seconds,
+    "ImportedModules": sorted(sys.modules.keys())
+}))
+"""
+
+
+def measure_startup_time(module, pipeline_configuration_file_path=None):
+    """
+    Imports the given module in a fresh interpreter, then optionally loads a pipeline configuration file, timing each
+    with `time.perf_counter`.
+
+    :param module: Name of the module to import.
+    :type module: str
+    :param pipeline_configuration_file_path: Path to a pipeline configuration file to time loading, or None.
+    :type pipeline_configuration_file_path: str | None
+    :return: Dictionary with keys "ImportSeconds", "ConfigurationSeconds" (None if no configuration file was given)
+             and "ImportedModules" (the names of all the modules which had been imported by the end of the run).
+    :rtype: dict
+    """
+    result = subprocess.run([sys.executable, "-c", _MEASURE_STARTUP_SCRIPT, module,
+                             pipeline_configuration_file_path or ""],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    assert result.returncode == 0, f"Failed to import {module}:\n{result.stderr}"
+
+    # The module may print when it is imported, so the timings are read from the last line of the output.
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the time taken to import the pipeline's entry-point "
+                                                 "scripts and to load a pipeline configuration, each in a fresh "
+                                                 "interpreter. "
+                                                 "This script must be run from its parent directory.")
+
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES,
+                        help="Modules to benchmark the imports of")
+    parser.add_argument("--repeats", type=int, default=5,
+                        help="Number of times to import each module. The fastest run is reported")
+    parser.add_argument("--pipeline-configuration-file-path", default=None,
+                        help="Path to a pipeline configuration json file to also time loading, after each module "
+                             "has been imported")
+    parser.add_argument("--csv-output-path", default=None,
+                        help="Path to write the benchmark results to as a CSV, in addition to the log")
+
+    args = parser.parse_args()
+
+    results = []
+    for module in args.modules:
+        runs = [measure_startup_time(module, args.pipeline_configuration_file_path) for _ in range(args.repeats)]
+        fastest = min(runs, key=lambda run: run["ImportSeconds"])
+        import_ms = fastest["ImportSeconds"] * 1000
+
+        log.info(f"Importing {module} took {import_ms:.1f}ms, and imported {len(fastest['ImportedModules'])} modules")
+
+        configuration_ms = None
+        if args.pipeline_configuration_file_path is not None:
+            configuration_ms = min(run["ConfigurationSeconds"] for run in runs) * 1000
+            log.info(f"Loading the pipeline configuration after importing {module} took {configuration_ms:.1f}ms")
+
+        eagerly_imported = [name for name in DEFERRED_MODULES if name in fastest["ImportedModules"]]
+        if len(eagerly_imported) > 0:
+            log.warning(f"{module} imports {', '.join(eagerly_imported)} at startup")
+
+        results.append({
+            "Module": module,
+            "Import ms": round(import_ms, 1),
+            "Configuration ms": "" if configuration_ms is None else round(configuration_ms, 1),
+            "Modules Imported": len(fastest["ImportedModules"]),
+            "Deferred Modules Imported": ";".join(eagerly_imported)
+        })
+
+    if args.csv_output_path is not None:
+        with open(args.csv_output_path, "w") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0].keys()), lineterminator="\n")
+            writer.writeheader()
+            for result in results:
+                writer.writerow(result)
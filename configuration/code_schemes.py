@@ -9,13 +9,34 @@ def _open_scheme(filename):
         return CodeScheme.from_firebase_map(firebase_map)
 
 
+class _LazyScheme(object):
+    def __init__(self, filename):
+        """
+        Class attribute which loads a code scheme the first time it is accessed, then replaces itself on the owning
+        class with the loaded scheme, so every later access returns the same CodeScheme object at no extra cost.
+
+        :param filename: Name of the code scheme file in the code_schemes directory.
+        :type filename: str
+        """
+        self.filename = filename
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        scheme = _open_scheme(self.filename)
+        setattr(owner, self.name, scheme)
+        return scheme
+
+
 class CodeSchemes(object):
-    S01E01 = _open_scheme("s01e01.json")
+    S01E01 = _LazyScheme("s01e01.json")
 
-    KENYA_CONSTITUENCY = _open_scheme("kenya_constituency.json")
-    KENYA_COUNTY = _open_scheme("kenya_county.json")
-    GENDER = _open_scheme("gender.json")
-    AGE = _open_scheme("age.json")
-    AGE_CATEGORY = _open_scheme("age_category.json")
+    KENYA_CONSTITUENCY = _LazyScheme("kenya_constituency.json")
+    KENYA_COUNTY = _LazyScheme("kenya_county.json")
+    GENDER = _LazyScheme("gender.json")
+    AGE = _LazyScheme("age.json")
+    AGE_CATEGORY = _LazyScheme("age_category.json")
 
-    WS_CORRECT_DATASET = _open_scheme("ws_correct_dataset.json")
+    WS_CORRECT_DATASET = _LazyScheme("ws_correct_dataset.json")
@@ -28,16 +28,16 @@ done
 if [[ $# -ne 5 ]]; then
     echo "Usage: ./docker-run-automated-analysis.sh
     [--profile-cpu <profile-output-path>]
-    <user> <pipeline-configuration-file-path> <messages-traced-data>
-    <individuals-traced-data> <automated-analysis-output-dir>"
+    <user> <pipeline-configuration-file-path> <messages-analysis-snapshot>
+    <individuals-analysis-snapshot> <automated-analysis-output-dir>"
     exit
 fi
 
 # Assign the program arguments to bash variables.
 USER=$1
 INPUT_PIPELINE_CONFIGURATION=$2
-INPUT_MESSAGES_TRACED_DATA=$3
-INPUT_INDIVIDUALS_TRACED_DATA=$4
+INPUT_MESSAGES_SNAPSHOT=$3
+INPUT_INDIVIDUALS_SNAPSHOT=$4
 AUTOMATED_ANALYSIS_OUTPUT_DIR=$5
 
 # Build an image for this pipeline stage.
@@ -53,7 +53,7 @@ if [[ "$PROFILE_MEMORY" = true ]]; then
 fi
 CMD="pipenv run $PROFILE_MEMORY_CMD python -u $PROFILE_CPU_CMD automated_analysis.py \
     \"$USER\" /data/pipeline_configuration.json \
-    /data/messages-traced-data.jsonl /data/individuals-traced-data.jsonl /data/automated-analysis-outputs
+    /data/messages-analysis-snapshot.jsonl /data/individuals-analysis-snapshot.jsonl /data/automated-analysis-outputs
 "
 container="$(docker container create ${SYS_PTRACE_CAPABILITY} -w /app "$IMAGE_NAME" /bin/bash -c "$CMD")"
 echo "Created container $container"
@@ -64,18 +64,27 @@ container_short_id=${container:0:7}
 echo "Copying $INPUT_PIPELINE_CONFIGURATION -> $container_short_id:/data/pipeline_configuration.json"
 docker cp "$INPUT_PIPELINE_CONFIGURATION" "$container:/data/pipeline_configuration.json"
 
-echo "Copying $INPUT_MESSAGES_TRACED_DATA -> $container_short_id:/data/messages-traced-data.jsonl"
-docker cp "$INPUT_MESSAGES_TRACED_DATA" "$container:/data/messages-traced-data.jsonl"
+echo "Copying $INPUT_MESSAGES_SNAPSHOT -> $container_short_id:/data/messages-analysis-snapshot.jsonl"
+docker cp "$INPUT_MESSAGES_SNAPSHOT" "$container:/data/messages-analysis-snapshot.jsonl"
 
-echo "Copying $INPUT_INDIVIDUALS_TRACED_DATA -> $container_short_id:/data/individuals-traced-data.jsonl"
-docker cp "$INPUT_INDIVIDUALS_TRACED_DATA" "$container:/data/individuals-traced-data.jsonl"
+echo "Copying $INPUT_INDIVIDUALS_SNAPSHOT -> $container_short_id:/data/individuals-analysis-snapshot.jsonl"
+docker cp "$INPUT_INDIVIDUALS_SNAPSHOT" "$container:/data/individuals-analysis-snapshot.jsonl"
+
+if [[ -f "$AUTOMATED_ANALYSIS_OUTPUT_DIR/manifest.json" ]]; then
+    echo "Copying the previous outputs $AUTOMATED_ANALYSIS_OUTPUT_DIR -> $container_short_id:/data/automated-analysis-outputs"
+    docker cp "$AUTOMATED_ANALYSIS_OUTPUT_DIR/." "$container:/data/automated-analysis-outputs"
+fi
 
 # Run the container
 echo "Starting container $container_short_id"
 docker start -a -i "$container"
 
-# Copy the output data back out of the container
+# Copy the output data back out of the container, replacing the previous outputs so that any outputs which were
+# removed by this run are removed from the output directory too
 echo "Copying $container_short_id:/data/automated-analysis-outputs/. -> $AUTOMATED_ANALYSIS_OUTPUT_DIR"
+if [[ -d "$AUTOMATED_ANALYSIS_OUTPUT_DIR" ]]; then
+    rm -r "$AUTOMATED_ANALYSIS_OUTPUT_DIR"
+fi
 mkdir -p "$AUTOMATED_ANALYSIS_OUTPUT_DIR"
 docker cp "$container:/data/automated-analysis-outputs/." "$AUTOMATED_ANALYSIS_OUTPUT_DIR"
 
@@ -25,12 +25,12 @@ done
 
 
 # Check that the correct number of arguments were provided.
-if [[ $# -ne 13 ]]; then
+if [[ $# -ne 15 ]]; then
     echo "Usage: ./docker-run-generate-outputs.sh
     [--profile-cpu <profile-output-path>] [--profile-memory <profile-output-path>]
     <user> <pipeline-run-mode> <pipeline-configuration-file-path>
-    <raw-data-dir> <prev-coded-dir> <messages-json-output-path> <individuals-json-output-path>
-    <icr-output-dir> <coded-output-dir> <messages-output-csv> <individuals-output-csv> <production-output-csv>"
+    <raw-data-dir> <prev-coded-dir> <auto-coding-json-output-path> <messages-json-output-path> <individuals-json-output-path>
+    <messages-snapshot-output-path> <individuals-snapshot-output-path> <icr-output-dir> <coded-output-dir> <messages-output-csv> <individuals-output-csv> <production-output-csv>"
     exit
 fi
 
@@ -43,11 +43,13 @@ PREV_CODED_DIR=$5
 OUTPUT_AUTO_CODING_TRACED_JSONL=$6
 OUTPUT_MESSAGES_JSONL=$7
 OUTPUT_INDIVIDUALS_JSONL=$8
-OUTPUT_ICR_DIR=$9
-OUTPUT_CODED_DIR=${10}
-OUTPUT_MESSAGES_CSV=${11}
-OUTPUT_INDIVIDUALS_CSV=${12}
-OUTPUT_PRODUCTION_CSV=${13}
+OUTPUT_MESSAGES_SNAPSHOT=$9
+OUTPUT_INDIVIDUALS_SNAPSHOT=${10}
+OUTPUT_ICR_DIR=${11}
+OUTPUT_CODED_DIR=${12}
+OUTPUT_MESSAGES_CSV=${13}
+OUTPUT_INDIVIDUALS_CSV=${14}
+OUTPUT_PRODUCTION_CSV=${15}
 
 # Build an image for this pipeline stage.
 docker build --build-arg INSTALL_MEMORY_PROFILER="$PROFILE_MEMORY" -t "$IMAGE_NAME" .
@@ -62,7 +64,8 @@ if [[ "$PROFILE_MEMORY" = true ]]; then
 fi
 CMD="pipenv run $PROFILE_MEMORY_CMD python -u $PROFILE_CPU_CMD generate_outputs.py \
     \"$USER\" \"$PIPELINE_RUN_MODE\" /data/pipeline_configuration.json /data/raw-data /data/prev-coded \
-     /data/auto-coding-traced-data.jsonl /data/output-messages.jsonl /data/output-individuals.jsonl /data/output-icr /data/coded \
+     /data/auto-coding-traced-data.jsonl /data/output-messages.jsonl /data/output-individuals.jsonl \
+     /data/output-messages-snapshot.jsonl /data/output-individuals-snapshot.jsonl /data/output-icr /data/coded \
     /data/output-messages.csv /data/output-individuals.csv /data/output-production.csv \
 "
 container="$(docker container create ${SYS_PTRACE_CAPABILITY} -w /app "$IMAGE_NAME" /bin/bash -c "$CMD")"
@@ -109,6 +112,14 @@ if [[ $PIPELINE_RUN_MODE = "all-stages" ]]; then
     mkdir -p "$(dirname "$OUTPUT_INDIVIDUALS_JSONL")"
     docker cp "$container:/data/output-individuals.jsonl" "$OUTPUT_INDIVIDUALS_JSONL"
 
+    echo "Copying $container_short_id:/data/output-messages-snapshot.jsonl -> $OUTPUT_MESSAGES_SNAPSHOT"
+    mkdir -p "$(dirname "$OUTPUT_MESSAGES_SNAPSHOT")"
+    docker cp "$container:/data/output-messages-snapshot.jsonl" "$OUTPUT_MESSAGES_SNAPSHOT"
+
+    echo "Copying $container_short_id:/data/output-individuals-snapshot.jsonl -> $OUTPUT_INDIVIDUALS_SNAPSHOT"
+    mkdir -p "$(dirname "$OUTPUT_INDIVIDUALS_SNAPSHOT")"
+    docker cp "$container:/data/output-individuals-snapshot.jsonl" "$OUTPUT_INDIVIDUALS_SNAPSHOT"
+
     echo "Copying $container_short_id:/data/output-messages.csv -> $OUTPUT_MESSAGES_CSV"
     mkdir -p "$(dirname "$OUTPUT_MESSAGES_CSV")"
     docker cp "$container:/data/output-messages.csv" "$OUTPUT_MESSAGES_CSV"
@@ -0,0 +1,101 @@
+#!/bin/bash
+
+set -e
+
+PROJECT_NAME="$(<configuration/docker_image_project_name.txt)"
+IMAGE_NAME=$PROJECT_NAME-pipeline-in-process
+
+while [[ $# -gt 0 ]]; do
+    case "$1" in
+        --profile-cpu)
+            PROFILE_CPU=true
+            CPU_PROFILE_OUTPUT_PATH="$2"
+            shift 2;;
+        --profile-memory)
+            PROFILE_MEMORY=true
+            MEMORY_PROFILE_OUTPUT_PATH="$2"
+            shift 2;;
+        --)
+            shift
+            break;;
+        *)
+            break;;
+    esac
+done
+
+# Check that the correct number of arguments were provided.
+if [[ $# -ne 5 ]]; then
+    echo "Usage: ./docker-run-pipeline-in-process.sh
+    [--profile-cpu <profile-output-path>] [--profile-memory <profile-output-path>]
+    <user> <pipeline-run-mode> <google-cloud-credentials-file-path> <pipeline-configuration-file-path> <data-root>"
+    echo "Runs the fetch, output generation and automated analysis stages in a single container and process"
+    exit
+fi
+
+# Assign the program arguments to bash variables.
+USER=$1
+PIPELINE_RUN_MODE=$2
+INPUT_GOOGLE_CLOUD_CREDENTIALS=$3
+INPUT_PIPELINE_CONFIGURATION=$4
+DATA_ROOT=$5
+
+# Build an image for the pipeline.
+docker build --build-arg INSTALL_MEMORY_PROFILER="$PROFILE_MEMORY" -t "$IMAGE_NAME" .
+
+# Create a container from the image that was just built.
+if [[ "$PROFILE_CPU" = true ]]; then
+    PROFILE_CPU_CMD="-m pyinstrument -o /data/cpu.prof --renderer html --"
+    SYS_PTRACE_CAPABILITY="--cap-add SYS_PTRACE"
+fi
+if [[ "$PROFILE_MEMORY" = true ]]; then
+    PROFILE_MEMORY_CMD="mprof run -o /data/memory.prof"
+fi
+CMD="pipenv run $PROFILE_MEMORY_CMD python -u $PROFILE_CPU_CMD run_pipeline_in_process.py \
+    \"$USER\" \"$PIPELINE_RUN_MODE\" /credentials/google-cloud-credentials.json \
+    /data/pipeline-configuration.json /data/data-root
+"
+container="$(docker container create ${SYS_PTRACE_CAPABILITY} -w /app "$IMAGE_NAME" /bin/bash -c "$CMD")"
+echo "Created container $container"
+container_short_id=${container:0:7}
+
+# Copy input data into the container
+echo "Copying $INPUT_GOOGLE_CLOUD_CREDENTIALS -> $container_short_id:/credentials/google-cloud-credentials.json"
+docker cp "$INPUT_GOOGLE_CLOUD_CREDENTIALS" "$container:/credentials/google-cloud-credentials.json"
+
+echo "Copying $INPUT_PIPELINE_CONFIGURATION -> $container_short_id:/data/pipeline-configuration.json"
+docker cp "$INPUT_PIPELINE_CONFIGURATION" "$container:/data/pipeline-configuration.json"
+
+mkdir -p "$DATA_ROOT/Raw Data" "$DATA_ROOT/Coded Coda Files" "$DATA_ROOT/Outputs/Automated Analysis"
+for DIR in "Raw Data" "Coded Coda Files" "Outputs/Automated Analysis"; do
+    echo "Copying $DATA_ROOT/$DIR/. -> $container_short_id:/data/data-root/$DIR/"
+    docker cp "$DATA_ROOT/$DIR/." "$container:/data/data-root/$DIR/"
+done
+
+# Run the container
+echo "Starting container $container_short_id"
+docker start -a -i "$container"
+
+# Copy the output data back out of the container, replacing the previous outputs so that any outputs which were
+# removed by this run are removed from the output directory too
+echo "Copying $container_short_id:/data/data-root/Raw Data/. -> $DATA_ROOT/Raw Data"
+docker cp "$container:/data/data-root/Raw Data/." "$DATA_ROOT/Raw Data"
+
+echo "Copying $container_short_id:/data/data-root/Outputs/. -> $DATA_ROOT/Outputs"
+rm -r "$DATA_ROOT/Outputs"
+mkdir -p "$DATA_ROOT/Outputs"
+docker cp "$container:/data/data-root/Outputs/." "$DATA_ROOT/Outputs"
+
+if [[ "$PROFILE_CPU" = true ]]; then
+    echo "Copying $container_short_id:/data/cpu.prof -> $CPU_PROFILE_OUTPUT_PATH"
+    mkdir -p "$(dirname "$CPU_PROFILE_OUTPUT_PATH")"
+    docker cp "$container:/data/cpu.prof" "$CPU_PROFILE_OUTPUT_PATH"
+fi
+
+if [[ "$PROFILE_MEMORY" = true ]]; then
+    echo "Copying $container_short_id:/data/memory.prof -> $MEMORY_PROFILE_OUTPUT_PATH"
+    mkdir -p "$(dirname "$MEMORY_PROFILE_OUTPUT_PATH")"
+    docker cp "$container:/data/memory.prof" "$MEMORY_PROFILE_OUTPUT_PATH"
+fi
+
+# Tear down the container, now that all expected output files have been copied out successfully
+docker container rm "$container" >/dev/null
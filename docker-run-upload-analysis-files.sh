@@ -62,5 +62,11 @@ fi
 echo "Starting container $container_short_id"
 docker start -a -i "$container"
 
+# Copy the updated analysis manifest back out, so the next run knows which outputs have already been uploaded
+if [[ $PIPELINE_RUN_MODE = "all-stages" ]]; then
+    echo "Copying $container_short_id:/data/automated-analysis/manifest.json -> $AUTOMATED_ANALYSIS_DIR/manifest.json"
+    docker cp "$container:/data/automated-analysis/manifest.json" "$AUTOMATED_ANALYSIS_DIR/manifest.json"
+fi
+
 # Tear down the container, now that all expected output files have been copied out successfully
 docker container rm "$container" >/dev/null
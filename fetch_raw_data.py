@@ -1,9 +1,10 @@
 import argparse
 import csv
+import io
 import json
 import os
+import tempfile
 from datetime import datetime
-from io import StringIO
 
 import pytz
 from core_data_modules.logging import Logger
@@ -13,13 +14,27 @@ from core_data_modules.util import IOUtils, TimeUtils, SHAUtils
 from id_infrastructure.firestore_uuid_table import FirestoreUuidTable
 from rapid_pro_tools.rapid_pro_client import RapidProClient
 from storage.google_cloud import google_cloud_utils
-from temba_client.v2 import Contact, Run
+from temba_client.v2 import Contact
 
 from src.lib import PipelineConfiguration
+from src.lib.blob_download_manager import BlobDownloadManager, GCloudBucket
+from src.lib.cached_uuid_table import CachedUuidTable
 from src.lib.pipeline_configuration import RapidProSource, GCloudBucketSource, RecoveryCSVSource
+from src.lib.incremental_run_converter import IncrementalRunConverter
+from src.lib.rapid_pro_flow_fetcher import RapidProFlowFetcher
+from src.lib.raw_record_store import RawRecordStore
+from src.lib.source_fetch_scheduler import SourceFetchScheduler
 
 log = Logger(__name__)
 
+# Maximum number of raw data sources to fetch from at once, in total and for each type of source.
+MAX_CONCURRENT_SOURCE_FETCHES = 4
+MAX_CONCURRENT_SOURCE_FETCHES_PER_TYPE = {
+    RapidProSource.__name__: 2,
+    GCloudBucketSource.__name__: 1,
+    RecoveryCSVSource.__name__: 2
+}
+
 
 def fetch_from_rapid_pro(user, google_cloud_credentials_file_path, raw_data_dir, phone_number_uuid_table,
                          rapid_pro_source):
@@ -31,81 +46,120 @@ def fetch_from_rapid_pro(user, google_cloud_credentials_file_path, raw_data_dir,
     rapid_pro = RapidProClient(rapid_pro_source.domain, rapid_pro_token)
 
     # Load the previous export of contacts if it exists, otherwise fetch all contacts from Rapid Pro.
-    raw_contacts_path = f"{raw_data_dir}/{rapid_pro_source.contacts_file_name}_raw.json"
+    raw_contacts_store = RawRecordStore(f"{raw_data_dir}/{rapid_pro_source.contacts_file_name}_raw", "uuid")
+    raw_contacts_store.import_json_file(f"{raw_data_dir}/{rapid_pro_source.contacts_file_name}_raw.json")
     contacts_log_path = f"{raw_data_dir}/{rapid_pro_source.contacts_file_name}_log.jsonl"
-    try:
-        log.info(f"Loading raw contacts from file '{raw_contacts_path}'...")
-        with open(raw_contacts_path) as raw_contacts_file:
-            raw_contacts = [Contact.deserialize(contact_json) for contact_json in json.load(raw_contacts_file)]
+    if raw_contacts_store.exists():
+        log.info(f"Loading raw contacts from '{raw_contacts_store.store_dir}'...")
+        raw_contacts = [Contact.deserialize(contact_json) for contact_json in raw_contacts_store.load()]
         log.info(f"Loaded {len(raw_contacts)} contacts")
-    except FileNotFoundError:
-        log.info(f"File '{raw_contacts_path}' not found, will fetch all contacts from the Rapid Pro server")
+    else:
+        log.info(f"No raw contacts found in '{raw_contacts_store.store_dir}', will fetch all contacts from the "
+                 f"Rapid Pro server")
         with open(contacts_log_path, "a") as contacts_log_file:
             raw_contacts = rapid_pro.get_raw_contacts(raw_export_log_file=contacts_log_file)
 
-    # Download all the runs for each of the radio shows
-    for flow in rapid_pro_source.activation_flow_names + rapid_pro_source.survey_flow_names:
-        runs_log_path = f"{raw_data_dir}/{flow}_log.jsonl"
-        raw_runs_path = f"{raw_data_dir}/{flow}_raw.json"
+    # Download all the runs for each of the radio shows.
+    # The runs for each flow are downloaded concurrently.
+    flows = rapid_pro_source.activation_flow_names + rapid_pro_source.survey_flow_names
+    flow_fetcher = RapidProFlowFetcher(rapid_pro_source.domain, rapid_pro_token,
+                                       max_concurrent_fetches=rapid_pro_source.max_concurrent_flow_fetches)
+    raw_runs_by_flow = flow_fetcher.fetch_flows(flows, raw_data_dir)
+
+    # Fetch the latest contacts from Rapid Pro once, now that all the runs have been downloaded, so that the contacts
+    # of all the runs are available.
+    with open(contacts_log_path, "a") as raw_contacts_log_file:
+        raw_contacts = rapid_pro.update_raw_contacts_with_latest_modified(raw_contacts,
+                                                                          raw_export_log_file=raw_contacts_log_file)
+    raw_contacts_store.put_changed(contact.serialize() for contact in raw_contacts)
+    contacts_index = {contact.uuid: contact for contact in raw_contacts}
+    log.info(f"Indexed {len(contacts_index)} contacts")
+
+    # Convert and save the runs for each flow, one flow at a time in configuration order.
+    # Only the runs which are new or were modified since the previous export are converted.
+    run_converter = IncrementalRunConverter(rapid_pro, phone_number_uuid_table, rapid_pro_source.test_contact_uuids)
+    for flow, raw_runs in raw_runs_by_flow.items():
         traced_runs_output_path = f"{raw_data_dir}/{flow}.jsonl"
         log.info(f"Exporting flow '{flow}' to '{traced_runs_output_path}'...")
+        traced_runs_count = run_converter.convert_and_export(user, raw_runs, contacts_index, traced_runs_output_path)
+        log.info(f"Saved {traced_runs_count} traced runs")
+
+    raw_contacts_store.wait_for_compaction()
+
 
-        flow_id = rapid_pro.get_flow_id(flow)
-
-        # Load the previous export of runs for this flow, and update them with the newest runs.
-        # If there is no previous export for this flow, fetch all the runs from Rapid Pro.
-        with open(runs_log_path, "a") as raw_runs_log_file:
-            try:
-                log.info(f"Loading raw runs from file '{raw_runs_path}'...")
-                with open(raw_runs_path) as raw_runs_file:
-                    raw_runs = [Run.deserialize(run_json) for run_json in json.load(raw_runs_file)]
-                log.info(f"Loaded {len(raw_runs)} runs")
-                raw_runs = rapid_pro.update_raw_runs_with_latest_modified(
-                    flow_id, raw_runs, raw_export_log_file=raw_runs_log_file, ignore_archives=True)
-            except FileNotFoundError:
-                log.info(f"File '{raw_runs_path}' not found, will fetch all runs from the Rapid Pro server for flow '{flow}'")
-                raw_runs = rapid_pro.get_raw_runs_for_flow_id(flow_id, raw_export_log_file=raw_runs_log_file)
-
-        # Fetch the latest contacts from Rapid Pro.
-        with open(contacts_log_path, "a") as raw_contacts_log_file:
-            raw_contacts = rapid_pro.update_raw_contacts_with_latest_modified(raw_contacts,
-                                                                              raw_export_log_file=raw_contacts_log_file)
-
-        # Convert the runs to TracedData.
-        traced_runs = rapid_pro.convert_runs_to_traced_data(
-            user, raw_runs, raw_contacts, phone_number_uuid_table, rapid_pro_source.test_contact_uuids)
-
-        log.info(f"Saving {len(raw_runs)} raw runs to {raw_runs_path}...")
-        with open(raw_runs_path, "w") as raw_runs_file:
-            json.dump([run.serialize() for run in raw_runs], raw_runs_file)
-        log.info(f"Saved {len(raw_runs)} raw runs")
-
-        log.info(f"Saving {len(traced_runs)} traced runs to {traced_runs_output_path}...")
-        IOUtils.ensure_dirs_exist_for_file(traced_runs_output_path)
-        with open(traced_runs_output_path, "w") as traced_runs_output_file:
-            TracedDataJsonIO.export_traced_data_iterable_to_jsonl(traced_runs, traced_runs_output_file)
-        log.info(f"Saved {len(traced_runs)} traced runs")
-
-    log.info(f"Saving {len(raw_contacts)} raw contacts to file '{raw_contacts_path}'...")
-    with open(raw_contacts_path, "w") as raw_contacts_file:
-        json.dump([contact.serialize() for contact in raw_contacts], raw_contacts_file)
-    log.info(f"Saved {len(raw_contacts)} contacts")
-    
-    
 def fetch_from_gcloud_bucket(google_cloud_credentials_file_path, raw_data_dir, gcloud_source):
     log.info("Fetching data from a gcloud bucket...")
+    # Download only the blobs which are new or have changed since they were last downloaded, concurrently.
+    blob_urls_to_output_paths = dict()
     for blob_url in gcloud_source.activation_flow_urls + gcloud_source.survey_flow_urls:
         flow = blob_url.split("/")[-1]
-
-        traced_runs_output_path = f"{raw_data_dir}/{flow}"
-        if os.path.exists(traced_runs_output_path):
-            log.info(f"File '{traced_runs_output_path}' for flow '{flow}' already exists; skipping download")
-            continue
-        
-        log.info(f"Saving '{flow}' to file '{traced_runs_output_path}'...")
-        with open(traced_runs_output_path, "wb") as traced_runs_output_file:
-            google_cloud_utils.download_blob_to_file(
-                google_cloud_credentials_file_path, blob_url, traced_runs_output_file)
+        blob_urls_to_output_paths[blob_url] = f"{raw_data_dir}/{flow}"
+
+    os.makedirs(raw_data_dir, exist_ok=True)
+    download_manager = BlobDownloadManager(GCloudBucket(google_cloud_credentials_file_path))
+    download_manager.download_changed(blob_urls_to_output_paths)
+
+
+def parse_recovery_csv_date(raw_date, timezone):
+    """
+    Parses a date in a recovery CSV, which is in the format "dd/mm/YYYY HH:MM" or "dd/mm/YYYY HH:MM:SS".
+
+    Zero-padded dates have their fields sliced out at fixed positions, which is much faster than `datetime.strptime`
+    on large CSVs. Dates which aren't zero-padded (e.g. "1/2/2020 3:04") fall back to `datetime.strptime`.
+
+    :param raw_date: Date to parse.
+    :type raw_date: str
+    :param timezone: Timezone the date was recorded in.
+    :type timezone: datetime.tzinfo
+    :return: The parsed date, localized to `timezone`.
+    :rtype: datetime.datetime
+    """
+    if len(raw_date) in {len("dd/mm/YYYY HH:MM"), len("dd/mm/YYYY HH:MM:SS")} and \
+            raw_date[2] == "/" and raw_date[5] == "/" and raw_date[10] == " " and raw_date[13] == ":" and \
+            (len(raw_date) == len("dd/mm/YYYY HH:MM") or raw_date[16] == ":"):
+        parsed_raw_date = datetime(
+            int(raw_date[6:10]), int(raw_date[3:5]), int(raw_date[0:2]),
+            int(raw_date[11:13]), int(raw_date[14:16]), int(raw_date[17:19]) if len(raw_date) > 16 else 0
+        )
+    else:
+        try:
+            parsed_raw_date = datetime.strptime(raw_date, "%d/%m/%Y %H:%M")
+        except ValueError:
+            parsed_raw_date = datetime.strptime(raw_date, "%d/%m/%Y %H:%M:%S")
+
+    return timezone.localize(parsed_raw_date)
+
+
+def convert_recovery_csv_to_traced_data(user, csv_file, blob_url):
+    """
+    Lazily converts the rows of a recovery CSV to TracedData, one row at a time.
+
+    :param user: Identifier of the user running this program, for TracedData Metadata.
+    :type user: str
+    :param csv_file: Recovery CSV to convert.
+    :type csv_file: file-like
+    :param blob_url: GS URL the recovery CSV was downloaded from, for error messages.
+    :type blob_url: str
+    :return: Generator of the converted TracedData.
+    :rtype: generator of TracedData
+    """
+    timezone = pytz.timezone("Africa/Mogadishu")
+    call_location = Metadata.get_call_location()
+    timestamp = TimeUtils.utc_now_as_iso_string()
+
+    for row in csv.DictReader(csv_file):
+        assert row["Sender"].startswith("avf-phone-uuid-"), \
+            f"The 'Sender' column for '{blob_url} contains an item that has not been de-identified " \
+            f"into Africa's Voices Foundation's de-identification format. This may be done with de_identify_csv.py."
+
+        d = {
+            "avf_phone_id": row["Sender"],
+            "message": row["Message"],
+            "received_on": parse_recovery_csv_date(row["ReceivedOn"], timezone).isoformat(),
+            "run_id": SHAUtils.sha_dict(row)
+        }
+
+        yield TracedData(d, Metadata(user, call_location, timestamp))
 
 
 def fetch_from_recovery_csv(user, google_cloud_credentials_file_path, raw_data_dir, phone_number_uuid_table,
@@ -118,53 +172,26 @@ def fetch_from_recovery_csv(user, google_cloud_credentials_file_path, raw_data_d
             log.info(f"File '{traced_runs_output_path}' for blob '{blob_url}' already exists; skipping download")
             continue
 
+        # Stream the recovered data to a temporary file, then convert and export it one row at a time, so that memory
+        # use doesn't grow with the size of the CSV.
         log.info(f"Downloading recovered data from '{blob_url}'...")
-        raw_csv_string = StringIO(google_cloud_utils.download_blob_to_string(
-            google_cloud_credentials_file_path, blob_url))
-        raw_data = list(csv.DictReader(raw_csv_string))
-        log.info(f"Downloaded {len(raw_data)} recovered messages")
-
-        log.info("Converting the recovered messages to TracedData...")
-        traced_runs = []
-        for i, row in enumerate(raw_data):
-            raw_date = row["ReceivedOn"]
-            if len(raw_date) == len("dd/mm/YYYY HH:MM"):
-                parsed_raw_date = datetime.strptime(raw_date, "%d/%m/%Y %H:%M")
-            else:
-                parsed_raw_date = datetime.strptime(raw_date, "%d/%m/%Y %H:%M:%S")
-            localized_date = pytz.timezone("Africa/Mogadishu").localize(parsed_raw_date)
-
-            assert row["Sender"].startswith("avf-phone-uuid-"), \
-                f"The 'Sender' column for '{blob_url} contains an item that has not been de-identified " \
-                f"into Africa's Voices Foundation's de-identification format. This may be done with de_identify_csv.py."
-
-            d = {
-                "avf_phone_id": row["Sender"],
-                "message": row["Message"],
-                "received_on": localized_date.isoformat(),
-                "run_id": SHAUtils.sha_dict(row)
-            }
-
-            traced_runs.append(
-                TracedData(d, Metadata(user, Metadata.get_call_location(), TimeUtils.utc_now_as_iso_string()))
-            )
-        log.info("Converted the recovered messages to TracedData")
-
-        log.info(f"Exporting {len(traced_runs)} TracedData items to {traced_runs_output_path}...")
-        IOUtils.ensure_dirs_exist_for_file(traced_runs_output_path)
-        with open(traced_runs_output_path, "w") as f:
-            TracedDataJsonIO.export_traced_data_iterable_to_jsonl(traced_runs, f)
+        with tempfile.TemporaryFile() as raw_csv_file:
+            google_cloud_utils.download_blob_to_file(google_cloud_credentials_file_path, blob_url, raw_csv_file)
+            raw_csv_file.seek(0)
+
+            log.info(f"Converting the recovered messages to TracedData and exporting to {traced_runs_output_path}...")
+            IOUtils.ensure_dirs_exist_for_file(traced_runs_output_path)
+            # Export to a temporary file first, so that a partial export isn't skipped by the next fetch.
+            temp_output_path = f"{traced_runs_output_path}.tmp"
+            with io.TextIOWrapper(raw_csv_file, encoding="utf-8", newline="") as raw_csv_text, \
+                    open(temp_output_path, "w") as f:
+                TracedDataJsonIO.export_traced_data_iterable_to_jsonl(
+                    convert_recovery_csv_to_traced_data(user, raw_csv_text, blob_url), f)
+            os.replace(temp_output_path, traced_runs_output_path)
         log.info(f"Exported TracedData")
 
 
-def main(user, google_cloud_credentials_file_path, pipeline_configuration_file_path, raw_data_dir):
-    # Read the settings from the configuration file
-    log.info("Loading Pipeline Configuration File...")
-    with open(pipeline_configuration_file_path) as f:
-        pipeline_configuration = PipelineConfiguration.from_configuration_file(f)
-    Logger.set_project_name(pipeline_configuration.pipeline_name)
-    log.debug(f"Pipeline name is {pipeline_configuration.pipeline_name}")
-
+def main(user, google_cloud_credentials_file_path, pipeline_configuration, raw_data_dir):
     log.info("Downloading Firestore UUID Table credentials...")
     firestore_uuid_table_credentials = json.loads(google_cloud_utils.download_blob_to_string(
         google_cloud_credentials_file_path,
@@ -178,20 +205,45 @@ def main(user, google_cloud_credentials_file_path, pipeline_configuration_file_p
     )
     log.info("Initialised the Firestore UUID table")
 
+    # Check a local, encrypted cache of the phone number <-> uuid mappings before making any remote lookups, so that
+    # re-fetching the contacts seen on previous runs doesn't need to look them up in Firestore again.
+    if pipeline_configuration.phone_number_uuid_table.cache_encryption_key_file_url is not None:
+        log.info("Downloading the phone number uuid cache encryption key...")
+        cache_encryption_key = google_cloud_utils.download_blob_to_string(
+            google_cloud_credentials_file_path,
+            pipeline_configuration.phone_number_uuid_table.cache_encryption_key_file_url
+        ).strip()
+        phone_number_uuid_table = CachedUuidTable(
+            phone_number_uuid_table, f"{raw_data_dir}/phone_number_uuid_cache.enc", cache_encryption_key)
+
+    # Fetch from the sources concurrently, since they are independent of each other.
     log.info(f"Fetching data from {len(pipeline_configuration.raw_data_sources)} sources...")
+    # Sources aren't retried as a whole, since the Rapid Pro sources already retry each flow which fails.
+    scheduler = SourceFetchScheduler(MAX_CONCURRENT_SOURCE_FETCHES, MAX_CONCURRENT_SOURCE_FETCHES_PER_TYPE)
     for i, raw_data_source in enumerate(pipeline_configuration.raw_data_sources):
-        log.info(f"Fetching from source {i + 1}/{len(pipeline_configuration.raw_data_sources)}...")
+        source_type = type(raw_data_source).__name__
+        source_name = f"source {i + 1}/{len(pipeline_configuration.raw_data_sources)} ({source_type})"
         if isinstance(raw_data_source, RapidProSource):
-            fetch_from_rapid_pro(user, google_cloud_credentials_file_path, raw_data_dir, phone_number_uuid_table,
-                                 raw_data_source)
+            scheduler.add_fetch(source_name, source_type, fetch_from_rapid_pro, user,
+                                google_cloud_credentials_file_path, raw_data_dir, phone_number_uuid_table,
+                                raw_data_source)
         elif isinstance(raw_data_source, GCloudBucketSource):
-            fetch_from_gcloud_bucket(google_cloud_credentials_file_path, raw_data_dir, raw_data_source)
+            scheduler.add_fetch(source_name, source_type, fetch_from_gcloud_bucket,
+                                google_cloud_credentials_file_path, raw_data_dir, raw_data_source)
         elif isinstance(raw_data_source, RecoveryCSVSource):
-            fetch_from_recovery_csv(user, google_cloud_credentials_file_path, raw_data_dir, phone_number_uuid_table,
-                                    raw_data_source)
-
+            scheduler.add_fetch(source_name, source_type, fetch_from_recovery_csv, user,
+                                google_cloud_credentials_file_path, raw_data_dir, phone_number_uuid_table,
+                                raw_data_source)
         else:
             assert False, f"Unknown raw_data_source type {type(raw_data_source)}"
+    try:
+        scheduler.run_all()
+    finally:
+        # Save the mappings looked up by the sources which did succeed, even if another source failed, so that the
+        # next run doesn't need to look them up in Firestore again.
+        if isinstance(phone_number_uuid_table, CachedUuidTable):
+            log.info(f"Made {phone_number_uuid_table.remote_lookups} batch lookups in the Firestore UUID table")
+            phone_number_uuid_table.save()
 
 
 if __name__ == "__main__":
@@ -209,4 +261,11 @@ if __name__ == "__main__":
 
     args = parser.parse_args()
 
-    main(args.user, args.google_cloud_credentials_file_path, args.pipeline_configuration_file_path, args.raw_data_dir)
+    # Read the settings from the configuration file
+    log.info("Loading Pipeline Configuration File...")
+    with open(args.pipeline_configuration_file_path) as f:
+        pipeline_configuration = PipelineConfiguration.from_configuration_file(f)
+    Logger.set_project_name(pipeline_configuration.pipeline_name)
+    log.debug(f"Pipeline name is {pipeline_configuration.pipeline_name}")
+
+    main(args.user, args.google_cloud_credentials_file_path, pipeline_configuration, args.raw_data_dir)
@@ -5,11 +5,106 @@ from core_data_modules.traced_data.io import TracedDataJsonIO
 from core_data_modules.util import IOUtils
 
 from src import LoadData, TranslateRapidProKeys, AutoCode, ProductionFile, \
-    ApplyManualCodes, AnalysisFile, WSCorrection
-from src.lib import PipelineConfiguration, MessageFilters
+    ApplyManualCodes, AnalysisFile, AnalysisSnapshot, WSCorrection
+from src.lib import PipelineConfiguration, MessageFilters, ConcurrentOutputWriter
 
 log = Logger(__name__)
 
+CONSENT_WITHDRAWN_KEY = "consent_withdrawn"
+
+
+def export_traced_data_to_jsonl(data, output_path):
+    IOUtils.ensure_dirs_exist_for_file(output_path)
+    with open(output_path, "w") as f:
+        TracedDataJsonIO.export_traced_data_iterable_to_jsonl(data, f)
+
+
+def main(user, pipeline_run_mode, pipeline_configuration, raw_data_dir, prev_coded_dir_path,
+         auto_coding_json_output_path, messages_json_output_path, individuals_json_output_path,
+         messages_snapshot_output_path, individuals_snapshot_output_path, icr_output_dir, coded_dir_path,
+         csv_by_message_output_path, csv_by_individual_output_path, production_csv_output_path,
+         wait_for_outputs=True):
+    """
+    Runs the post-fetch phase of the pipeline. See the argument parser below for descriptions of the parameters.
+
+    :param pipeline_configuration: Configuration of the pipeline being run.
+    :type pipeline_configuration: PipelineConfiguration
+    :param wait_for_outputs: Whether to wait for the analysis outputs to be written before returning. If False, they
+                             are left to be written in the background, and the caller must call `wait` on the returned
+                             `ConcurrentOutputWriter` once it is done.
+    :type wait_for_outputs: bool
+    :return: If `pipeline_run_mode` is "all-stages", the messages TracedData, the individuals TracedData, and the
+             writer of the outputs still being written in the background, or None if `wait_for_outputs` is True.
+             Otherwise, None.
+    :rtype: (list of TracedData, list of TracedData, ConcurrentOutputWriter | None) | None
+    """
+    log.info("Loading the raw data...")
+    data = LoadData.load_raw_data(user, raw_data_dir, pipeline_configuration)
+
+    log.info("Translating Rapid Pro Keys...")
+    data = TranslateRapidProKeys.translate_rapid_pro_keys(user, data, pipeline_configuration)
+
+    if pipeline_configuration.move_ws_messages:
+        log.info("Pre-filtering empty message objects...")
+        # This is a performance optimisation to save execution time + memory when moving WS messages, by removing
+        # the need to mark and process a high volume of empty message objects as 'NR' in WS correction.
+        # Empty message objects represent flow runs where the participants never sent a message e.g. from an advert
+        # flow run where we asked someone a question but didn't receive a response.
+        data = MessageFilters.filter_empty_messages(data,
+                                                    [plan.raw_field for plan in PipelineConfiguration.RQA_CODING_PLANS])
+
+        log.info("Moving WS messages...")
+        data = WSCorrection.move_wrong_scheme_messages(user, data, prev_coded_dir_path)
+    else:
+        log.info("Not moving WS messages (because the 'MoveWSMessages' key in the pipeline configuration "
+                 "json was set to 'false')")
+
+    log.info("Auto Coding...")
+    data = AutoCode.auto_code(user, data, pipeline_configuration, icr_output_dir, coded_dir_path)
+
+    log.info("Exporting production CSV...")
+    data = ProductionFile.generate(data, production_csv_output_path)
+
+    if pipeline_run_mode == "all-stages":
+        log.info("Running post labelling pipeline stages...")
+
+        log.info("Applying Manual Codes from Coda...")
+        data = ApplyManualCodes.apply_manual_codes(user, data, prev_coded_dir_path)
+
+        log.info("Generating CSVs for Analysis...")
+        # The analysis CSVs and the TracedData JSONL files are independent once the data has been folded, so write
+        # them all concurrently from the same in-memory snapshot.
+        output_writer = ConcurrentOutputWriter()
+        messages_data, individuals_data = AnalysisFile.generate(user, data, csv_by_message_output_path,
+                                                                csv_by_individual_output_path, output_writer)
+
+        output_writer.add_job("the messages TracedData", export_traced_data_to_jsonl,
+                              messages_data, messages_json_output_path)
+        output_writer.add_job("the individuals TracedData", export_traced_data_to_jsonl,
+                              individuals_data, individuals_json_output_path)
+        output_writer.add_job("the messages analysis snapshot", AnalysisSnapshot.export_to_jsonl,
+                              messages_data, messages_snapshot_output_path, CONSENT_WITHDRAWN_KEY)
+        output_writer.add_job("the individuals analysis snapshot", AnalysisSnapshot.export_to_jsonl,
+                              individuals_data, individuals_snapshot_output_path, CONSENT_WITHDRAWN_KEY)
+
+        log.info("Writing the analysis CSVs, TracedData and analysis snapshots to file...")
+        if wait_for_outputs:
+            output_writer.run()
+            return messages_data, individuals_data, None
+
+        # Leave the outputs to be written in the background, so the caller can carry on with the data in memory.
+        output_writer.start()
+        return messages_data, individuals_data, output_writer
+    else:
+        assert pipeline_run_mode == "auto-code-only", "pipeline run mode must be either auto-code-only or all-stages"
+        log.info("Writing Auto-Coding TracedData to file...")
+        IOUtils.ensure_dirs_exist_for_file(auto_coding_json_output_path)
+        with open(auto_coding_json_output_path, "w") as f:
+            TracedDataJsonIO.export_traced_data_iterable_to_jsonl(data, f)
+
+        return None
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Runs the post-fetch phase of the pipeline")
 
@@ -31,6 +126,12 @@ if __name__ == "__main__":
                         help="Path to a JSONL file to write the TracedData associated with the messages analysis file")
     parser.add_argument("individuals_json_output_path", metavar="individuals-json-output-path",
                         help="Path to a JSONL file to write the TracedData associated with the individuals analysis file")
+    parser.add_argument("messages_snapshot_output_path", metavar="messages-snapshot-output-path",
+                        help="Path to a JSONL file to write a flat snapshot of the messages data needed by automated "
+                             "analysis to")
+    parser.add_argument("individuals_snapshot_output_path", metavar="individuals-snapshot-output-path",
+                        help="Path to a JSONL file to write a flat snapshot of the individuals data needed by "
+                             "automated analysis to")
     parser.add_argument("icr_output_dir", metavar="icr-output-dir",
                         help="Directory to write CSV files to, each containing 200 messages and message ids for use " 
                              "in inter-code reliability evaluation"),
@@ -57,6 +158,8 @@ if __name__ == "__main__":
     auto_coding_json_output_path = args.auto_coding_json_output_path
     messages_json_output_path = args.messages_json_output_path
     individuals_json_output_path = args.individuals_json_output_path
+    messages_snapshot_output_path = args.messages_snapshot_output_path
+    individuals_snapshot_output_path = args.individuals_snapshot_output_path
     icr_output_dir = args.icr_output_dir
     coded_dir_path = args.coded_dir_path
     csv_by_message_output_path = args.csv_by_message_output_path
@@ -70,57 +173,9 @@ if __name__ == "__main__":
     Logger.set_project_name(pipeline_configuration.pipeline_name)
     log.debug(f"Pipeline name is {pipeline_configuration.pipeline_name}")
 
-    log.info("Loading the raw data...")
-    data = LoadData.load_raw_data(user, raw_data_dir, pipeline_configuration)
-
-    log.info("Translating Rapid Pro Keys...")
-    data = TranslateRapidProKeys.translate_rapid_pro_keys(user, data, pipeline_configuration)
-
-    if pipeline_configuration.move_ws_messages:
-        log.info("Pre-filtering empty message objects...")
-        # This is a performance optimisation to save execution time + memory when moving WS messages, by removing
-        # the need to mark and process a high volume of empty message objects as 'NR' in WS correction.
-        # Empty message objects represent flow runs where the participants never sent a message e.g. from an advert
-        # flow run where we asked someone a question but didn't receive a response.
-        data = MessageFilters.filter_empty_messages(data,
-                                                    [plan.raw_field for plan in PipelineConfiguration.RQA_CODING_PLANS])
-
-        log.info("Moving WS messages...")
-        data = WSCorrection.move_wrong_scheme_messages(user, data, prev_coded_dir_path)
-    else:
-        log.info("Not moving WS messages (because the 'MoveWSMessages' key in the pipeline configuration "
-                 "json was set to 'false')")
-
-    log.info("Auto Coding...")
-    data = AutoCode.auto_code(user, data, pipeline_configuration, icr_output_dir, coded_dir_path)
-
-    log.info("Exporting production CSV...")
-    data = ProductionFile.generate(data, production_csv_output_path)
-
-    if pipeline_run_mode == "all-stages":
-        log.info("Running post labelling pipeline stages...")
-
-        log.info("Applying Manual Codes from Coda...")
-        data = ApplyManualCodes.apply_manual_codes(user, data, prev_coded_dir_path)
-
-        log.info("Generating CSVs for Analysis...")
-        messages_data, individuals_data = AnalysisFile.generate(user, data, csv_by_message_output_path,
-                                                                csv_by_individual_output_path)
-
-        log.info("Writing messages TracedData to file...")
-        IOUtils.ensure_dirs_exist_for_file(messages_json_output_path)
-        with open(messages_json_output_path, "w") as f:
-            TracedDataJsonIO.export_traced_data_iterable_to_jsonl(messages_data, f)
-
-        log.info("Writing individuals TracedData to file...")
-        IOUtils.ensure_dirs_exist_for_file(individuals_json_output_path)
-        with open(individuals_json_output_path, "w") as f:
-            TracedDataJsonIO.export_traced_data_iterable_to_jsonl(individuals_data, f)
-    else:
-        assert pipeline_run_mode == "auto-code-only", "pipeline run mode must be either auto-code-only or all-stages"
-        log.info("Writing Auto-Coding TracedData to file...")
-        IOUtils.ensure_dirs_exist_for_file(auto_coding_json_output_path)
-        with open(auto_coding_json_output_path, "w") as f:
-            TracedDataJsonIO.export_traced_data_iterable_to_jsonl(data, f)
+    main(user, pipeline_run_mode, pipeline_configuration, raw_data_dir, prev_coded_dir_path,
+         auto_coding_json_output_path, messages_json_output_path, individuals_json_output_path,
+         messages_snapshot_output_path, individuals_snapshot_output_path, icr_output_dir, coded_dir_path,
+         csv_by_message_output_path, csv_by_individual_output_path, production_csv_output_path)
 
     log.info("Python script complete")
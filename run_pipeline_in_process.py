@@ -0,0 +1,118 @@
+import argparse
+import os
+import shutil
+import time
+
+from core_data_modules.logging import Logger
+
+import automated_analysis
+import fetch_raw_data
+import generate_outputs
+from src import AnalysisSnapshot
+from src.lib import PipelineConfiguration
+
+log = Logger(__name__)
+
+
+def clear_outputs_dir(outputs_dir):
+    """
+    Deletes the previous run's outputs, except for the automated analysis outputs, which automated analysis only
+    re-writes where their inputs have changed.
+
+    :param outputs_dir: Directory containing the previous run's outputs.
+    :type outputs_dir: str
+    """
+    os.makedirs(outputs_dir, exist_ok=True)
+    for name in os.listdir(outputs_dir):
+        if name == "Automated Analysis":
+            continue
+        path = os.path.join(outputs_dir, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the fetch, output generation and automated analysis stages of "
+                                                 "the pipeline in a single process. Data is passed between the stages "
+                                                 "in memory, and the intermediate files that the separate stages "
+                                                 "would exchange are written in the background for auditing. "
+                                                 "This script must be run from its parent directory.")
+
+    parser.add_argument("--regenerate-all", action="store_true",
+                        help="Re-write every automated analysis output, even if the analysis manifest shows its "
+                             "inputs haven't changed")
+
+    parser.add_argument("user", help="Identifier of the user launching this program")
+    parser.add_argument("pipeline_run_mode", metavar="pipeline-run-mode", choices=["all-stages", "auto-code-only"],
+                        help="Whether to run automated analysis, or to stop after auto-coding")
+    parser.add_argument("google_cloud_credentials_file_path", metavar="google-cloud-credentials-file-path",
+                        help="Path to a Google Cloud service account credentials file to use to access the "
+                             "credentials bucket")
+    parser.add_argument("pipeline_configuration_file_path", metavar="pipeline-configuration-file",
+                        help="Path to the pipeline configuration json file")
+    parser.add_argument("data_root", metavar="data-root",
+                        help="Path to the pipeline's data directory, laid out as by the scripts in run_scripts/")
+
+    args = parser.parse_args()
+
+    user = args.user
+    pipeline_run_mode = args.pipeline_run_mode
+    data_root = args.data_root
+
+    raw_data_dir = f"{data_root}/Raw Data"
+    outputs_dir = f"{data_root}/Outputs"
+
+    # Load the configuration once for all the stages. The coding plans and code schemes it loads are shared by
+    # every stage.
+    log.info("Loading Pipeline Configuration File...")
+    with open(args.pipeline_configuration_file_path) as f:
+        pipeline_configuration = PipelineConfiguration.from_configuration_file(f)
+    Logger.set_project_name(pipeline_configuration.pipeline_name)
+    log.debug(f"Pipeline name is {pipeline_configuration.pipeline_name}")
+
+    stage_durations = dict()  # of stage name -> seconds
+
+    log.info("Fetching the raw data...")
+    start_time = time.time()
+    fetch_raw_data.main(user, args.google_cloud_credentials_file_path, pipeline_configuration, raw_data_dir)
+    stage_durations["fetch_raw_data"] = time.time() - start_time
+
+    log.info("Generating the outputs...")
+    start_time = time.time()
+    clear_outputs_dir(outputs_dir)
+    generated_data = generate_outputs.main(
+        user, pipeline_run_mode, pipeline_configuration, raw_data_dir, f"{data_root}/Coded Coda Files/",
+        f"{outputs_dir}/auto_coding_traced_data.jsonl",
+        f"{outputs_dir}/messages_traced_data.jsonl", f"{outputs_dir}/individuals_traced_data.jsonl",
+        f"{outputs_dir}/messages_analysis_snapshot.jsonl", f"{outputs_dir}/individuals_analysis_snapshot.jsonl",
+        f"{outputs_dir}/ICR/", f"{outputs_dir}/Coda Files/",
+        f"{outputs_dir}/messages.csv", f"{outputs_dir}/individuals.csv", f"{outputs_dir}/production.csv",
+        wait_for_outputs=False
+    )
+    stage_durations["generate_outputs"] = time.time() - start_time
+
+    if pipeline_run_mode == "all-stages":
+        messages_data, individuals_data, output_writer = generated_data
+
+        # Run automated analysis on the in-memory data, while the TracedData, analysis snapshots and analysis CSVs
+        # are still being written in the background.
+        log.info("Running automated analysis...")
+        start_time = time.time()
+        messages = AnalysisSnapshot.take_snapshot(messages_data, generate_outputs.CONSENT_WITHDRAWN_KEY)
+        individuals = AnalysisSnapshot.take_snapshot(individuals_data, generate_outputs.CONSENT_WITHDRAWN_KEY)
+        automated_analysis.main(user, pipeline_configuration, messages, individuals,
+                                f"{outputs_dir}/Automated Analysis", args.regenerate_all)
+        stage_durations["automated_analysis"] = time.time() - start_time
+
+        log.info("Waiting for the generated outputs to finish writing...")
+        start_time = time.time()
+        output_writer.wait()
+        stage_durations["wait_for_generated_outputs"] = time.time() - start_time
+
+    log.info("Stage durations:")
+    for stage_name, duration_seconds in stage_durations.items():
+        log.info(f"    {stage_name}: {duration_seconds:.1f}s")
+
+    log.info("Python script complete")
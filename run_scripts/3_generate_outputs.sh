@@ -32,18 +32,16 @@ PIPELINE_RUN_MODE=$2
 PIPELINE_CONFIGURATION_FILE_PATH=$3
 DATA_ROOT=$4
 
-if [ -d "$DATA_ROOT/Outputs" ]
-then
-    rm -r "$DATA_ROOT/Outputs"
-fi
-
-mkdir -p "$DATA_ROOT/Outputs"
+# Keep the previous automated analysis outputs and their manifest, so that automated analysis and the upload stage
+# can skip the outputs which haven't changed.
+./clear_generated_outputs.sh "$DATA_ROOT/Outputs"
 
 cd ..
 ./docker-run-generate-outputs.sh ${CPU_PROFILE_ARG} ${MEMORY_PROFILE_ARG} \
     "$USER" "$PIPELINE_RUN_MODE" "$PIPELINE_CONFIGURATION_FILE_PATH" \
     "$DATA_ROOT/Raw Data" "$DATA_ROOT/Coded Coda Files/" "$DATA_ROOT/Outputs/auto_coding_traced_data.jsonl" \
     "$DATA_ROOT/Outputs/messages_traced_data.jsonl" "$DATA_ROOT/Outputs/individuals_traced_data.jsonl" \
+    "$DATA_ROOT/Outputs/messages_analysis_snapshot.jsonl" "$DATA_ROOT/Outputs/individuals_analysis_snapshot.jsonl" \
     "$DATA_ROOT/Outputs/ICR/" "$DATA_ROOT/Outputs/Coda Files/" \
     "$DATA_ROOT/Outputs/messages.csv" "$DATA_ROOT/Outputs/individuals.csv" \
     "$DATA_ROOT/Outputs/production.csv"
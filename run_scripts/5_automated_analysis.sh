@@ -31,15 +31,12 @@ USER=$1
 PIPELINE_CONFIGURATION_FILE_PATH=$2
 DATA_ROOT=$3
 
-if [ -d "$DATA_ROOT/Outputs/Automated Analysis" ]
-then
-    rm -r "$DATA_ROOT/Outputs/Automated Analysis"
-fi
-
+# The previous run's outputs are kept, so that automated analysis only needs to re-write the outputs whose inputs
+# have changed (see the manifest.json in this directory).
 mkdir -p "$DATA_ROOT/Outputs/Automated Analysis"
 
 cd ..
 ./docker-run-automated-analysis.sh ${CPU_PROFILE_ARG} ${MEMORY_PROFILE_ARG} \
   "$USER" "$PIPELINE_CONFIGURATION_FILE_PATH" \
-  "$DATA_ROOT/Outputs/messages_traced_data.jsonl" "$DATA_ROOT/Outputs/individuals_traced_data.jsonl" \
+  "$DATA_ROOT/Outputs/messages_analysis_snapshot.jsonl" "$DATA_ROOT/Outputs/individuals_analysis_snapshot.jsonl" \
   "$DATA_ROOT/Outputs/Automated Analysis/"
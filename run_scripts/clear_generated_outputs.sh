@@ -0,0 +1,15 @@
+#!/usr/bin/env bash
+
+set -e
+
+if [[ $# -ne 1 ]]; then
+    echo "Usage: ./clear_generated_outputs.sh <outputs-dir>"
+    echo "Deletes the outputs written by generate_outputs.py from <outputs-dir>, keeping the 'Automated Analysis'"
+    echo "sub-directory so that automated analysis can skip re-writing and re-uploading its unchanged outputs"
+    exit
+fi
+
+OUTPUTS_DIR=$1
+
+mkdir -p "$OUTPUTS_DIR"
+find "$OUTPUTS_DIR" -mindepth 1 -maxdepth 1 ! -name "Automated Analysis" -exec rm -r {} +
@@ -0,0 +1,271 @@
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+# Uses the standard library's logging rather than core_data_modules, so that this script can run with the host's
+# python3, without the pipeline's pipenv environment.
+log = logging.getLogger(__name__)
+
+
+class Stage(object):
+    def __init__(self, name, command, dependencies):
+        """
+        :param name: Name of this stage, as passed to --from-stage and --only-stage.
+        :type name: str
+        :param command: Command to run this stage, from the run_scripts directory.
+        :type command: list of str
+        :param dependencies: Names of the stages which must complete before this stage can start.
+        :type dependencies: list of str
+        """
+        self.name = name
+        self.command = command
+        self.dependencies = dependencies
+
+
+def get_stages(user, pipeline_run_mode, pipeline_configuration, coda_pull_credentials_path, coda_push_credentials_path,
+               avf_bucket_credentials_path, coda_tools_root, data_root, data_backups_dir, performance_logs_dir,
+               run_id):
+    """
+    :return: The stages of the pipeline, in the order they would run if run one at a time.
+    :rtype: list of Stage
+    """
+    stages = [
+        Stage("coda_get", ["./1_coda_get.sh", coda_pull_credentials_path, coda_tools_root, data_root], []),
+
+        Stage("fetch_raw_data",
+              ["./2_fetch_raw_data.sh", user, avf_bucket_credentials_path, pipeline_configuration, data_root], []),
+
+        Stage("generate_outputs",
+              ["./3_generate_outputs.sh", "--profile-memory", f"{performance_logs_dir}/memory-{run_id}.profile",
+               user, pipeline_run_mode, pipeline_configuration, data_root],
+              ["coda_get", "fetch_raw_data"]),
+
+        Stage("coda_add", ["./4_coda_add.sh", coda_push_credentials_path, coda_tools_root, data_root],
+              ["generate_outputs"])
+    ]
+
+    backup_dependencies = ["coda_add"]
+    if pipeline_run_mode == "all-stages":
+        stages.append(
+            Stage("automated_analysis",
+                  ["./5_automated_analysis.sh", "--profile-memory",
+                   f"{performance_logs_dir}/automated-analysis-memory-{run_id}.profile",
+                   user, pipeline_configuration, data_root],
+                  ["generate_outputs"])
+        )
+        backup_dependencies.append("automated_analysis")
+
+    stages.extend([
+        Stage("backup_data_root",
+              ["./6_backup_data_root.sh", data_root, f"{data_backups_dir}/data-{run_id}.tar.gzip"],
+              backup_dependencies),
+
+        Stage("upload_analysis_files",
+              ["./7_upload_analysis_files.sh", user, pipeline_run_mode, avf_bucket_credentials_path,
+               pipeline_configuration, run_id, data_root],
+              ["backup_data_root"]),
+
+        Stage("upload_log_files",
+              ["./8_upload_log_files.sh", user, avf_bucket_credentials_path, pipeline_configuration,
+               performance_logs_dir, data_backups_dir],
+              ["backup_data_root"])
+    ])
+
+    return stages
+
+
+def run_stage(stage, output_lock):
+    """
+    Runs a stage, prefixing each line it outputs with the stage's name so the output of concurrent stages can be told
+    apart.
+
+    :return: Time taken to run the stage, in seconds.
+    :rtype: float
+    """
+    log.info(f"Starting stage '{stage.name}'...")
+    start_time = time.time()
+    process = subprocess.Popen(stage.command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                               universal_newlines=True)
+    for line in process.stdout:
+        with output_lock:
+            print(f"[{stage.name}] {line}", end="", flush=True)
+    process.wait()
+    duration_seconds = time.time() - start_time
+
+    assert process.returncode == 0, f"Stage '{stage.name}' failed with exit code {process.returncode}"
+    log.info(f"Completed stage '{stage.name}' in {duration_seconds:.1f}s")
+    return duration_seconds
+
+
+def run_stages(stages, stage_names_to_run, on_stage_completed=None):
+    """
+    Runs the given stages, starting each one as soon as all of its dependencies have completed.
+
+    Dependencies which are not in `stage_names_to_run` are assumed to have completed on a previous run.
+    If a stage fails, the stages which are already running are allowed to finish, no more stages are started, and
+    the failure is raised.
+
+    :param stages: All the stages in the pipeline.
+    :type stages: list of Stage
+    :param stage_names_to_run: Names of the stages to run.
+    :type stage_names_to_run: list of str
+    :param on_stage_completed: Function to call with the durations of the stages completed so far each time a stage
+                               completes, before any of the stages which depend on it are started.
+    :type on_stage_completed: (func of dict of str -> float) | None
+    :return: Dictionary of stage name -> time taken to run that stage, in seconds, in the order the stages completed.
+    :rtype: dict of str -> float
+    """
+    pending = [stage for stage in stages if stage.name in stage_names_to_run]
+    completed = {stage.name for stage in stages if stage.name not in stage_names_to_run}
+    output_lock = threading.Lock()
+
+    durations = dict()
+    failure = None
+    with ThreadPoolExecutor(max_workers=len(stages)) as executor:
+        running = dict()  # of future -> stage name
+        while len(pending) > 0 or len(running) > 0:
+            if failure is None:
+                for stage in list(pending):
+                    if all(dependency in completed for dependency in stage.dependencies):
+                        pending.remove(stage)
+                        running[executor.submit(run_stage, stage, output_lock)] = stage.name
+            elif len(running) == 0:
+                break
+
+            assert len(running) > 0, f"Stages {[stage.name for stage in pending]} have unsatisfiable dependencies"
+            done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+            for future in done:
+                stage_name = running.pop(future)
+                try:
+                    durations[stage_name] = future.result()
+                    completed.add(stage_name)
+                except Exception as ex:
+                    log.error(str(ex))
+                    if failure is None:
+                        failure = ex
+                    continue
+
+                if on_stage_completed is not None:
+                    on_stage_completed(dict(durations))
+
+    if failure is not None:
+        log.error(f"Not starting stages {[stage.name for stage in pending]} because an earlier stage failed")
+        raise failure
+
+    return durations
+
+
+def write_stage_durations(output_path, run_id, total_seconds, durations, completed):
+    """
+    Writes the durations of the stages of a run to a json file.
+
+    :param output_path: Path to write the durations to.
+    :type output_path: str
+    :param run_id: Id of the run.
+    :type run_id: str
+    :param total_seconds: Time the run has taken so far, in seconds.
+    :type total_seconds: float
+    :param durations: Dictionary of stage name -> time taken to run that stage, in seconds, for the stages which have
+                      completed.
+    :type durations: dict of str -> float
+    :param completed: Whether all the stages of the run have completed.
+    :type completed: bool
+    """
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    temp_path = f"{output_path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump({"RunId": run_id, "Completed": completed, "TotalSeconds": total_seconds, "StageSeconds": durations},
+                  f, indent=2)
+    os.replace(temp_path, output_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the pipeline end-to-end (data fetch, coda fetch, output "
+                                                 "generation, Drive upload, Coda upload, data backup). "
+                                                 "Stages which don't depend on each other are run concurrently. "
+                                                 "This script must be run from the run_scripts directory.")
+
+    stage_selection = parser.add_mutually_exclusive_group()
+    stage_selection.add_argument("--from-stage", metavar="stage",
+                                 help="Resume the pipeline from this stage, skipping the stages before it")
+    stage_selection.add_argument("--only-stage", metavar="stage", action="append",
+                                 help="Run only this stage. May be repeated to run several stages")
+
+    parser.add_argument("user", help="Identifier of the user launching this program")
+    parser.add_argument("pipeline_run_mode", metavar="pipeline-run-mode", choices=["all-stages", "auto-code-only"],
+                        help="Whether to run all the stages, or to exclude automated analysis")
+    parser.add_argument("pipeline_configuration", metavar="pipeline-configuration-json",
+                        help="Path to the pipeline configuration json file")
+    parser.add_argument("coda_pull_credentials_path", metavar="coda-pull-credentials-path",
+                        help="Path to the credentials file to use to download data from Coda")
+    parser.add_argument("coda_push_credentials_path", metavar="coda-push-credentials-path",
+                        help="Path to the credentials file to use to upload data to Coda")
+    parser.add_argument("avf_bucket_credentials_path", metavar="avf-bucket-credentials-path",
+                        help="Path to a Google Cloud service account credentials file to use to access the "
+                             "credentials bucket")
+    parser.add_argument("coda_tools_root", metavar="coda-tools-root",
+                        help="Path to a directory to check out the Coda tools to")
+    parser.add_argument("data_root", metavar="data-root",
+                        help="Path to the pipeline's data directory")
+    parser.add_argument("data_backups_dir", metavar="data-backup-dir",
+                        help="Path to a directory to write data backups to")
+    parser.add_argument("performance_logs_dir", metavar="performance-logs-dir",
+                        help="Path to a directory to write performance logs to, including the stage durations")
+
+    args = parser.parse_args()
+
+    # Log to stdout, so that the log stays in order with the stages' output.
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    date = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+    commit_hash = subprocess.check_output(["git", "rev-parse", "HEAD"], universal_newlines=True).strip()
+    run_id = f"{date}-{commit_hash}"
+    log.info(f"Starting run with id '{run_id}'")
+
+    stages = get_stages(args.user, args.pipeline_run_mode, args.pipeline_configuration,
+                        args.coda_pull_credentials_path, args.coda_push_credentials_path,
+                        args.avf_bucket_credentials_path, args.coda_tools_root, args.data_root, args.data_backups_dir,
+                        args.performance_logs_dir, run_id)
+    stage_names = [stage.name for stage in stages]
+
+    if args.only_stage is not None:
+        for stage_name in args.only_stage:
+            assert stage_name in stage_names, f"Unknown stage '{stage_name}'; must be one of {stage_names}"
+        stage_names_to_run = args.only_stage
+    elif args.from_stage is not None:
+        assert args.from_stage in stage_names, f"Unknown stage '{args.from_stage}'; must be one of {stage_names}"
+        stage_names_to_run = stage_names[stage_names.index(args.from_stage):]
+    else:
+        stage_names_to_run = stage_names
+
+    # Write the durations measured so far after each stage completes, so that they are written before the log files
+    # are uploaded, and are kept if a later stage fails.
+    durations_output_path = f"{args.performance_logs_dir}/stage-durations-{run_id}.json"
+    durations = dict()
+
+    def on_stage_completed(durations_so_far):
+        durations.update(durations_so_far)
+        write_stage_durations(durations_output_path, run_id, time.time() - start_time, durations, completed=False)
+
+    start_time = time.time()
+    completed = False
+    try:
+        run_stages(stages, stage_names_to_run, on_stage_completed)
+        completed = True
+    finally:
+        total_seconds = time.time() - start_time
+        write_stage_durations(durations_output_path, run_id, total_seconds, durations, completed)
+
+        log.info(f"Ran {len(durations)} stages in {total_seconds:.1f}s:")
+        for stage_name in stage_names:
+            if stage_name in durations:
+                log.info(f"    {stage_name}: {durations[stage_name]:.1f}s")
+        log.info(f"Wrote the stage durations to '{durations_output_path}'")
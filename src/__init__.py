@@ -6,3 +6,6 @@ from .load_data import LoadData
 from .production_file import ProductionFile
 from .translate_rapid_pro_keys import TranslateRapidProKeys
 from .ws_correction import WSCorrection
+from .analysis_aggregator import AnalysisAggregator
+from .analysis_manifest import AnalysisManifest
+from .analysis_snapshot import AnalysisSnapshot
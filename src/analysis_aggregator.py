@@ -0,0 +1,396 @@
+import multiprocessing
+import random
+from collections import OrderedDict
+
+import numpy as np
+from core_data_modules.cleaners import Codes
+from core_data_modules.data_models.code_scheme import CodeTypes
+
+from src.analysis_utils import AnalysisUtils
+from src.lib import PipelineConfiguration, ReservoirSampler
+from src.lib.configuration_objects import CodingModes
+
+# Theme counting job shared with the forked worker processes by `AnalysisAggregator._count_all_themes`, as
+# (aggregator, individuals, survey slots of each individual, or None for individuals who withdrew consent).
+_theme_job = None
+
+
+def _count_themes_in_worker(plan_index):
+    aggregator, individuals, survey_slots = _theme_job
+    return aggregator._count_themes(plan_index, individuals, survey_slots)
+
+
+class AnalysisAggregator(object):
+    TOTAL_RELEVANT_PARTICIPANTS = "Total Relevant Participants"
+
+    def __init__(self, consent_withdrawn_key, sample_size=100, sample_seed=None):
+        """
+        Computes the engagement counts, repeat participations, demographic distributions and theme distributions
+        for automated analysis in a single pass over the messages and a single pass over the individuals.
+
+        All the code scheme lookups are compiled up-front into code_id -> counter slot tables, so the cost of each
+        pass grows linearly with the number of records. The theme distributions are then counted per RQA plan in
+        parallel (see `AnalysisAggregator.add_individuals`).
+
+        The pass over the messages also samples up to `sample_size` opted-in messages for each code of each RQA coding
+        configuration, so memory use for the samples is bounded by (number of codes * `sample_size`).
+
+        :param consent_withdrawn_key: Key in each TracedData of the consent withdrawn field.
+        :type consent_withdrawn_key: str
+        :param sample_size: Maximum number of messages to sample for each code.
+        :type sample_size: int
+        :param sample_seed: Seed for the message samples, or None to draw a different sample on each run.
+        :type sample_seed: int | None
+        """
+        self.consent_withdrawn_key = consent_withdrawn_key
+        self.rqa_plans = PipelineConfiguration.RQA_CODING_PLANS
+        self.status_index = AnalysisUtils.compile_status_index(self.rqa_plans)
+
+        self._compile_survey_slots()
+        self._compile_demographics()
+        self._compile_themes()
+        self._compile_samples(sample_size, sample_seed)
+
+        self.messages_status = np.zeros((0, len(self.rqa_plans)), dtype=np.uint8)
+        self.individuals_status = np.zeros((0, len(self.rqa_plans)), dtype=np.uint8)
+        self.participation_counts = np.zeros(len(self.rqa_plans) + 1, dtype=np.int64)
+
+    def _compile_survey_slots(self):
+        # Slot 0 holds "Total Participants"; slots 1.. hold the survey codes, in theme distribution column order.
+        self.survey_slot_keys = ["Total Participants"]
+        survey_slot_of_key = dict()
+        self.survey_lookups = []  # of (coded_field, coding_mode, code_id -> slot, or None for STOP codes)
+        for plan in PipelineConfiguration.SURVEY_CODING_PLANS:
+            for cc in plan.coding_configurations:
+                if cc.include_in_theme_distribution == Codes.FALSE:
+                    continue
+
+                code_id_to_slot = dict()
+                for code in cc.code_scheme.codes:
+                    if code.control_code == Codes.STOP:
+                        code_id_to_slot[code.code_id] = None  # Ignore STOP codes because we already excluded everyone who opted out.
+                        continue
+
+                    key = f"{cc.analysis_file_key}:{code.string_value}"
+                    if key not in survey_slot_of_key:
+                        survey_slot_of_key[key] = len(self.survey_slot_keys)
+                        self.survey_slot_keys.append(key)
+                    code_id_to_slot[code.code_id] = survey_slot_of_key[key]
+
+                self.survey_lookups.append((cc.coded_field, cc.coding_mode, code_id_to_slot))
+
+    def _compile_demographics(self):
+        self.demographic_counts = OrderedDict()  # of analysis_file_key -> code id -> number of individuals
+        self.demographic_total_relevant = OrderedDict()  # of analysis_file_key -> number of relevant individuals
+        self.demographic_lookups = []  # of (coded_field, analysis_file_key, set of normal code ids)
+        for plan in PipelineConfiguration.DEMOG_CODING_PLANS:
+            for cc in plan.coding_configurations:
+                if cc.analysis_file_key is None:
+                    continue
+
+                self.demographic_counts[cc.analysis_file_key] = OrderedDict()
+                for code in cc.code_scheme.codes:
+                    if code.control_code == Codes.STOP:
+                        continue
+                    self.demographic_counts[cc.analysis_file_key][code.code_id] = 0
+                self.demographic_total_relevant[cc.analysis_file_key] = 0
+
+                if cc.include_in_theme_distribution == Codes.FALSE:
+                    continue
+                assert cc.coding_mode == CodingModes.SINGLE
+                normal_code_ids = {code.code_id for code in cc.code_scheme.codes if code.code_type == CodeTypes.NORMAL}
+                self.demographic_lookups.append((cc.coded_field, cc.analysis_file_key, normal_code_ids))
+
+    def _compile_themes(self):
+        # For each RQA plan, row 0 is "Total Relevant Participants" and rows 1.. are the themes.
+        self.theme_names = []  # of list of theme name, per RQA plan
+        self.theme_codes = []  # of list of Code, per RQA plan
+        self.theme_lookups = []  # of list of (coded_field, code_id -> (row, or None for STOP codes, is normal))
+        self.theme_counts = []  # of numpy.ndarray of shape (number of themes, number of survey slots)
+        for plan in self.rqa_plans:
+            names = [self.TOTAL_RELEVANT_PARTICIPANTS]
+            codes = [None]
+            lookups = []
+            for cc in plan.coding_configurations:
+                # TODO: Add support for CodingModes.SINGLE if we need it e.g. for IMAQAL?
+                assert cc.coding_mode == CodingModes.MULTIPLE, "Other CodingModes not (yet) supported"
+                code_id_to_row = dict()
+                for code in cc.code_scheme.codes:
+                    if code.control_code == Codes.STOP:
+                        code_id_to_row[code.code_id] = (None, False)
+                        continue
+                    name = f"{cc.analysis_file_key}_{code.string_value}"
+                    if name not in names:
+                        names.append(name)
+                        codes.append(code)
+                    code_id_to_row[code.code_id] = (names.index(name), code.code_type == CodeTypes.NORMAL)
+                lookups.append((cc.coded_field, code_id_to_row))
+
+            self.theme_names.append(names)
+            self.theme_codes.append(codes)
+            self.theme_lookups.append(lookups)
+            self.theme_counts.append(np.zeros((len(names), len(self.survey_slot_keys)), dtype=np.int64))
+
+    def _compile_samples(self, sample_size, sample_seed):
+        rng = random.Random(sample_seed)
+        self.samplers = []  # of (episode, code scheme name, code string value, ReservoirSampler), in export order
+        self.sample_lookups = []  # of list of (coded_field, code_id -> ReservoirSampler), per RQA plan
+        for plan in self.rqa_plans:
+            lookups = []
+            for cc in plan.coding_configurations:
+                sampler_of_string_value = dict()
+                code_id_to_sampler = dict()
+                for code in cc.code_scheme.codes:
+                    if code.string_value not in sampler_of_string_value:
+                        sampler = ReservoirSampler(sample_size, rng)
+                        sampler_of_string_value[code.string_value] = sampler
+                        self.samplers.append((plan.raw_field, cc.code_scheme.name, code.string_value, sampler))
+                    code_id_to_sampler[code.code_id] = sampler_of_string_value[code.string_value]
+                lookups.append((cc.coded_field, code_id_to_sampler))
+            self.sample_lookups.append(lookups)
+
+    def _get_survey_slots(self, td):
+        slots = [0]
+        for coded_field, coding_mode, code_id_to_slot in self.survey_lookups:
+            if coding_mode == CodingModes.SINGLE:
+                code_ids = [td[coded_field]["CodeID"]]
+            else:
+                assert coding_mode == CodingModes.MULTIPLE
+                code_ids = [label["CodeID"] for label in td[coded_field]]
+
+            for code_id in code_ids:
+                slot = code_id_to_slot[code_id]
+                if slot is not None:
+                    slots.append(slot)
+        return np.array(slots, dtype=np.intp)
+
+    def add_messages(self, messages):
+        """
+        Aggregates the given messages.
+
+        :param messages: Messages to aggregate.
+        :type messages: list of dict
+        """
+        self.messages_status = np.zeros((len(messages), len(self.rqa_plans)), dtype=np.uint8)
+        for i, msg in enumerate(messages):
+            status = self.messages_status[i]
+            AnalysisUtils.compute_status(msg, self.consent_withdrawn_key, self.status_index, status)
+
+            # Sample the messages which opted-in under each plan.
+            for plan, lookups, plan_status in zip(self.rqa_plans, self.sample_lookups, status):
+                if (plan_status & (AnalysisUtils.RESPONDED | AnalysisUtils.CONSENT_WITHDRAWN)) != AnalysisUtils.RESPONDED:
+                    continue
+
+                for coded_field, code_id_to_sampler in lookups:
+                    for label in msg[coded_field]:
+                        code_id_to_sampler[label["CodeID"]].add(msg[plan.raw_field])
+
+    def add_individuals(self, individuals, processes=None):
+        """
+        Aggregates the given individuals.
+
+        The theme distributions of each RQA plan are counted in parallel worker processes, which read `individuals`
+        from a copy-on-write snapshot of this process rather than having it pickled to them.
+
+        :param individuals: Individuals to aggregate.
+        :type individuals: list of dict
+        :param processes: Number of worker processes to count the theme distributions with. If None, uses the number
+                          of CPUs. If 1, counts them in this process.
+        :type processes: int | None
+        """
+        self.individuals_status = np.zeros((len(individuals), len(self.rqa_plans)), dtype=np.uint8)
+        survey_slots = []  # of numpy.ndarray of the survey slots of each individual, or None if they withdrew consent
+        for i, ind in enumerate(individuals):
+            status = self.individuals_status[i]
+            AnalysisUtils.compute_status(ind, self.consent_withdrawn_key, self.status_index, status)
+
+            # Individuals who withdrew consent are excluded from all the other counts.
+            if ind[self.consent_withdrawn_key] == Codes.TRUE:
+                survey_slots.append(None)
+                continue
+
+            # An individual is considered to have participated if they sent a message and didn't opt-out, regardless
+            # of the relevance of any of their messages.
+            weeks_participated = int(np.count_nonzero(status & AnalysisUtils.RESPONDED))
+            assert weeks_participated != 0, f"Found individual '{ind['uid']}' with no participation in any week"
+            self.participation_counts[weeks_participated] += 1
+
+            for coded_field, analysis_file_key, normal_code_ids in self.demographic_lookups:
+                code_id = ind[coded_field]["CodeID"]
+                self.demographic_counts[analysis_file_key][code_id] += 1
+                if code_id in normal_code_ids:
+                    self.demographic_total_relevant[analysis_file_key] += 1
+
+            survey_slots.append(self._get_survey_slots(ind))
+
+        self._count_all_themes(individuals, survey_slots, processes)
+
+    def _count_themes(self, plan_index, individuals, survey_slots):
+        """
+        Counts the theme distribution of one RQA plan.
+
+        :return: Counts of shape (number of themes in the plan, number of survey slots).
+        :rtype: numpy.ndarray of int64
+        """
+        lookups = self.theme_lookups[plan_index]
+        counts = np.zeros_like(self.theme_counts[plan_index])
+        for ind, ind_survey_slots in zip(individuals, survey_slots):
+            if ind_survey_slots is None:
+                continue
+
+            relevant_participant = False
+            for coded_field, code_id_to_row in lookups:
+                for label in ind[coded_field]:
+                    row, is_normal = code_id_to_row[label["CodeID"]]
+                    if row is None:
+                        continue
+                    np.add.at(counts[row], ind_survey_slots, 1)
+                    if is_normal:
+                        relevant_participant = True
+
+            if relevant_participant:
+                np.add.at(counts[0], ind_survey_slots, 1)
+
+        return counts
+
+    def _count_all_themes(self, individuals, survey_slots, processes):
+        plan_indices = list(range(len(self.rqa_plans)))
+        if processes == 1 or len(plan_indices) <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+            plan_counts = [self._count_themes(i, individuals, survey_slots) for i in plan_indices]
+        else:
+            global _theme_job
+            _theme_job = (self, individuals, survey_slots)
+            if processes is None:
+                processes = multiprocessing.cpu_count()
+            try:
+                # There is no work for more processes than there are plans.
+                with multiprocessing.get_context("fork").Pool(min(processes, len(plan_indices))) as pool:
+                    plan_counts = pool.map(_count_themes_in_worker, plan_indices)
+            finally:
+                _theme_job = None
+
+        for i, counts in zip(plan_indices, plan_counts):
+            self.theme_counts[i] += counts
+
+    def get_message_samples(self):
+        """
+        :return: The sampled messages for each code, as rows in the same format as `sample_messages.csv`.
+        :rtype: list of dict
+        """
+        samples = []
+        for episode, code_scheme_name, code_string_value, sampler in self.samplers:
+            for msg in sampler.get_sample():
+                samples.append({
+                    "Episode": episode,
+                    "Code Scheme": code_scheme_name,
+                    "Code": code_string_value,
+                    "Sample Message": msg
+                })
+        return samples
+
+    def _count_status(self, status_matrix, flag, plan_indices=None, require_all=False):
+        return int(AnalysisUtils.status_mask(status_matrix, flag, plan_indices, require_all).sum())
+
+    def get_engagement_counts(self):
+        """
+        :return: Dictionary of episode name -> engagement counts, including a "Total" row.
+        :rtype: OrderedDict of str -> dict
+        """
+        engagement_counts = OrderedDict()  # of episode name to counts
+        for i, plan in enumerate(self.rqa_plans):
+            engagement_counts[plan.raw_field] = {
+                "Episode": plan.raw_field,
+
+                "Total Messages": "-",  # Can't report this for individual weeks because the data has been overwritten with "STOP"
+                "Total Messages with Opt-Ins": self._count_status(self.messages_status, AnalysisUtils.OPT_IN, [i]),
+                "Total Labelled Messages": self._count_status(self.messages_status, AnalysisUtils.LABELLED, [i],
+                                                              require_all=True),
+                "Total Relevant Messages": self._count_status(self.messages_status, AnalysisUtils.RELEVANT, [i]),
+
+                "Total Participants": "-",
+                "Total Participants with Opt-Ins": self._count_status(self.individuals_status, AnalysisUtils.OPT_IN,
+                                                                      [i]),
+                "Total Relevant Participants": self._count_status(self.individuals_status, AnalysisUtils.RELEVANT,
+                                                                  [i])
+            }
+        engagement_counts["Total"] = {
+            "Episode": "Total",
+
+            "Total Messages": len(self.messages_status),
+            "Total Messages with Opt-Ins": self._count_status(self.messages_status, AnalysisUtils.OPT_IN),
+            "Total Labelled Messages": self._count_status(self.messages_status, AnalysisUtils.LABELLED),
+            "Total Relevant Messages": self._count_status(self.messages_status, AnalysisUtils.RELEVANT),
+
+            "Total Participants": len(self.individuals_status),
+            "Total Participants with Opt-Ins": self._count_status(self.individuals_status, AnalysisUtils.OPT_IN),
+            "Total Relevant Participants": self._count_status(self.individuals_status, AnalysisUtils.RELEVANT)
+        }
+        return engagement_counts
+
+    def get_repeat_participations(self):
+        """
+        :return: Dictionary of number of episodes participated in -> participation frequency row.
+        :rtype: OrderedDict of int -> dict
+        """
+        # Percentages are computed out of the total number of participants who opted-in.
+        total_participants = self._count_status(self.individuals_status, AnalysisUtils.OPT_IN)
+
+        repeat_participations = OrderedDict()
+        for i in range(1, len(self.rqa_plans) + 1):
+            participants = int(self.participation_counts[i])
+            repeat_participations[i] = {
+                "Number of Episodes Participated In": i,
+                "Number of Participants with Opt-Ins": participants,
+                "% of Participants with Opt-Ins": round(participants / total_participants * 100, 1)
+            }
+        return repeat_participations
+
+    def get_demographic_distributions(self):
+        """
+        :return: Tuple of (analysis_file_key -> code id -> number of individuals,
+                           analysis_file_key -> number of relevant individuals).
+        :rtype: (OrderedDict of str -> (OrderedDict of str -> int), OrderedDict of str -> int)
+        """
+        return self.demographic_counts, self.demographic_total_relevant
+
+    def get_survey_counts_headers(self):
+        """
+        :return: The survey count columns of the theme distributions, in export order.
+        :rtype: list of str
+        """
+        headers = []
+        for key in self.survey_slot_keys:
+            headers.append(key)
+            headers.append(f"{key} %")
+        return headers
+
+    def _make_survey_counts(self, counts, totals):
+        survey_counts = OrderedDict()
+        for slot, key in enumerate(self.survey_slot_keys):
+            survey_counts[key] = int(counts[slot])
+            if totals is None:
+                survey_counts[f"{key} %"] = None
+            elif totals[slot] == 0:
+                survey_counts[f"{key} %"] = "-"
+            else:
+                survey_counts[f"{key} %"] = round(int(counts[slot]) / int(totals[slot]) * 100, 1)
+        return survey_counts
+
+    def get_theme_distributions(self):
+        """
+        :return: Dictionary of episode name -> theme name -> survey counts, where the survey counts are a dictionary of
+                 survey column -> value in the same format as the columns of `theme_distributions.csv`.
+                 Percentages are only computed for "Total Relevant Participants" and for normal themes.
+        :rtype: OrderedDict of str -> (OrderedDict of str -> (OrderedDict of str -> int | float | str | None))
+        """
+        episodes = OrderedDict()
+        for plan, names, codes, counts in zip(self.rqa_plans, self.theme_names, self.theme_codes, self.theme_counts):
+            themes = OrderedDict()
+            episodes[plan.raw_field] = themes
+            totals = counts[0]
+            for row, (name, code) in enumerate(zip(names, codes)):
+                if code is None or code.code_type == CodeTypes.NORMAL:
+                    themes[name] = self._make_survey_counts(counts[row], totals)
+                else:
+                    themes[name] = self._make_survey_counts(counts[row], None)
+        return episodes
@@ -15,70 +15,129 @@ from src.lib.configuration_objects import CodingModes
 
 class AnalysisFile(object):
     @staticmethod
-    def export_to_csv(user, data, csv_path, export_keys, consent_withdrawn_key):
+    def compile_export_plan(export_keys):
+        """
+        Compiles the per-column export rules for the analysis CSVs once, so that each exported row only needs a dict
+        copy plus a few assignments.
+
+        :param export_keys: Keys to export, in column order.
+        :type export_keys: list of str
+        :return: Dictionary containing:
+                  - "export_keys": the column order.
+                  - "row_template": a row with every MULTIPLE matrix column prefilled with Codes.MATRIX_0.
+                  - "stopped_row_template": a row with every column set to Codes.STOP.
+                  - "single_columns": list of (coded_field, analysis_file_key, code_id -> string_value).
+                  - "multiple_columns": list of (coded_field, code_id -> matrix column key).
+                  - "passthrough_keys": export keys which are copied from the TracedData unchanged.
+        :rtype: dict
+        """
+        row_template = dict()
+        single_columns = []
+        multiple_columns = []
+        coded_keys = set()
+
+        for plan in PipelineConfiguration.RQA_CODING_PLANS + PipelineConfiguration.SURVEY_CODING_PLANS:
+            for cc in plan.coding_configurations:
+                if cc.analysis_file_key is None:
+                    continue
+
+                if cc.coding_mode == CodingModes.SINGLE:
+                    code_id_to_string_value = {code.code_id: code.string_value for code in cc.code_scheme.codes}
+                    single_columns.append((cc.coded_field, cc.analysis_file_key, code_id_to_string_value))
+                    coded_keys.add(cc.analysis_file_key)
+                else:
+                    assert cc.coding_mode == CodingModes.MULTIPLE
+                    code_id_to_column = dict()
+                    for code in cc.code_scheme.codes:
+                        column = f"{cc.analysis_file_key}_{code.string_value}"
+                        code_id_to_column[code.code_id] = column
+                        row_template[column] = Codes.MATRIX_0
+                        coded_keys.add(column)
+                    multiple_columns.append((cc.coded_field, code_id_to_column))
+
+        return {
+            "export_keys": export_keys,
+            "row_template": row_template,
+            "stopped_row_template": {k: Codes.STOP for k in export_keys},
+            "single_columns": single_columns,
+            "multiple_columns": multiple_columns,
+            "passthrough_keys": [k for k in export_keys if k not in coded_keys]
+        }
+
+    @classmethod
+    def export_to_csv(cls, user, data, csv_path, export_keys, consent_withdrawn_key, export_plan=None):
+        if export_plan is None:
+            export_plan = cls.compile_export_plan(export_keys)
+
+        row_template = export_plan["row_template"]
+        stopped_row_template = export_plan["stopped_row_template"]
+        single_columns = export_plan["single_columns"]
+        multiple_columns = export_plan["multiple_columns"]
+        passthrough_keys = export_plan["passthrough_keys"]
+
         with open(csv_path, "w") as f:
-            writer = csv.DictWriter(f, fieldnames=export_keys, lineterminator="\n")
+            writer = csv.DictWriter(f, fieldnames=export_plan["export_keys"], lineterminator="\n")
             writer.writeheader()
 
             for td in data:
-                analysis_dict = dict()
-
                 # If consent was withdrawn, export the uid and consent_withdrawn_key.
                 # Export "STOP" for every other variable.
                 if td[consent_withdrawn_key] == Codes.TRUE:
-                    analysis_dict = {k: Codes.STOP for k in export_keys}
+                    analysis_dict = stopped_row_template.copy()
                     analysis_dict["uid"] = td["uid"]
                     analysis_dict[consent_withdrawn_key] = td[consent_withdrawn_key]
                     writer.writerow(analysis_dict)
                     continue
 
                 # Convert codes to their string/matrix values for export.
-                for plan in PipelineConfiguration.RQA_CODING_PLANS + PipelineConfiguration.SURVEY_CODING_PLANS:
-                    for cc in plan.coding_configurations:
-                        if cc.analysis_file_key is None:
-                            continue
-
-                        if cc.coding_mode == CodingModes.SINGLE:
-                            analysis_dict[cc.analysis_file_key] = \
-                                cc.code_scheme.get_code_with_code_id(td[cc.coded_field]["CodeID"]).string_value
-                        else:
-                            assert cc.coding_mode == CodingModes.MULTIPLE
-                            show_matrix_keys = []
-                            for code in cc.code_scheme.codes:
-                                show_matrix_keys.append(f"{cc.analysis_file_key}_{code.string_value}")
-
-                            for label in td[cc.coded_field]:
-                                code_string_value = cc.code_scheme.get_code_with_code_id(label["CodeID"]).string_value
-                                analysis_dict[f"{cc.analysis_file_key}_{code_string_value}"] = Codes.MATRIX_1
-
-                            for key in show_matrix_keys:
-                                if key not in analysis_dict:
-                                    analysis_dict[key] = Codes.MATRIX_0
+                analysis_dict = row_template.copy()
+                for coded_field, analysis_file_key, code_id_to_string_value in single_columns:
+                    analysis_dict[analysis_file_key] = code_id_to_string_value[td[coded_field]["CodeID"]]
+
+                for coded_field, code_id_to_column in multiple_columns:
+                    for label in td[coded_field]:
+                        analysis_dict[code_id_to_column[label["CodeID"]]] = Codes.MATRIX_1
 
                 # Prepare all the other values, which don't need converting to strings, for export.
-                for key in export_keys:
-                    if key not in analysis_dict and key in td:
+                for key in passthrough_keys:
+                    if key in td:
                         analysis_dict[key] = td[key]
 
                 writer.writerow(analysis_dict)
 
     @classmethod
-    def generate(cls, user, data, csv_by_message_output_path, csv_by_individual_output_path):
+    def generate(cls, user, data, csv_by_message_output_path, csv_by_individual_output_path, output_writer=None):
+        """
+        Sets consent withdrawn, folds the messages data to one row per individual, and exports both to CSV.
+
+        :param user: Identifier of the user running this program, for TracedData Metadata.
+        :type user: str
+        :param data: Messages data to generate the analysis files from.
+        :type data: iterable of TracedData
+        :param csv_by_message_output_path: Path to write the messages analysis CSV to.
+        :type csv_by_message_output_path: str
+        :param csv_by_individual_output_path: Path to write the individuals analysis CSV to.
+        :type csv_by_individual_output_path: str
+        :param output_writer: Writer to queue the CSV exports on, or None.
+                              If None, the CSVs are exported before this function returns.
+        :type output_writer: src.lib.ConcurrentOutputWriter | None
+        :return: Tuple of (messages data, individuals data).
+        :rtype: (list of TracedData, list of TracedData)
+        """
         # Serializer is currently overflowing
         # TODO: Investigate/address the cause of this.
         sys.setrecursionlimit(15000)
 
-        # Set consent withdrawn based on presence of data coded as "stop"
+        # Determine consent withdrawn based on presence of data coded as "stop"
         consent_withdrawn_key = "consent_withdrawn"
-        ConsentUtils.determine_consent_withdrawn(
-            user, data, PipelineConfiguration.RQA_CODING_PLANS + PipelineConfiguration.SURVEY_CODING_PLANS,
-            consent_withdrawn_key
-        )
+        stopped_uids = ConsentUtils.get_stopped_uids(
+            data, PipelineConfiguration.RQA_CODING_PLANS + PipelineConfiguration.SURVEY_CODING_PLANS)
 
-        # Set the list of keys to be exported and how they are to be handled when folding
+        # Set the list of keys to be exported and how they are to be handled when folding.
+        # Consent withdrawn isn't folded, because it is set per-uid on the folded data below, which gives the same
+        # result as folding with FoldStrategies.boolean_or.
         fold_strategies = OrderedDict()
         fold_strategies["uid"] = FoldStrategies.assert_equal
-        fold_strategies[consent_withdrawn_key] = FoldStrategies.boolean_or
 
         export_keys = ["uid", consent_withdrawn_key]
 
@@ -108,10 +167,20 @@ class AnalysisFile(object):
             user, to_be_folded, lambda td: td["uid"], fold_strategies
         )
 
-        ConsentUtils.set_stopped(user, data, consent_withdrawn_key)
-        ConsentUtils.set_stopped(user, folded_data, consent_withdrawn_key)
-
-        cls.export_to_csv(user, data, csv_by_message_output_path, export_keys, consent_withdrawn_key)
-        cls.export_to_csv(user, folded_data, csv_by_individual_output_path, export_keys, consent_withdrawn_key)
+        # Set consent withdrawn and, for the participants who withdrew, set every other key to "STOP", in a single
+        # append per TracedData object.
+        ConsentUtils.set_consent_withdrawn(user, data, stopped_uids, consent_withdrawn_key, set_stopped=True)
+        ConsentUtils.set_consent_withdrawn(user, folded_data, stopped_uids, consent_withdrawn_key, set_stopped=True)
+
+        export_plan = cls.compile_export_plan(export_keys)
+        if output_writer is None:
+            cls.export_to_csv(user, data, csv_by_message_output_path, export_keys, consent_withdrawn_key, export_plan)
+            cls.export_to_csv(user, folded_data, csv_by_individual_output_path, export_keys, consent_withdrawn_key,
+                              export_plan)
+        else:
+            output_writer.add_job("the messages analysis CSV", cls.export_to_csv, user, data,
+                                  csv_by_message_output_path, export_keys, consent_withdrawn_key, export_plan)
+            output_writer.add_job("the individuals analysis CSV", cls.export_to_csv, user, folded_data,
+                                  csv_by_individual_output_path, export_keys, consent_withdrawn_key, export_plan)
 
         return data, folded_data
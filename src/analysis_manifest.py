@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+
+from core_data_modules.logging import Logger
+
+log = Logger(__name__)
+
+
+class AnalysisManifest(object):
+    FILE_NAME = "manifest.json"
+
+    def __init__(self, output_dir, entries=None):
+        """
+        Manifest of the automated analysis outputs in a directory, recording a hash of the inputs each output was
+        last produced from and the hash of the inputs it was last uploaded with.
+
+        This lets automated analysis skip re-writing outputs whose inputs haven't changed since the previous run, and
+        lets the upload stage skip re-uploading outputs which haven't changed since they were last uploaded.
+
+        Output paths are stored relative to `output_dir`, so the manifest stays valid when the directory is copied
+        between pipeline stages.
+
+        :param output_dir: Directory containing the automated analysis outputs and the manifest.
+        :type output_dir: str
+        :param entries: Dictionary of output path, relative to `output_dir` -> manifest entry.
+                        If None, creates an empty manifest.
+        :type entries: dict of str -> dict | None
+        """
+        if entries is None:
+            entries = dict()
+
+        self.output_dir = output_dir
+        self.entries = entries
+        self._current_outputs = set()
+
+    @classmethod
+    def load(cls, output_dir):
+        """
+        Loads the manifest in the given directory, or creates an empty manifest if the directory doesn't have one.
+
+        :param output_dir: Directory containing the automated analysis outputs and the manifest.
+        :type output_dir: str
+        :return: Manifest of the outputs in `output_dir`.
+        :rtype: AnalysisManifest
+        """
+        manifest_path = f"{output_dir}/{cls.FILE_NAME}"
+        if not os.path.exists(manifest_path):
+            log.info(f"No analysis manifest found at '{manifest_path}'; all outputs will be treated as changed")
+            return cls(output_dir)
+
+        with open(manifest_path) as f:
+            entries = json.load(f)
+        log.info(f"Loaded an analysis manifest of {len(entries)} outputs from '{manifest_path}'")
+        return cls(output_dir, entries)
+
+    def save(self):
+        manifest_path = f"{self.output_dir}/{self.FILE_NAME}"
+        temp_path = f"{manifest_path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(temp_path, manifest_path)
+
+    @staticmethod
+    def hash_inputs(*inputs):
+        """
+        Computes a stable hash of the given inputs, e.g. the rows of a CSV or the frequencies and render settings of
+        a map.
+
+        :param inputs: JSON-serializable inputs to hash. Dictionaries are hashed independently of their key order.
+        :return: Hex SHA-256 of the inputs.
+        :rtype: str
+        """
+        serialized = json.dumps(inputs, sort_keys=True, default=str, separators=(",", ":"))
+        return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+    def _relative_path(self, output_path):
+        return os.path.relpath(output_path, self.output_dir)
+
+    def is_up_to_date(self, output_path, input_hash):
+        """
+        Checks whether the given output was last produced from inputs with the given hash, and still exists.
+
+        Either way, the output is registered as one of the outputs of this run, so it won't be removed by
+        `AnalysisManifest.remove_stale_outputs`.
+
+        :param output_path: Path to the output file.
+        :type output_path: str
+        :param input_hash: Hash of the inputs the output would be produced from, from `AnalysisManifest.hash_inputs`.
+        :type input_hash: str
+        :return: Whether the output can be kept as it is.
+        :rtype: bool
+        """
+        relative_path = self._relative_path(output_path)
+        self._current_outputs.add(relative_path)
+
+        entry = self.entries.get(relative_path)
+        return entry is not None and entry["InputHash"] == input_hash and os.path.exists(output_path)
+
+    def invalidate_all(self):
+        """
+        Forgets the input and uploaded hashes of all the outputs in the manifest, so that every output is treated as
+        changed, both when deciding whether to regenerate it and when deciding whether to upload it.
+
+        The uploaded hashes have to be forgotten too because regenerating an output from the same inputs records the
+        same input hash, e.g. when it is regenerated after a change to how the maps are styled.
+        """
+        for entry in self.entries.values():
+            entry["InputHash"] = None
+            entry["UploadedHash"] = None
+
+    def record(self, output_path, input_hash):
+        """
+        Records that the given output has been produced from inputs with the given hash.
+
+        :param output_path: Path to the output file.
+        :type output_path: str
+        :param input_hash: Hash of the inputs the output was produced from, from `AnalysisManifest.hash_inputs`.
+        :type input_hash: str
+        """
+        relative_path = self._relative_path(output_path)
+        self._current_outputs.add(relative_path)
+
+        entry = self.entries.setdefault(relative_path, {"UploadedHash": None})
+        entry["InputHash"] = input_hash
+
+    def remove_stale_outputs(self):
+        """
+        Deletes the outputs in the manifest which weren't produced or kept by this run e.g. maps which are no longer
+        configured, and removes them from the manifest.
+        """
+        for relative_path in list(self.entries.keys()):
+            if relative_path in self._current_outputs:
+                continue
+
+            output_path = f"{self.output_dir}/{relative_path}"
+            log.info(f"Removing stale analysis output '{output_path}'")
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            del self.entries[relative_path]
+
+    def get_changed_outputs(self, output_paths):
+        """
+        Filters the given output paths for the outputs which have changed since they were last uploaded.
+
+        Outputs which aren't in the manifest are always considered changed.
+
+        :param output_paths: Paths to the output files.
+        :type output_paths: iterable of str
+        :return: The paths in `output_paths` which need uploading.
+        :rtype: list of str
+        """
+        changed_paths = []
+        for output_path in output_paths:
+            entry = self.entries.get(self._relative_path(output_path))
+            if entry is None or entry["UploadedHash"] != entry["InputHash"]:
+                changed_paths.append(output_path)
+        return changed_paths
+
+    def mark_uploaded(self, output_paths):
+        """
+        Records that the given outputs have been uploaded in their current state.
+
+        :param output_paths: Paths to the output files.
+        :type output_paths: iterable of str
+        """
+        for output_path in output_paths:
+            entry = self.entries.get(self._relative_path(output_path))
+            if entry is not None:
+                entry["UploadedHash"] = entry["InputHash"]
@@ -0,0 +1,90 @@
+import json
+
+from core_data_modules.logging import Logger
+from core_data_modules.util import IOUtils
+
+from src.lib import PipelineConfiguration
+
+log = Logger(__name__)
+
+
+class AnalysisSnapshot(object):
+    """
+    Flat snapshot of the analysis datasets, containing only the current values of the keys needed by automated
+    analysis.
+
+    The snapshot is written as JSONL with one flat object per line, so it can be loaded without rebuilding the
+    TracedData history chains of the messages and individuals datasets.
+    """
+
+    @staticmethod
+    def get_analysis_keys(consent_withdrawn_key):
+        """
+        :param consent_withdrawn_key: Key in each TracedData of the consent withdrawn field.
+        :type consent_withdrawn_key: str
+        :return: The keys which automated analysis reads from each TracedData.
+        :rtype: list of str
+        """
+        keys = ["uid", consent_withdrawn_key]
+        for plan in PipelineConfiguration.RQA_CODING_PLANS:
+            keys.append(plan.raw_field)
+        for plan in PipelineConfiguration.RQA_CODING_PLANS + PipelineConfiguration.SURVEY_CODING_PLANS + \
+                PipelineConfiguration.DEMOG_CODING_PLANS:
+            for cc in plan.coding_configurations:
+                keys.append(cc.coded_field)
+
+        # De-duplicate while preserving the order.
+        return list(dict.fromkeys(keys))
+
+    @classmethod
+    def take_snapshot(cls, data, consent_withdrawn_key):
+        """
+        Takes an in-memory snapshot of the analysis keys in each of the given TracedData, in the same format as
+        `AnalysisSnapshot.import_jsonl` returns.
+
+        Keys which are not set in a TracedData object are omitted from that object's snapshot.
+
+        :param data: TracedData objects to snapshot.
+        :type data: iterable of TracedData
+        :param consent_withdrawn_key: Key in each TracedData of the consent withdrawn field.
+        :type consent_withdrawn_key: str
+        :return: The snapshot, as one dictionary of analysis key -> value per TracedData.
+        :rtype: list of dict
+        """
+        keys = cls.get_analysis_keys(consent_withdrawn_key)
+        return [{key: td[key] for key in keys if key in td} for td in data]
+
+    @classmethod
+    def export_to_jsonl(cls, data, output_path, consent_withdrawn_key):
+        """
+        Exports a snapshot of the analysis keys in each of the given TracedData to a JSONL file.
+
+        Keys which are not set in a TracedData object are omitted from that object's snapshot.
+
+        :param data: TracedData objects to snapshot.
+        :type data: iterable of TracedData
+        :param output_path: Path to write the snapshot to.
+        :type output_path: str
+        :param consent_withdrawn_key: Key in each TracedData of the consent withdrawn field.
+        :type consent_withdrawn_key: str
+        """
+        keys = cls.get_analysis_keys(consent_withdrawn_key)
+
+        IOUtils.ensure_dirs_exist_for_file(output_path)
+        with open(output_path, "w") as f:
+            for td in data:
+                record = {key: td[key] for key in keys if key in td}
+                f.write(json.dumps(record))
+                f.write("\n")
+
+    @staticmethod
+    def import_jsonl(f):
+        """
+        Imports an analysis snapshot exported by `AnalysisSnapshot.export_to_jsonl`.
+
+        :param f: File to read the snapshot from.
+        :type f: file-like
+        :return: The snapshot, as one dictionary of analysis key -> value per TracedData.
+        :rtype: list of dict
+        """
+        return [json.loads(line) for line in f if line.strip() != ""]
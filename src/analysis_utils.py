@@ -1,3 +1,4 @@
+import numpy as np
 from core_data_modules.cleaners import Codes
 from core_data_modules.data_models.code_scheme import CodeTypes
 
@@ -5,6 +6,15 @@ from src.lib.configuration_objects import CodingModes
 
 
 class AnalysisUtils(object):
+    # Bit flags used in the status matrices computed by `AnalysisUtils.compute_status_matrix`.
+    RESPONDED = 1
+    LABELLED = 2
+    RELEVANT = 4
+    CONSENT_WITHDRAWN = 8
+    # Not stored in the status matrices; used by `AnalysisUtils.status_mask` to select RESPONDED and not
+    # CONSENT_WITHDRAWN.
+    OPT_IN = 16
+
     @staticmethod
     def _get_td_codes_for_coding_configuration(td, cc):
         """
@@ -279,3 +289,149 @@ class AnalysisUtils(object):
                     relevant.append(td)
                     break
         return relevant
+
+    @staticmethod
+    def _index_code_scheme(cc):
+        """
+        Returns the sets of code ids in the code scheme of the given coding configuration that are needed to compute
+        the status flags.
+
+        :param cc: Coding configuration.
+        :type cc: src.lib.pipeline_configuration.CodingConfiguration
+        :return: Tuple of (code ids which are TRUE_MISSING or SKIPPED, code ids which are NOT_REVIEWED,
+                 code ids which are NORMAL).
+        :rtype: (set of str, set of str, set of str)
+        """
+        missing_code_ids = set()
+        not_reviewed_code_ids = set()
+        normal_code_ids = set()
+        for code in cc.code_scheme.codes:
+            if code.control_code == Codes.TRUE_MISSING or code.control_code == Codes.SKIPPED:
+                missing_code_ids.add(code.code_id)
+            if code.control_code == Codes.NOT_REVIEWED:
+                not_reviewed_code_ids.add(code.code_id)
+            if code.code_type == CodeTypes.NORMAL:
+                normal_code_ids.add(code.code_id)
+        return missing_code_ids, not_reviewed_code_ids, normal_code_ids
+
+    @classmethod
+    def compile_status_index(cls, coding_plans):
+        """
+        Compiles the per-plan code id lookups needed by `AnalysisUtils.compute_status`.
+
+        :param coding_plans: Coding plans to compute statuses under.
+        :type coding_plans: list of src.lib.pipeline_configuration.CodingPlan
+        :return: Status index, for use with `AnalysisUtils.compute_status`.
+        :rtype: list of list of (str, str, (set of str, set of str, set of str))
+        """
+        return [
+            [(cc.coded_field, cc.coding_mode, cls._index_code_scheme(cc)) for cc in plan.coding_configurations]
+            for plan in coding_plans
+        ]
+
+    @classmethod
+    def compute_status(cls, td, consent_withdrawn_key, status_index, out):
+        """
+        Computes the status flags of a single TracedData object under each of the plans in a status index.
+
+        The flags have the same definitions as `AnalysisUtils.responded`, `AnalysisUtils.labelled`,
+        `AnalysisUtils.relevant` and `AnalysisUtils.withdrew_consent`.
+
+        :param td: TracedData to compute the status of.
+        :type td: TracedData
+        :param consent_withdrawn_key: Key in the TracedData of the consent withdrawn field.
+        :type consent_withdrawn_key: str
+        :param status_index: Status index compiled by `AnalysisUtils.compile_status_index`.
+        :type status_index: list
+        :param out: Array to write the bitwise-or of the status flags under each plan to, e.g. a row of a status
+                    matrix.
+        :type out: numpy.ndarray of uint8
+        """
+        withdrew_consent = td[consent_withdrawn_key] == Codes.TRUE
+
+        for j, cc_indexes in enumerate(status_index):
+            status = cls.CONSENT_WITHDRAWN if withdrew_consent else 0
+            labelled = True
+            for k, (coded_field, coding_mode, (missing_ids, not_reviewed_ids, normal_ids)) in enumerate(cc_indexes):
+                if coding_mode == CodingModes.SINGLE:
+                    code_ids = [td[coded_field]["CodeID"]]
+                else:
+                    code_ids = [label["CodeID"] for label in td[coded_field]]
+
+                # Responded is determined by the first coding configuration only, matching `AnalysisUtils.responded`.
+                if k == 0:
+                    assert len(code_ids) >= 1
+                    if len(code_ids) > 1:
+                        for code_id in code_ids:
+                            assert code_id not in missing_ids
+                        status |= cls.RESPONDED
+                    elif code_ids[0] not in missing_ids:
+                        status |= cls.RESPONDED
+
+                if len(code_ids) == 0 or any(code_id in not_reviewed_ids for code_id in code_ids):
+                    labelled = False
+
+                if not withdrew_consent and any(code_id in normal_ids for code_id in code_ids):
+                    status |= cls.RELEVANT
+
+            if not withdrew_consent and labelled and status & cls.RESPONDED:
+                status |= cls.LABELLED
+
+            out[j] = status
+
+    @classmethod
+    def compute_status_matrix(cls, data, consent_withdrawn_key, coding_plans):
+        """
+        Computes the responded, labelled, relevant and consent withdrawn status of every object in `data` under each of
+        the given coding plans, in a single pass over `data`.
+
+        Use `AnalysisUtils.status_mask` to filter or count the objects with a given status.
+
+        :param data: Message or participant data to compute the statuses of.
+        :type data: list of TracedData
+        :param consent_withdrawn_key: Key in the TracedData of the consent withdrawn field.
+        :type consent_withdrawn_key: str
+        :param coding_plans: Coding plans specifying the fields in each TracedData object in `data` to look up.
+        :type coding_plans: list of src.lib.pipeline_configuration.CodingPlan
+        :return: Matrix of shape (len(data), len(coding_plans)) of the bitwise-or of the `AnalysisUtils` status flags
+                 that apply to each object under each plan.
+        :rtype: numpy.ndarray of uint8
+        """
+        status_index = cls.compile_status_index(coding_plans)
+
+        status_matrix = np.zeros((len(data), len(coding_plans)), dtype=np.uint8)
+        for i, td in enumerate(data):
+            cls.compute_status(td, consent_withdrawn_key, status_index, status_matrix[i])
+
+        return status_matrix
+
+    @classmethod
+    def status_mask(cls, status_matrix, flag, plan_indices=None, require_all=False):
+        """
+        Returns a boolean mask of the objects in a status matrix which have the given status under any (or all) of the
+        given plans.
+
+        :param status_matrix: Status matrix computed by `AnalysisUtils.compute_status_matrix`.
+        :type status_matrix: numpy.ndarray of uint8
+        :param flag: Status flag to check for. One of `AnalysisUtils.RESPONDED`, `AnalysisUtils.LABELLED`,
+                     `AnalysisUtils.RELEVANT`, or `AnalysisUtils.OPT_IN` for "responded and did not withdraw consent"
+                     (see `AnalysisUtils.opt_in`).
+        :type flag: int
+        :param plan_indices: Indices of the columns (coding plans) in `status_matrix` to check, or None to check all.
+        :type plan_indices: list of int | None
+        :param require_all: If True, requires the status to hold under all of the plans, rather than any.
+        :type require_all: bool
+        :return: Mask of shape (len(status_matrix),).
+        :rtype: numpy.ndarray of bool
+        """
+        if plan_indices is not None:
+            status_matrix = status_matrix[:, plan_indices]
+
+        if flag == cls.OPT_IN:
+            matches = (status_matrix & (cls.RESPONDED | cls.CONSENT_WITHDRAWN)) == cls.RESPONDED
+        else:
+            matches = (status_matrix & flag) != 0
+
+        if require_all:
+            return matches.all(axis=1)
+        return matches.any(axis=1)
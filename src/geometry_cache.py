@@ -0,0 +1,172 @@
+import argparse
+import hashlib
+import os
+import pickle
+
+import geopandas
+from core_data_modules.logging import Logger
+
+log = Logger(__name__)
+
+
+class GeometryCache(object):
+    # Default matplotlib figure width, in inches.
+    FIGURE_WIDTH_INCHES = 6.4
+
+    def __init__(self, cache_dir="geojson/cache"):
+        """
+        Cache of geojson files converted to pickled GeoDataFrames, which are much faster to load than parsing the
+        geojson text.
+
+        Cache entries are keyed by the SHA-256 of the source file and by the simplification tolerance, so editing a
+        geojson file or changing the output resolution never returns stale geometry.
+
+        So that loading from the cache doesn't have to read and hash the whole geojson file, each file's SHA-256 is
+        recorded in the cache against its path, size and modification time, and a file is only re-hashed when one of
+        those changes.
+
+        :param cache_dir: Directory to store the cached GeoDataFrames in.
+        :type cache_dir: str
+        """
+        self.cache_dir = cache_dir
+        self._content_hashes = dict()  # of (path, size, modification time) -> SHA-256 of the file at that path
+
+    @classmethod
+    def simplify_tolerance_for_dpi(cls, geo_data, dpi, zoom=1):
+        """
+        Returns a simplification tolerance which removes only detail smaller than half a pixel when `geo_data` is
+        drawn across the width of a default-sized matplotlib figure at the given dpi.
+
+        :param geo_data: GeoData which will be drawn.
+        :type geo_data: geopandas.GeoDataFrame
+        :param dpi: Resolution the map will be saved at.
+        :type dpi: int
+        :param zoom: Largest zoom factor the geometry will be drawn at e.g. in an inset map.
+        :type zoom: float
+        :return: Simplification tolerance, in the units of the geometry's coordinate system.
+        :rtype: float
+        """
+        min_x, min_y, max_x, max_y = geo_data.total_bounds
+        pixel_size = (max_x - min_x) / (cls.FIGURE_WIDTH_INCHES * dpi)
+        return pixel_size / 2 / zoom
+
+    @staticmethod
+    def _hash_file(path):
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def _get_content_hash(self, geojson_path):
+        stat = os.stat(geojson_path)
+        stamp = (os.path.abspath(geojson_path), stat.st_size, stat.st_mtime_ns)
+        if stamp in self._content_hashes:
+            return self._content_hashes[stamp]
+
+        name = os.path.splitext(os.path.basename(geojson_path))[0]
+        stamp_hash = hashlib.sha256(repr(stamp).encode("utf-8")).hexdigest()
+        stamp_path = f"{self.cache_dir}/{name}-{stamp_hash[:16]}.sha256"
+        try:
+            with open(stamp_path, "r") as f:
+                content_hash = f.read().strip()
+        except FileNotFoundError:
+            content_hash = self._hash_file(geojson_path)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = f"{stamp_path}.{os.getpid()}.tmp"
+            with open(temp_path, "w") as f:
+                f.write(content_hash)
+            os.replace(temp_path, stamp_path)
+
+        self._content_hashes[stamp] = content_hash
+        return content_hash
+
+    def _get_cache_path(self, geojson_path, dpi, zoom, tolerance):
+        name = os.path.splitext(os.path.basename(geojson_path))[0]
+        if tolerance is not None:
+            level = f"tolerance-{tolerance:g}"
+        elif dpi is not None:
+            level = f"dpi-{dpi}-zoom-{zoom:g}"
+        else:
+            level = "full"
+        return f"{self.cache_dir}/{name}-{self._get_content_hash(geojson_path)[:16]}-{level}.pickle"
+
+    def _build(self, geojson_path, cache_path, dpi, zoom, tolerance):
+        log.info(f"Converting '{geojson_path}' to cached geometry '{cache_path}'...")
+        geo_data = geopandas.read_file(geojson_path)
+        if tolerance is None and dpi is not None:
+            tolerance = self.simplify_tolerance_for_dpi(geo_data, dpi, zoom)
+        if tolerance is not None:
+            geo_data["geometry"] = geo_data.geometry.simplify(tolerance, preserve_topology=True)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Write to a temporary file first so that concurrent readers never see a partially written cache entry.
+        temp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            pickle.dump(geo_data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cache_path)
+
+        return geo_data
+
+    def ensure_cached(self, geojson_path, dpi=None, zoom=1, tolerance=None):
+        """
+        Converts the given geojson file into the cache, if it isn't already cached.
+
+        :param geojson_path: Path to the geojson file.
+        :type geojson_path: str
+        :param dpi: See `GeometryCache.load`.
+        :type dpi: int | None
+        :param zoom: See `GeometryCache.load`.
+        :type zoom: float
+        :param tolerance: See `GeometryCache.load`.
+        :type tolerance: float | None
+        """
+        cache_path = self._get_cache_path(geojson_path, dpi, zoom, tolerance)
+        if not os.path.exists(cache_path):
+            self._build(geojson_path, cache_path, dpi, zoom, tolerance)
+
+    def load(self, geojson_path, dpi=None, zoom=1, tolerance=None):
+        """
+        Loads the given geojson file, from the cache if possible.
+
+        :param geojson_path: Path to the geojson file.
+        :type geojson_path: str
+        :param dpi: Resolution the geometry will be drawn at. If not None, the geometry is simplified to remove detail
+                    that would not be visible at this resolution (see `GeometryCache.simplify_tolerance_for_dpi`).
+                    If None, the full geometry is returned.
+        :type dpi: int | None
+        :param zoom: Largest zoom factor the geometry will be drawn at. Only used if `dpi` is not None.
+        :type zoom: float
+        :param tolerance: Explicit simplification tolerance, in the units of the geometry's coordinate system, or None.
+                          If not None, this is used instead of the tolerance derived from `dpi`.
+        :type tolerance: float | None
+        :return: The geo data in the geojson file.
+        :rtype: geopandas.GeoDataFrame
+        """
+        cache_path = self._get_cache_path(geojson_path, dpi, zoom, tolerance)
+        try:
+            with open(cache_path, "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return self._build(geojson_path, cache_path, dpi, zoom, tolerance)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Converts geojson files into the geometry cache")
+
+    parser.add_argument("--cache-dir", default="geojson/cache",
+                        help="Directory to store the cached geometry in")
+    parser.add_argument("--dpi", type=int, default=None,
+                        help="Resolution to simplify the geometry for. If not set, caches the full geometry")
+    parser.add_argument("--zoom", type=float, default=1,
+                        help="Largest zoom factor the geometry will be drawn at")
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help="Explicit simplification tolerance to use instead of the one derived from --dpi")
+    parser.add_argument("geojson_paths", metavar="geojson-paths", nargs="+",
+                        help="Paths to the geojson files to cache")
+
+    args = parser.parse_args()
+
+    geometry_cache = GeometryCache(args.cache_dir)
+    for geojson_path in args.geojson_paths:
+        geometry_cache.ensure_cached(geojson_path, args.dpi, args.zoom, args.tolerance)
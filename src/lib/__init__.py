@@ -2,3 +2,5 @@ from .consent_utils import ConsentUtils
 from .icr_tools import ICRTools
 from .message_filters import MessageFilters
 from .pipeline_configuration import PipelineConfiguration
+from .concurrent_output_writer import ConcurrentOutputWriter
+from .reservoir_sampler import ReservoirSampler
@@ -0,0 +1,176 @@
+import base64
+import hashlib
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from core_data_modules.logging import Logger
+
+log = Logger(__name__)
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+class GCloudBucket(object):
+    def __init__(self, google_cloud_credentials_file_path):
+        """
+        Reads blobs and their metadata from Google Cloud Storage.
+
+        :param google_cloud_credentials_file_path: Path to a Google Cloud service account credentials file to use to
+                                                   access the blobs.
+        :type google_cloud_credentials_file_path: str
+        """
+        self.google_cloud_credentials_file_path = google_cloud_credentials_file_path
+        self._thread_local = threading.local()
+
+    def _get_client(self):
+        # Each thread uses its own client, so that threads never share an HTTP session.
+        if not hasattr(self._thread_local, "client"):
+            from google.cloud import storage
+            self._thread_local.client = storage.Client.from_service_account_json(
+                self.google_cloud_credentials_file_path)
+        return self._thread_local.client
+
+    def get_checksums(self, blob_url):
+        """
+        :param blob_url: GS URL of the blob to get the checksums of.
+        :type blob_url: str
+        :return: The blob's base64-encoded MD5 and CRC32C checksums. The MD5 is None for composite blobs.
+        :rtype: (str | None, str)
+        """
+        parsed_url = urlparse(blob_url)
+        blob = self._get_client().bucket(parsed_url.netloc).get_blob(parsed_url.path.lstrip("/"))
+        assert blob is not None, f"Blob '{blob_url}' does not exist"
+        return blob.md5_hash, blob.crc32c
+
+    def download_to_file(self, blob_url, f):
+        """
+        Streams a blob to a file.
+
+        :param blob_url: GS URL of the blob to download.
+        :type blob_url: str
+        :param f: File to write the blob to.
+        :type f: file-like
+        """
+        self._get_client().download_blob_to_file(blob_url, f)
+
+
+class LocalDirectoryBucket(object):
+    def __init__(self, root_dir):
+        """
+        Filesystem-backed stand-in for `GCloudBucket`, for testing or running the pipeline offline.
+
+        The blob at "gs://<bucket>/<path>" is read from "<root_dir>/<bucket>/<path>".
+
+        :param root_dir: Directory containing a sub-directory for each bucket.
+        :type root_dir: str
+        """
+        self.root_dir = root_dir
+
+    def _get_path(self, blob_url):
+        parsed_url = urlparse(blob_url)
+        return os.path.join(self.root_dir, parsed_url.netloc, parsed_url.path.lstrip("/"))
+
+    def get_checksums(self, blob_url):
+        path = self._get_path(blob_url)
+        assert os.path.exists(path), f"Blob '{blob_url}' does not exist"
+        return compute_md5(path), None
+
+    def download_to_file(self, blob_url, f):
+        with open(self._get_path(blob_url), "rb") as blob_file:
+            shutil.copyfileobj(blob_file, f, _CHUNK_SIZE)
+
+
+def compute_md5(file_path):
+    """
+    :param file_path: Path to the file to checksum.
+    :type file_path: str
+    :return: Base64-encoded MD5 checksum of the file, in the format Google Cloud Storage reports checksums in.
+    :rtype: str
+    """
+    md5 = hashlib.md5()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            md5.update(chunk)
+    return base64.b64encode(md5.digest()).decode("ascii")
+
+
+def compute_crc32c(file_path):
+    """
+    :param file_path: Path to the file to checksum.
+    :type file_path: str
+    :return: Base64-encoded CRC32C checksum of the file, in the format Google Cloud Storage reports checksums in.
+    :rtype: str
+    """
+    import google_crc32c
+
+    crc32c = google_crc32c.Checksum()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            crc32c.update(chunk)
+    return base64.b64encode(crc32c.digest()).decode("ascii")
+
+
+class BlobDownloadManager(object):
+    def __init__(self, bucket, max_concurrent_downloads=4):
+        """
+        Downloads blobs to local files, skipping blobs whose local copy already has the same contents.
+
+        Blobs are compared with their local copies by MD5 checksum, or by CRC32C checksum for composite blobs which
+        don't have an MD5. The changed blobs are downloaded concurrently, and streamed to disk.
+
+        :param bucket: Bucket to download blobs from.
+        :type bucket: GCloudBucket | LocalDirectoryBucket
+        :param max_concurrent_downloads: Maximum number of blobs to check or download at once.
+        :type max_concurrent_downloads: int
+        """
+        self.bucket = bucket
+        self.max_concurrent_downloads = max_concurrent_downloads
+
+    def _is_up_to_date(self, blob_url, output_path):
+        if not os.path.exists(output_path):
+            return False
+
+        md5, crc32c = self.bucket.get_checksums(blob_url)
+        if md5 is not None:
+            return compute_md5(output_path) == md5
+        return compute_crc32c(output_path) == crc32c
+
+    def _download_if_changed(self, blob_url, output_path):
+        if self._is_up_to_date(blob_url, output_path):
+            log.info(f"File '{output_path}' is up to date with '{blob_url}'; skipping download")
+            return False
+
+        log.info(f"Downloading '{blob_url}' to '{output_path}'...")
+        # Write to a temporary file first so that a partially downloaded blob is never mistaken for a complete one.
+        temp_path = f"{output_path}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                self.bucket.download_to_file(blob_url, f)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        os.replace(temp_path, output_path)
+        log.info(f"Downloaded '{blob_url}'")
+        return True
+
+    def download_changed(self, blob_urls_to_output_paths):
+        """
+        Downloads each of the given blobs whose local copy is missing or differs from the blob.
+
+        :param blob_urls_to_output_paths: Dictionary of GS URL of a blob -> path to download it to.
+        :type blob_urls_to_output_paths: dict of str -> str
+        :return: URLs of the blobs which were downloaded.
+        :rtype: list of str
+        """
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_downloads) as executor:
+            futures = {
+                blob_url: executor.submit(self._download_if_changed, blob_url, output_path)
+                for blob_url, output_path in blob_urls_to_output_paths.items()
+            }
+            downloaded_blob_urls = [blob_url for blob_url, future in futures.items() if future.result()]
+
+        log.info(f"Downloaded {len(downloaded_blob_urls)} new or changed blobs, of {len(futures)} blobs")
+        return downloaded_blob_urls
@@ -0,0 +1,138 @@
+import json
+import os
+import threading
+
+from core_data_modules.logging import Logger
+from core_data_modules.util import IOUtils
+
+log = Logger(__name__)
+
+
+class CachedUuidTable(object):
+    def __init__(self, uuid_table, cache_path, encryption_key):
+        """
+        Wraps a data <-> uuid table (e.g. a `FirestoreUuidTable`) with a persistent local cache of the mappings it has
+        already returned, so that data seen on previous runs of the pipeline can be de-identified without any remote
+        lookups.
+
+        Lookups are answered from the cache first. Each call to `data_to_uuid_batch` or `uuid_to_data_batch` sends
+        all of its cache misses to the wrapped table in a single batch lookup.
+
+        The cache contains the raw data being de-identified (e.g. phone numbers), so it is encrypted at rest with
+        Fernet (AES-128 in CBC mode with an HMAC-SHA256 signature), using the `cryptography` library.
+
+        The wrapped table only needs to implement `data_to_uuid_batch` and `uuid_to_data_batch`, so an in-memory fake
+        table can be used in place of Firestore when testing.
+
+        :param uuid_table: Table to look up the cache misses in.
+        :type uuid_table: id_infrastructure.firestore_uuid_table.FirestoreUuidTable
+        :param cache_path: Path to the encrypted cache file. If this file exists, the cache is initialised from it.
+        :type cache_path: str
+        :param encryption_key: Fernet key to encrypt the cache file with, as a url-safe base64-encoded string of
+                               32 bytes, e.g. as generated by `cryptography.fernet.Fernet.generate_key()`.
+        :type encryption_key: str | bytes
+        """
+        # Imported here so the `cryptography` library is only needed by pipelines which use a cache.
+        from cryptography.fernet import Fernet
+
+        self.uuid_table = uuid_table
+        self.cache_path = cache_path
+
+        self._fernet = Fernet(encryption_key)
+        self._data_to_uuid = dict()  # of data -> uuid
+        self._uuid_to_data = dict()  # of uuid -> data
+        self._dirty = False
+        # Held while looking up mappings, so that raw data sources fetched concurrently can share this table.
+        self._lock = threading.Lock()
+        self.remote_lookups = 0
+
+        if os.path.exists(cache_path):
+            self._load()
+
+    def _load(self):
+        with open(self.cache_path, "rb") as f:
+            self._data_to_uuid = json.loads(self._fernet.decrypt(f.read()).decode("utf-8"))
+        self._uuid_to_data = {uuid: data for data, uuid in self._data_to_uuid.items()}
+        log.info(f"Loaded {len(self._data_to_uuid)} cached uuid mappings from '{self.cache_path}'")
+
+    def _add_mappings(self, data_to_uuid):
+        for data, uuid in data_to_uuid.items():
+            self._data_to_uuid[data] = uuid
+            self._uuid_to_data[uuid] = data
+        if len(data_to_uuid) > 0:
+            self._dirty = True
+
+    def data_to_uuid_batch(self, list_of_data_requested):
+        """
+        :param list_of_data_requested: Data to look up the uuids of.
+        :type list_of_data_requested: iterable of str
+        :return: Dictionary of data -> uuid, for each of the requested data.
+        :rtype: dict of str -> str
+        """
+        list_of_data_requested = set(list_of_data_requested)
+        with self._lock:
+            return self._data_to_uuid_batch(list_of_data_requested)
+
+    def _data_to_uuid_batch(self, list_of_data_requested):
+        misses = [data for data in list_of_data_requested if data not in self._data_to_uuid]
+        if len(misses) > 0:
+            log.info(f"Looking up {len(misses)} of {len(list_of_data_requested)} requested uuids in the "
+                     f"remote table...")
+            self.remote_lookups += 1
+            self._add_mappings(self.uuid_table.data_to_uuid_batch(misses))
+
+        return {data: self._data_to_uuid[data] for data in list_of_data_requested}
+
+    def data_to_uuid(self, data):
+        """
+        :param data: Data to look up the uuid of.
+        :type data: str
+        :return: Uuid of the data.
+        :rtype: str
+        """
+        return self.data_to_uuid_batch([data])[data]
+
+    def uuid_to_data_batch(self, uuids_to_lookup):
+        """
+        :param uuids_to_lookup: Uuids to look up the data of.
+        :type uuids_to_lookup: iterable of str
+        :return: Dictionary of uuid -> data, for each of the requested uuids.
+        :rtype: dict of str -> str
+        """
+        uuids_to_lookup = set(uuids_to_lookup)
+        with self._lock:
+            return self._uuid_to_data_batch(uuids_to_lookup)
+
+    def _uuid_to_data_batch(self, uuids_to_lookup):
+        misses = [uuid for uuid in uuids_to_lookup if uuid not in self._uuid_to_data]
+        if len(misses) > 0:
+            log.info(f"Looking up {len(misses)} of {len(uuids_to_lookup)} requested uuids in the remote table...")
+            self.remote_lookups += 1
+            self._add_mappings({data: uuid for uuid, data in self.uuid_table.uuid_to_data_batch(misses).items()})
+
+        return {uuid: self._uuid_to_data[uuid] for uuid in uuids_to_lookup}
+
+    def uuid_to_data(self, uuid_to_lookup):
+        """
+        :param uuid_to_lookup: Uuid to look up the data of.
+        :type uuid_to_lookup: str
+        :return: Data which maps to the uuid.
+        :rtype: str
+        """
+        return self.uuid_to_data_batch([uuid_to_lookup])[uuid_to_lookup]
+
+    def save(self):
+        """
+        Writes the cache to `cache_path`, encrypted, if any new mappings were looked up since it was last saved.
+        """
+        if not self._dirty:
+            log.info(f"No new uuid mappings to save to '{self.cache_path}'")
+            return
+
+        IOUtils.ensure_dirs_exist_for_file(self.cache_path)
+        temp_path = f"{self.cache_path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(self._fernet.encrypt(json.dumps(self._data_to_uuid).encode("utf-8")))
+        os.replace(temp_path, self.cache_path)
+        self._dirty = False
+        log.info(f"Saved {len(self._data_to_uuid)} uuid mappings to '{self.cache_path}'")
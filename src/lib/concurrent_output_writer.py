@@ -0,0 +1,90 @@
+import multiprocessing
+import time
+
+from core_data_modules.logging import Logger
+
+log = Logger(__name__)
+
+
+class ConcurrentOutputWriter(object):
+    """
+    Writes independent output files in parallel worker processes.
+
+    Workers are started with the 'fork' start method, so each one sees a copy-on-write snapshot of the data that was
+    in memory when `run` (or `start`) was called. Nothing needs to be pickled, but jobs must treat the data as
+    read-only because changes made in a worker are not visible to the parent process or to the other workers.
+
+    On platforms which don't support 'fork', the jobs are run one after another in the current process instead.
+    """
+    def __init__(self):
+        self._jobs = []  # of (description, func, args)
+        self._processes = []  # of (description, multiprocessing.Process)
+        self._start_time = None
+
+    def add_job(self, description, func, *args):
+        """
+        Queues an output to be written when `run` or `start` is called.
+
+        :param description: Description of the output, used in log messages.
+        :type description: str
+        :param func: Function which writes the output.
+        :type func: callable
+        :param args: Arguments to call `func` with.
+        """
+        self._jobs.append((description, func, args))
+
+    def start(self):
+        """
+        Starts all the queued jobs, without waiting for them to complete, so that the caller can carry on with other
+        work while the outputs are written. Call `wait` to block until they have completed.
+
+        On platforms which don't support 'fork', the jobs are run to completion before this method returns.
+        """
+        jobs = self._jobs
+        self._jobs = []
+
+        if "fork" not in multiprocessing.get_all_start_methods():
+            log.warning("The 'fork' start method is not supported on this platform; writing outputs sequentially")
+            for description, func, args in jobs:
+                log.info(f"Writing {description}...")
+                func(*args)
+            return
+
+        context = multiprocessing.get_context("fork")
+        self._start_time = time.time()
+        for description, func, args in jobs:
+            log.info(f"Writing {description} in a worker process...")
+            process = context.Process(target=func, args=args)
+            process.start()
+            self._processes.append((description, process))
+
+    def wait(self):
+        """
+        Blocks until all the jobs started by `start` have completed.
+
+        Raises an AssertionError if any of the jobs failed.
+        """
+        processes = self._processes
+        self._processes = []
+        if len(processes) == 0:
+            return
+
+        failed = []
+        for description, process in processes:
+            process.join()
+            if process.exitcode != 0:
+                failed.append(description)
+            else:
+                log.info(f"Wrote {description}")
+
+        assert len(failed) == 0, f"Failed to write {len(failed)}/{len(processes)} outputs: {', '.join(failed)}"
+        log.info(f"Wrote {len(processes)} outputs in {time.time() - self._start_time:.1f}s")
+
+    def run(self):
+        """
+        Runs all the queued jobs, blocking until they have all completed.
+
+        Raises an AssertionError if any of the jobs failed.
+        """
+        self.start()
+        self.wait()
@@ -29,6 +29,93 @@ class ConsentUtils(object):
                             return True
         return False
 
+    @staticmethod
+    def build_stop_code_index(coding_plans):
+        """
+        Builds an index of the code ids which have the control code Codes.STOP, for each coding configuration in the
+        given coding plans that has at least one STOP code.
+
+        :param coding_plans: Coding plans to index.
+        :type coding_plans: iterable of CodingPlan
+        :return: List of (coded_field, coding_mode, set of STOP code ids).
+        :rtype: list of (str, str, set of str)
+        """
+        stop_code_index = []
+        for plan in coding_plans:
+            for cc in plan.coding_configurations:
+                stop_code_ids = {code.code_id for code in cc.code_scheme.codes if code.control_code == Codes.STOP}
+                if len(stop_code_ids) > 0:
+                    stop_code_index.append((cc.coded_field, cc.coding_mode, stop_code_ids))
+        return stop_code_index
+
+    @classmethod
+    def get_stopped_uids(cls, data, coding_plans):
+        """
+        Returns the uids of all the TracedData objects that contain Codes.STOP under any of the given coding plans,
+        in a single pass over `data`.
+
+        :param data: TracedData objects to search for stop codes.
+        :type data: iterable of TracedData
+        :param coding_plans: Coding plans for the fields to search for stop codes.
+        :type coding_plans: iterable of CodingPlan
+        :return: The uids of the TracedData objects that contain a stop code.
+        :rtype: set of str
+        """
+        stop_code_index = cls.build_stop_code_index(coding_plans)
+
+        stopped_uids = set()
+        for td in data:
+            if td["uid"] in stopped_uids:
+                continue
+
+            for coded_field, coding_mode, stop_code_ids in stop_code_index:
+                if coding_mode == CodingModes.SINGLE:
+                    stopped = td[coded_field]["CodeID"] in stop_code_ids
+                else:
+                    stopped = any(label["CodeID"] in stop_code_ids for label in td[coded_field])
+
+                if stopped:
+                    stopped_uids.add(td["uid"])
+                    break
+
+        return stopped_uids
+
+    @staticmethod
+    def set_consent_withdrawn(user, data, stopped_uids, withdrawn_key="consent_withdrawn", set_stopped=False,
+                              additional_keys=None):
+        """
+        Sets <withdrawn_key> to Codes.TRUE for each TracedData object whose uid is in `stopped_uids`, and to Codes.FALSE
+        otherwise, using a single append per TracedData object.
+
+        :param user: Identifier of the user running this program, for TracedData Metadata.
+        :type user: str
+        :param data: TracedData objects to set consent for.
+        :type data: iterable of TracedData
+        :param stopped_uids: The uids of the participants who withdrew consent.
+        :type stopped_uids: set of str
+        :param withdrawn_key: Name of key to use for the consent withdrawn field.
+        :type withdrawn_key: str
+        :param set_stopped: Whether to also set every other key to Codes.STOP for the participants who withdrew
+                            consent, in the same append (see `ConsentUtils.set_stopped`).
+        :type set_stopped: bool
+        :param additional_keys: Additional keys to set to 'STOP' if `set_stopped` is True.
+        :type additional_keys: list of str | None
+        """
+        if additional_keys is None:
+            additional_keys = []
+
+        for td in data:
+            if td["uid"] not in stopped_uids:
+                td.append_data({withdrawn_key: Codes.FALSE}, Metadata(user, Metadata.get_call_location(), time.time()))
+                continue
+
+            if set_stopped:
+                consent_dict = {key: Codes.STOP for key in list(td.keys()) + additional_keys}
+            else:
+                consent_dict = dict()
+            consent_dict[withdrawn_key] = Codes.TRUE
+            td.append_data(consent_dict, Metadata(user, Metadata.get_call_location(), time.time()))
+
     @classmethod
     def determine_consent_withdrawn(cls, user, data, coding_plans, withdrawn_key="consent_withdrawn"):
         """
@@ -37,7 +124,8 @@ class ConsentUtils(object):
         TracedData objects where a stop code is found will have the key-value pair <withdrawn_key>: Codes.TRUE
         appended, or Codes.FALSE if no stop code is found.
 
-        Note that this does not actually set any other keys to Codes.STOP. Use Consent.set_stopped for this purpose.
+        Note that this does not actually set any other keys to Codes.STOP. Use Consent.set_stopped for this purpose,
+        or use `ConsentUtils.get_stopped_uids` and `ConsentUtils.set_consent_withdrawn` to do both in a single append.
 
         :param user: Identifier of the user running this program, for TracedData Metadata.
         :type user: str
@@ -48,20 +136,8 @@ class ConsentUtils(object):
         :param withdrawn_key: Name of key to use for the consent withdrawn field.
         :type withdrawn_key: str
         """
-        for td in data:
-            td.append_data({withdrawn_key: Codes.FALSE}, Metadata(user, Metadata.get_call_location(), time.time()))
-
-        stopped_uids = set()
-        for td in data:
-            if cls.td_has_stop_code(td, coding_plans):
-                stopped_uids.add(td["uid"])
-
-        for td in data:
-            if td["uid"] in stopped_uids:
-                td.append_data(
-                    {withdrawn_key: Codes.TRUE},
-                    Metadata(user, Metadata.get_call_location(), time.time())
-                )
+        stopped_uids = cls.get_stopped_uids(data, coding_plans)
+        cls.set_consent_withdrawn(user, data, stopped_uids, withdrawn_key)
 
     @staticmethod
     def set_stopped(user, data, withdrawn_key="consent_withdrawn", additional_keys=None):
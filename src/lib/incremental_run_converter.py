@@ -0,0 +1,154 @@
+import json
+import os
+from io import StringIO
+
+from core_data_modules.logging import Logger
+from core_data_modules.traced_data.io import TracedDataJsonIO
+from core_data_modules.util import IOUtils, SHAUtils
+
+log = Logger(__name__)
+
+
+class IncrementalRunConverter(object):
+    def __init__(self, rapid_pro, phone_number_uuid_table, test_contact_uuids):
+        """
+        Converts Rapid Pro runs to TracedData, re-converting only the runs which are new or were modified since the
+        previous conversion.
+
+        Alongside each exported `<flow>.jsonl`, a manifest `<flow>_manifest.json` records the run id, run modified_on,
+        and contact modified_on of the run that each line was converted from. On the next conversion, the lines of
+        runs which are unchanged are copied from the previous export as-is, so the cost of conversion tracks the
+        number of runs which changed rather than the total number of runs.
+
+        If the previous export can't be safely reused e.g. because the manifest is missing or the test contacts have
+        changed, all the runs are converted.
+
+        :param rapid_pro: Client to use to convert the runs.
+        :type rapid_pro: rapid_pro_tools.rapid_pro_client.RapidProClient
+        :param phone_number_uuid_table: Table to use to de-identify the contacts' phone numbers.
+        :type phone_number_uuid_table: id_infrastructure.firestore_uuid_table.FirestoreUuidTable
+        :param test_contact_uuids: Rapid Pro uuids of the test contacts.
+        :type test_contact_uuids: list of str
+        """
+        self.rapid_pro = rapid_pro
+        self.phone_number_uuid_table = phone_number_uuid_table
+        self.test_contact_uuids = test_contact_uuids
+
+        self._test_contact_uuids_hash = SHAUtils.sha_string(json.dumps(sorted(test_contact_uuids)))
+
+    @staticmethod
+    def get_manifest_path(traced_runs_path):
+        return f"{os.path.splitext(traced_runs_path)[0]}_manifest.json"
+
+    @staticmethod
+    def _get_run_version(run, contacts_index):
+        # The TracedData of a run depends on the run itself and on its contact, so a run must be re-converted if
+        # either of them has been modified.
+        return [run.id, str(run.modified_on), str(contacts_index[run.contact.uuid].modified_on)]
+
+    @staticmethod
+    def _is_convertible(run, contacts_index):
+        # Runs without a contact, or whose contact has no urns, are dropped by the converter.
+        return run.contact is not None and run.contact.uuid in contacts_index and \
+            len(contacts_index[run.contact.uuid].urns) > 0
+
+    def _load_previous_lines(self, traced_runs_path):
+        """
+        :return: Dictionary of [run id, run modified_on, contact modified_on] -> the line of the previous export that
+                 version of the run was converted to, or None if the previous export can't be reused.
+        :rtype: dict of tuple -> str | None
+        """
+        manifest_path = self.get_manifest_path(traced_runs_path)
+        if not os.path.exists(manifest_path) or not os.path.exists(traced_runs_path):
+            return None
+
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest["TestContactUuidsHash"] != self._test_contact_uuids_hash:
+            log.info(f"The test contacts have changed since '{traced_runs_path}' was exported")
+            return None
+
+        with open(traced_runs_path) as f:
+            lines = [line for line in f if line.strip() != ""]
+        if len(lines) != len(manifest["Runs"]):
+            log.warning(f"'{traced_runs_path}' does not match its manifest '{manifest_path}'")
+            return None
+
+        return {tuple(run_version): line for run_version, line in zip(manifest["Runs"], lines)}
+
+    def _convert_all(self, user, raw_runs, contacts):
+        return self.rapid_pro.convert_runs_to_traced_data(
+            user, raw_runs, contacts, self.phone_number_uuid_table, self.test_contact_uuids)
+
+    def convert_and_export(self, user, raw_runs, contacts_index, traced_runs_output_path):
+        """
+        Converts the given runs to TracedData and exports them to a JSONL file, re-using the previous export in
+        `traced_runs_output_path` for runs which haven't changed.
+
+        :param user: Identifier of the user running this program, for TracedData Metadata.
+        :type user: str
+        :param raw_runs: Runs to convert.
+        :type raw_runs: list of temba_client.v2.Run
+        :param contacts_index: Dictionary of Rapid Pro contact uuid -> contact.
+        :type contacts_index: dict of str -> temba_client.v2.Contact
+        :param traced_runs_output_path: Path to the JSONL file to export the TracedData to.
+        :type traced_runs_output_path: str
+        :return: Number of traced runs exported.
+        :rtype: int
+        """
+        convertible_runs = [run for run in raw_runs if self._is_convertible(run, contacts_index)]
+        run_versions = [self._get_run_version(run, contacts_index) for run in convertible_runs]
+
+        previous_lines = self._load_previous_lines(traced_runs_output_path)
+        if previous_lines is None:
+            previous_lines = dict()
+            log.info(f"No reusable previous export in '{traced_runs_output_path}', will convert all the runs")
+
+        changed_runs = [run for run, run_version in zip(convertible_runs, run_versions)
+                        if tuple(run_version) not in previous_lines]
+        log.info(f"Converting {len(changed_runs)} new or modified runs, and re-using "
+                 f"{len(convertible_runs) - len(changed_runs)} unchanged runs from the previous export...")
+
+        # Only the contacts of the changed runs are passed to the converter, so it doesn't need to re-index every
+        # contact.
+        changed_contacts = {run.contact.uuid: contacts_index[run.contact.uuid] for run in changed_runs}
+        traced_runs = self._convert_all(user, changed_runs, list(changed_contacts.values()))
+        changed_lines_file = StringIO()
+        TracedDataJsonIO.export_traced_data_iterable_to_jsonl(traced_runs, changed_lines_file)
+        changed_lines = [f"{line}\n" for line in changed_lines_file.getvalue().splitlines() if line.strip() != ""]
+
+        IOUtils.ensure_dirs_exist_for_file(traced_runs_output_path)
+        manifest_path = self.get_manifest_path(traced_runs_output_path)
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+
+        if len(changed_lines) != len(changed_runs):
+            # The converter dropped some runs that weren't expected to be dropped, so the exported lines can't be
+            # matched up to their runs. Fall back to converting and exporting every run, without a manifest, so the
+            # next conversion is a full conversion too.
+            log.warning(f"Converted {len(changed_lines)} TracedData from {len(changed_runs)} runs; the output can't "
+                        f"be matched up to the runs, so converting all the runs without a manifest")
+            contacts = {run.contact.uuid: contacts_index[run.contact.uuid] for run in convertible_runs}
+            traced_runs = self._convert_all(user, raw_runs, list(contacts.values()))
+            with open(traced_runs_output_path, "w") as f:
+                TracedDataJsonIO.export_traced_data_iterable_to_jsonl(traced_runs, f)
+            return len(traced_runs)
+
+        # Splice the changed lines into the unchanged lines of the previous export, in the order of the runs.
+        changed_lines_iter = iter(changed_lines)
+        temp_path = f"{traced_runs_output_path}.tmp"
+        with open(temp_path, "w") as f:
+            for run_version in run_versions:
+                line = previous_lines.get(tuple(run_version))
+                if line is None:
+                    line = next(changed_lines_iter)
+                f.write(line)
+        os.replace(temp_path, traced_runs_output_path)
+
+        with open(manifest_path, "w") as f:
+            json.dump({
+                "TestContactUuidsHash": self._test_contact_uuids_hash,
+                "Runs": run_versions
+            }, f)
+
+        return len(run_versions)
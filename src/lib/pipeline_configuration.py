@@ -10,12 +10,41 @@ from dateutil.parser import isoparse
 from configuration import coding_plans
 
 
+class _LazyCodingPlans(object):
+    def __init__(self, build):
+        """
+        Class attribute which builds its value for the loaded pipeline the first time it is accessed, then replaces
+        itself on the owning class with that value.
+
+        The coding plans reference most of the code schemes, so building them lazily means that scripts which load a
+        pipeline configuration but never use its coding plans don't read any code scheme files.
+
+        :param build: Function which builds this attribute's value, given the name of the pipeline.
+        :type build: func of str -> any
+        """
+        self.build = build
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        assert owner._pipeline_name is not None, \
+            f"Cannot access PipelineConfiguration.{self.name} before a pipeline configuration has been loaded"
+        value = self.build(owner._pipeline_name)
+        setattr(owner, self.name, value)
+        return value
+
+
 class PipelineConfiguration(object):
-    RQA_CODING_PLANS = []
-    DEMOG_CODING_PLANS = []
-    FOLLOW_UP_CODING_PLANS = []
-    SURVEY_CODING_PLANS = []
-    WS_CORRECT_DATASET_SCHEME = None
+    _pipeline_name = None  # Name of the loaded pipeline, which the coding plans are built for.
+
+    RQA_CODING_PLANS = _LazyCodingPlans(coding_plans.get_rqa_coding_plans)
+    DEMOG_CODING_PLANS = _LazyCodingPlans(coding_plans.get_demog_coding_plans)
+    FOLLOW_UP_CODING_PLANS = _LazyCodingPlans(coding_plans.get_follow_up_coding_plans)
+    SURVEY_CODING_PLANS = _LazyCodingPlans(
+        lambda pipeline_name: PipelineConfiguration.DEMOG_CODING_PLANS + PipelineConfiguration.FOLLOW_UP_CODING_PLANS)
+    WS_CORRECT_DATASET_SCHEME = _LazyCodingPlans(coding_plans.get_ws_correct_dataset_scheme)
 
     def __init__(self, pipeline_name, raw_data_sources, phone_number_uuid_table, timestamp_remappings,
                  rapid_pro_key_remappings, project_start_date, project_end_date, filter_test_messages, move_ws_messages,
@@ -70,12 +99,12 @@ class PipelineConfiguration(object):
         self.automated_analysis = automated_analysis
         self.bucket_dir_path = bucket_dir_path
 
-        PipelineConfiguration.RQA_CODING_PLANS = coding_plans.get_rqa_coding_plans(self.pipeline_name)
-        PipelineConfiguration.DEMOG_CODING_PLANS = coding_plans.get_demog_coding_plans(self.pipeline_name)
-        PipelineConfiguration.FOLLOW_UP_CODING_PLANS = coding_plans.get_follow_up_coding_plans(self.pipeline_name)
-        PipelineConfiguration.SURVEY_CODING_PLANS += PipelineConfiguration.DEMOG_CODING_PLANS
-        PipelineConfiguration.SURVEY_CODING_PLANS += PipelineConfiguration.FOLLOW_UP_CODING_PLANS
-        PipelineConfiguration.WS_CORRECT_DATASET_SCHEME = coding_plans.get_ws_correct_dataset_scheme(self.pipeline_name)
+        # The coding plans are built for this pipeline the first time they are accessed (see `_LazyCodingPlans`), and
+        # are then shared by every configuration loaded in this process.
+        assert PipelineConfiguration._pipeline_name in {None, self.pipeline_name}, \
+            f"Cannot load pipeline '{self.pipeline_name}' in a process which has already loaded pipeline " \
+            f"'{PipelineConfiguration._pipeline_name}'"
+        PipelineConfiguration._pipeline_name = self.pipeline_name
 
         self.validate()
 
@@ -181,7 +210,7 @@ class RawDataSource(ABC):
 
 class RapidProSource(RawDataSource):
     def __init__(self, domain, token_file_url, contacts_file_name, activation_flow_names, survey_flow_names,
-                 test_contact_uuids):
+                 test_contact_uuids, max_concurrent_flow_fetches=4):
         """
         :param domain: URL of the Rapid Pro server to download data from.
         :type domain: str
@@ -197,6 +226,8 @@ class RapidProSource(RawDataSource):
                                    Runs for any of those test contacts will be tagged with {'test_run': True},
                                    and dropped when the pipeline is run with "FilterTestMessages" set to true.
         :type test_contact_uuids: list of str
+        :param max_concurrent_flow_fetches: Maximum number of flows to download runs for at the same time.
+        :type max_concurrent_flow_fetches: int
         """
         self.domain = domain
         self.token_file_url = token_file_url
@@ -204,6 +235,7 @@ class RapidProSource(RawDataSource):
         self.activation_flow_names = activation_flow_names
         self.survey_flow_names = survey_flow_names
         self.test_contact_uuids = test_contact_uuids
+        self.max_concurrent_flow_fetches = max_concurrent_flow_fetches
 
         self.validate()
 
@@ -221,9 +253,10 @@ class RapidProSource(RawDataSource):
         activation_flow_names = configuration_dict.get("ActivationFlowNames", [])
         survey_flow_names = configuration_dict.get("SurveyFlowNames", [])
         test_contact_uuids = configuration_dict.get("TestContactUUIDs", [])
+        max_concurrent_flow_fetches = configuration_dict.get("MaxConcurrentFlowFetches", 4)
 
         return cls(domain, token_file_url, contacts_file_name, activation_flow_names,
-                   survey_flow_names, test_contact_uuids)
+                   survey_flow_names, test_contact_uuids, max_concurrent_flow_fetches)
 
     def validate(self):
         validators.validate_string(self.domain, "domain")
@@ -242,6 +275,10 @@ class RapidProSource(RawDataSource):
         for i, contact_uuid in enumerate(self.test_contact_uuids):
             validators.validate_string(contact_uuid, f"test_contact_uuids[{i}]")
 
+        validators.validate_int(self.max_concurrent_flow_fetches, "max_concurrent_flow_fetches")
+        assert self.max_concurrent_flow_fetches > 0, \
+            f"max_concurrent_flow_fetches must be positive, but was {self.max_concurrent_flow_fetches}"
+
 
 class AbstractRemoteURLSource(RawDataSource):
     def __init__(self, activation_flow_urls, survey_flow_urls):
@@ -284,16 +321,21 @@ class RecoveryCSVSource(AbstractRemoteURLSource):
 
 
 class PhoneNumberUuidTable(object):
-    def __init__(self, firebase_credentials_file_url, table_name):
+    def __init__(self, firebase_credentials_file_url, table_name, cache_encryption_key_file_url=None):
         """
         :param firebase_credentials_file_url: GS URL to the private credentials file for the Firebase account where
                                                  the phone number <-> uuid table is stored.
         :type firebase_credentials_file_url: str
         :param table_name: Name of the data <-> uuid table in Firebase to use.
         :type table_name: str
+        :param cache_encryption_key_file_url: GS URL to a file containing a Fernet key to encrypt a local cache of the
+                                              phone number <-> uuid mappings with. If None, no local cache is kept
+                                              and every lookup is made against Firebase.
+        :type cache_encryption_key_file_url: str | None
         """
         self.firebase_credentials_file_url = firebase_credentials_file_url
         self.table_name = table_name
+        self.cache_encryption_key_file_url = cache_encryption_key_file_url
 
         self.validate()
 
@@ -301,13 +343,17 @@ class PhoneNumberUuidTable(object):
     def from_configuration_dict(cls, configuration_dict):
         firebase_credentials_file_url = configuration_dict["FirebaseCredentialsFileURL"]
         table_name = configuration_dict["TableName"]
+        cache_encryption_key_file_url = configuration_dict.get("CacheEncryptionKeyFileURL")
 
-        return cls(firebase_credentials_file_url, table_name)
+        return cls(firebase_credentials_file_url, table_name, cache_encryption_key_file_url)
 
     def validate(self):
         validators.validate_url(self.firebase_credentials_file_url, "firebase_credentials_file_url", scheme="gs")
         validators.validate_string(self.table_name, "table_name")
 
+        if self.cache_encryption_key_file_url is not None:
+            validators.validate_url(self.cache_encryption_key_file_url, "cache_encryption_key_file_url", scheme="gs")
+
 
 class TimestampRemapping(object):
     def __init__(self, time_key, show_pipeline_key_to_remap_to, range_start_inclusive=None, range_end_exclusive=None,
@@ -454,7 +500,10 @@ class DriveUpload(object):
 
 
 class AutomatedAnalysis(object):
-    def __init__(self, generate_county_theme_distribution_maps, generate_constituency_theme_distribution_maps):
+    MAP_FORMATS = {"png", "svg", "pdf"}
+
+    def __init__(self, generate_county_theme_distribution_maps, generate_constituency_theme_distribution_maps,
+                 map_format="png", map_dpi=1200, map_simplification_tolerance=None, sample_messages_seed=None):
         """
         :param generate_region_theme_distribution_maps: Whether to generate somali region theme distribution maps.
         :type generate_region_theme_distribution_maps: bool
@@ -462,9 +511,25 @@ class AutomatedAnalysis(object):
         :type generate_district_theme_distribution_maps: bool
         :param generate_mogadishu_theme_distribution_maps: Whether to generate mogadishu sub-district theme distribution maps.
         :type generate_mogadishu_theme_distribution_maps: bool
+        :param map_format: File format to save the maps in. One of "png", "svg", or "pdf".
+                           The vector formats are much faster to render and smaller than high-resolution PNGs.
+        :type map_format: str
+        :param map_dpi: Resolution to save the maps at. For "svg" and "pdf", this only affects rasterized elements.
+        :type map_dpi: int
+        :param map_simplification_tolerance: Tolerance, in degrees, to simplify the map geometry with before plotting.
+                                             If None, the geometry is simplified to remove only detail that isn't
+                                             visible at `map_dpi`. If 0, the geometry is not simplified.
+        :type map_simplification_tolerance: float | None
+        :param sample_messages_seed: Seed to use when sampling the messages for each code, or None to draw a different
+                                     sample on each run.
+        :type sample_messages_seed: int | None
         """
         self.generate_county_theme_distribution_maps = generate_county_theme_distribution_maps
         self.generate_constituency_theme_distribution_maps = generate_constituency_theme_distribution_maps
+        self.map_format = map_format
+        self.map_dpi = map_dpi
+        self.map_simplification_tolerance = map_simplification_tolerance
+        self.sample_messages_seed = sample_messages_seed
 
         self.validate()
 
@@ -472,11 +537,28 @@ class AutomatedAnalysis(object):
     def from_configuration_dict(cls, configuration_dict):
         generate_county_theme_distribution_maps = configuration_dict["GenerateCountyThemeDistributionMaps"]
         generate_constituency_theme_distribution_maps = configuration_dict["GenerateConstituencyThemeDistributionMaps"]
+        map_format = configuration_dict.get("MapFormat", "png")
+        map_dpi = configuration_dict.get("MapDPI", 1200)
+        map_simplification_tolerance = configuration_dict.get("MapSimplificationTolerance")
+        sample_messages_seed = configuration_dict.get("SampleMessagesSeed")
 
-        return cls(generate_county_theme_distribution_maps, generate_constituency_theme_distribution_maps)
+        return cls(generate_county_theme_distribution_maps, generate_constituency_theme_distribution_maps,
+                   map_format, map_dpi, map_simplification_tolerance, sample_messages_seed)
 
     def validate(self):
         validators.validate_bool(self.generate_county_theme_distribution_maps,
                                  "generate_county_theme_distribution_maps")
         validators.validate_bool(self.generate_constituency_theme_distribution_maps,
                                  "generate_constituency_theme_distribution_maps")
+
+        validators.validate_string(self.map_format, "map_format")
+        assert self.map_format in self.MAP_FORMATS, \
+            f"map_format must be one of {sorted(self.MAP_FORMATS)}, but was '{self.map_format}'"
+        validators.validate_int(self.map_dpi, "map_dpi")
+        assert self.map_dpi > 0, f"map_dpi must be positive, but was {self.map_dpi}"
+        if self.map_simplification_tolerance is not None:
+            assert isinstance(self.map_simplification_tolerance, (int, float)) and \
+                self.map_simplification_tolerance >= 0, \
+                f"map_simplification_tolerance must be a number >= 0, but was {self.map_simplification_tolerance}"
+        if self.sample_messages_seed is not None:
+            validators.validate_int(self.sample_messages_seed, "sample_messages_seed")
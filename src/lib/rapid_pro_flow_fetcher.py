@@ -0,0 +1,167 @@
+import io
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from core_data_modules.logging import Logger
+from rapid_pro_tools.rapid_pro_client import RapidProClient
+from temba_client.exceptions import TembaConnectionError, TembaRateExceededError
+from temba_client.v2 import Run
+
+from src.lib.raw_record_store import RawRecordStore
+from src.lib.retry_policy import RetryPolicy
+
+log = Logger(__name__)
+
+
+class RapidProFlowFetcher(object):
+    def __init__(self, domain, token, max_concurrent_fetches=4, retry_policy=None, client_factory=RapidProClient):
+        """
+        Downloads the raw runs of multiple Rapid Pro flows concurrently.
+
+        Downloading runs is dominated by network latency, so the flows are fetched in a pool of threads, each with its
+        own client. Requests which are rate-limited or fail to connect are retried according to `retry_policy`.
+
+        The clients are created by `client_factory`, so the fetcher can be run against a local stub Rapid Pro server
+        by passing a factory which creates clients of that server.
+
+        :param domain: Domain of the Rapid Pro server to download runs from.
+        :type domain: str
+        :param token: Authorisation token for the Rapid Pro server.
+        :type token: str
+        :param max_concurrent_fetches: Maximum number of flows to download at once.
+        :type max_concurrent_fetches: int
+        :param retry_policy: Policy for retrying flows which were rate-limited or failed to connect.
+                             If None, uses `RapidProFlowFetcher.default_retry_policy()`.
+        :type retry_policy: src.lib.retry_policy.RetryPolicy | None
+        :param client_factory: Function which creates a client of the Rapid Pro server, given `domain` and `token`.
+                               The clients must implement `get_flow_id`, `get_raw_runs_for_flow_id` and
+                               `update_raw_runs_with_latest_modified` as `RapidProClient` does.
+        :type client_factory: func of (str, str) -> rapid_pro_tools.rapid_pro_client.RapidProClient
+        """
+        if retry_policy is None:
+            retry_policy = self.default_retry_policy()
+
+        self.domain = domain
+        self.token = token
+        self.max_concurrent_fetches = max_concurrent_fetches
+        self.retry_policy = retry_policy
+        self.client_factory = client_factory
+
+        self._thread_local = threading.local()
+
+    @staticmethod
+    def default_retry_policy():
+        """
+        :return: Policy which retries Rapid Pro requests which were rate-limited or failed to connect, up to 5 times.
+        :rtype: src.lib.retry_policy.RetryPolicy
+        """
+        return RetryPolicy((TembaRateExceededError, TembaConnectionError), max_retries=5, initial_backoff_seconds=1)
+
+    def _get_client(self):
+        # Each thread uses its own client, so that threads never share an HTTP session.
+        if not hasattr(self._thread_local, "rapid_pro"):
+            self._thread_local.rapid_pro = self.client_factory(self.domain, self.token)
+        return self._thread_local.rapid_pro
+
+    def _export_runs(self, description, runs_log_path, export, *args, **kwargs):
+        """
+        Runs a raw export of runs from Rapid Pro, retrying it according to this fetcher's retry policy, then appends
+        the raw export log of the attempt which succeeded to `runs_log_path`.
+
+        Each attempt logs to its own buffer, so attempts which fail part-way through don't leave partial exports in
+        the log file.
+
+        :return: The value returned by `export`.
+        """
+        def attempt():
+            raw_export_log = io.StringIO()
+            return export(*args, raw_export_log_file=raw_export_log, **kwargs), raw_export_log.getvalue()
+
+        raw_runs, raw_export_log = self.retry_policy.run(description, attempt)
+        with open(runs_log_path, "a") as raw_runs_log_file:
+            raw_runs_log_file.write(raw_export_log)
+        return raw_runs
+
+    def _fetch_flow(self, flow, raw_runs_store, runs_log_path):
+        rapid_pro = self._get_client()
+        flow_id = self.retry_policy.run(f"Fetching the id of flow '{flow}'", rapid_pro.get_flow_id, flow)
+
+        # Load the previous export of runs for this flow, and update them with the newest runs.
+        # If there is no previous export for this flow, fetch all the runs from Rapid Pro.
+        # Only the requests to Rapid Pro are retried, so a retry doesn't reload the previous export.
+        if raw_runs_store.exists():
+            log.info(f"Loading raw runs from '{raw_runs_store.store_dir}'...")
+            raw_runs = [Run.deserialize(run_json) for run_json in raw_runs_store.load()]
+            log.info(f"Loaded {len(raw_runs)} runs")
+            raw_runs = self._export_runs(
+                f"Updating the runs of flow '{flow}'", runs_log_path, rapid_pro.update_raw_runs_with_latest_modified,
+                flow_id, raw_runs, ignore_archives=True)
+        else:
+            log.info(f"No raw runs found in '{raw_runs_store.store_dir}', will fetch all runs from the Rapid Pro "
+                     f"server for flow '{flow}'")
+            raw_runs = self._export_runs(
+                f"Fetching the runs of flow '{flow}'", runs_log_path, rapid_pro.get_raw_runs_for_flow_id, flow_id)
+
+        # Save only the runs which are new or were modified since the previous export.
+        raw_runs_store.put_changed(run.serialize() for run in raw_runs)
+
+        return raw_runs
+
+    def fetch_flow(self, flow, raw_runs_store, runs_log_path):
+        """
+        Downloads the raw runs for a flow, retrying requests according to this fetcher's retry policy if they are
+        rate-limited or fail to connect.
+
+        If there is a previous export of the flow's runs in `raw_runs_store`, only the runs modified since then are
+        downloaded. The new and modified runs are appended to `raw_runs_store`.
+
+        :param flow: Name of the flow to download.
+        :type flow: str
+        :param raw_runs_store: Store of the flow's raw runs, keyed by run id.
+        :type raw_runs_store: src.lib.raw_record_store.RawRecordStore
+        :param runs_log_path: Path to a log file to append the raw export to.
+        :type runs_log_path: str
+        :return: All the raw runs for the flow.
+        :rtype: list of temba_client.v2.Run
+        """
+        start_time = time.time()
+        raw_runs = self._fetch_flow(flow, raw_runs_store, runs_log_path)
+        log.info(f"Fetched {len(raw_runs)} runs for flow '{flow}' in {time.time() - start_time:.1f}s")
+        return raw_runs
+
+    def fetch_flows(self, flows, raw_data_dir):
+        """
+        Downloads the raw runs for each of the given flows concurrently.
+
+        :param flows: Names of the flows to download.
+        :type flows: list of str
+        :param raw_data_dir: Directory containing the raw run stores of the flows, which are named "<flow>_raw",
+                             and the raw export logs, which are named "<flow>_log.jsonl". Raw runs exported to
+                             "<flow>_raw.json" by earlier versions of this pipeline are imported into the stores.
+        :type raw_data_dir: str
+        :return: Dictionary of flow name -> all the raw runs for that flow, in the same order as `flows`.
+        :rtype: OrderedDict of str -> list of temba_client.v2.Run
+        """
+        raw_runs_stores = []
+        for flow in flows:
+            raw_runs_store = RawRecordStore(f"{raw_data_dir}/{flow}_raw", "id")
+            raw_runs_store.import_json_file(f"{raw_data_dir}/{flow}_raw.json")
+            raw_runs_stores.append(raw_runs_store)
+
+        log.info(f"Fetching runs for {len(flows)} flows, with up to {self.max_concurrent_fetches} at once...")
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_fetches) as executor:
+            futures = [
+                executor.submit(self.fetch_flow, flow, raw_runs_store, f"{raw_data_dir}/{flow}_log.jsonl")
+                for flow, raw_runs_store in zip(flows, raw_runs_stores)
+            ]
+
+            raw_runs_by_flow = OrderedDict()
+            for flow, future in zip(flows, futures):
+                raw_runs_by_flow[flow] = future.result()
+
+        for raw_runs_store in raw_runs_stores:
+            raw_runs_store.wait_for_compaction()
+
+        return raw_runs_by_flow
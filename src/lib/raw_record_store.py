@@ -0,0 +1,194 @@
+import json
+import os
+import threading
+from glob import glob
+
+from core_data_modules.logging import Logger
+
+log = Logger(__name__)
+
+
+class RawRecordStore(object):
+    SEGMENT_NAME_FORMAT = "segment-{:06d}.jsonl"
+
+    def __init__(self, store_dir, key_field, modified_on_field="modified_on", compaction_ratio=2, max_segments=20):
+        """
+        Append-only store of raw Rapid Pro records (e.g. serialized runs or contacts), keyed by `key_field`.
+
+        Records are stored as JSONL segment files in `store_dir`. Each call to `RawRecordStore.put_changed` appends
+        only the new or modified records, as a new segment, so the cost of an incremental fetch tracks the number of
+        records that changed rather than the total number of records. When a record appears in more than one segment,
+        the version in the latest segment is the current one.
+
+        Once the segments contain too many superseded records, or there are too many segments, they are compacted
+        into a single segment in a background thread.
+
+        :param store_dir: Directory to store the segments in.
+        :type store_dir: str
+        :param key_field: Field in each record which uniquely identifies it e.g. "id" for runs or "uuid" for contacts.
+        :type key_field: str
+        :param modified_on_field: Field in each record of the time it was last modified, used to detect changed
+                                  records.
+        :type modified_on_field: str
+        :param compaction_ratio: Compact once the segments contain more than this many records per current record.
+        :type compaction_ratio: float
+        :param max_segments: Compact once there are more than this many segments.
+        :type max_segments: int
+        """
+        self.store_dir = store_dir
+        self.key_field = key_field
+        self.modified_on_field = modified_on_field
+        self.compaction_ratio = compaction_ratio
+        self.max_segments = max_segments
+
+        self._records = dict()  # of key -> record
+        self._stored_records = 0  # Number of records in all the segments, including superseded records.
+        self._segment_numbers = []
+        self._lock = threading.Lock()
+        self._compaction_thread = None
+
+    def _get_segment_path(self, segment_number):
+        return f"{self.store_dir}/{self.SEGMENT_NAME_FORMAT.format(segment_number)}"
+
+    def _next_segment_number(self):
+        # Must be called with the lock held.
+        segment_number = self._segment_numbers[-1] + 1 if len(self._segment_numbers) > 0 else 1
+        self._segment_numbers.append(segment_number)
+        return segment_number
+
+    def exists(self):
+        """
+        :return: Whether this store has any segments on disk.
+        :rtype: bool
+        """
+        return len(glob(f"{self.store_dir}/segment-*.jsonl")) > 0
+
+    def load(self):
+        """
+        Loads the current version of every record in the store.
+
+        :return: The current records, in the order they were first added.
+        :rtype: list of dict
+        """
+        self._records = dict()
+        self._stored_records = 0
+        self._segment_numbers = sorted(
+            int(os.path.basename(path)[len("segment-"):-len(".jsonl")])
+            for path in glob(f"{self.store_dir}/segment-*.jsonl")
+        )
+
+        for segment_number in self._segment_numbers:
+            with open(self._get_segment_path(segment_number)) as f:
+                for line in f:
+                    if line.strip() == "":
+                        continue
+                    record = json.loads(line)
+                    self._records[record[self.key_field]] = record
+                    self._stored_records += 1
+
+        log.info(f"Loaded {len(self._records)} records from {len(self._segment_numbers)} segments in "
+                 f"'{self.store_dir}'")
+        return list(self._records.values())
+
+    def import_json_file(self, json_path):
+        """
+        Imports the records in a JSON file containing a list of records, if this store is empty and the file exists.
+
+        This is used to migrate the raw exports written before this store was introduced.
+
+        :param json_path: Path to the JSON file to import.
+        :type json_path: str
+        """
+        if self.exists() or not os.path.exists(json_path):
+            return
+
+        log.info(f"Importing the records in '{json_path}' into '{self.store_dir}'...")
+        with open(json_path) as f:
+            records = json.load(f)
+        self.put_changed(records)
+
+    def put_changed(self, records):
+        """
+        Appends the records which are new or have been modified since they were last stored, as a new segment.
+
+        :param records: Records to store.
+        :type records: iterable of dict
+        :return: Number of records which were appended.
+        :rtype: int
+        """
+        changed_records = []
+        for record in records:
+            stored_record = self._records.get(record[self.key_field])
+            if stored_record is None or stored_record.get(self.modified_on_field) != record.get(self.modified_on_field):
+                changed_records.append(record)
+
+        if len(changed_records) == 0:
+            log.info(f"No new or modified records to store in '{self.store_dir}'")
+            return 0
+
+        os.makedirs(self.store_dir, exist_ok=True)
+        with self._lock:
+            segment_path = self._get_segment_path(self._next_segment_number())
+
+        # Write to a temporary file first so that a partially written segment is never loaded.
+        temp_path = f"{segment_path}.tmp"
+        with open(temp_path, "w") as f:
+            for record in changed_records:
+                f.write(json.dumps(record))
+                f.write("\n")
+        os.replace(temp_path, segment_path)
+
+        for record in changed_records:
+            self._records[record[self.key_field]] = record
+        self._stored_records += len(changed_records)
+        log.info(f"Appended {len(changed_records)} new or modified records to '{segment_path}'")
+
+        if self._stored_records > self.compaction_ratio * len(self._records) or \
+                len(self._segment_numbers) > self.max_segments:
+            self.compact_in_background()
+
+        return len(changed_records)
+
+    def _compact(self, records, compacted_segment_number, superseded_segment_numbers):
+        compacted_path = self._get_segment_path(compacted_segment_number)
+        temp_path = f"{compacted_path}.tmp"
+        with open(temp_path, "w") as f:
+            for record in records:
+                f.write(json.dumps(record))
+                f.write("\n")
+        os.replace(temp_path, compacted_path)
+
+        # The compacted segment contains the current version of every record in the superseded segments, so they can
+        # now be deleted. Segments appended while compacting have higher numbers, so still take precedence.
+        for segment_number in superseded_segment_numbers:
+            os.remove(self._get_segment_path(segment_number))
+        log.info(f"Compacted {len(superseded_segment_numbers)} segments in '{self.store_dir}' into "
+                 f"'{compacted_path}'")
+
+    def compact_in_background(self):
+        """
+        Compacts all the current segments into a single segment, in a background thread.
+
+        Does nothing if a compaction is already in progress.
+        """
+        if self._compaction_thread is not None and self._compaction_thread.is_alive():
+            return
+
+        with self._lock:
+            superseded_segment_numbers = list(self._segment_numbers)
+            compacted_segment_number = self._next_segment_number()
+            self._segment_numbers = [compacted_segment_number]
+        records = list(self._records.values())
+        self._stored_records = len(records)
+
+        self._compaction_thread = threading.Thread(
+            target=self._compact, args=(records, compacted_segment_number, superseded_segment_numbers))
+        self._compaction_thread.start()
+
+    def wait_for_compaction(self):
+        """
+        Blocks until any background compaction has completed.
+        """
+        if self._compaction_thread is not None:
+            self._compaction_thread.join()
+            self._compaction_thread = None
@@ -0,0 +1,44 @@
+import random
+
+
+class ReservoirSampler(object):
+    def __init__(self, capacity, rng=None):
+        """
+        Maintains a uniform random sample of at most `capacity` of the items added to it, without needing to hold all
+        the items in memory (reservoir sampling, 'Algorithm R').
+
+        :param capacity: Maximum number of items to sample.
+        :type capacity: int
+        :param rng: Random number generator to sample with. Share a seeded generator between samplers to produce
+                    reproducible samples. If None, uses a new unseeded generator.
+        :type rng: random.Random | None
+        """
+        if rng is None:
+            rng = random.Random()
+
+        self.capacity = capacity
+        self.rng = rng
+        self.items_seen = 0
+        self._sample = []
+
+    def add(self, item):
+        """
+        Offers an item to the sample.
+
+        :param item: Item to offer.
+        """
+        self.items_seen += 1
+        if len(self._sample) < self.capacity:
+            self._sample.append(item)
+            return
+
+        i = self.rng.randrange(self.items_seen)
+        if i < self.capacity:
+            self._sample[i] = item
+
+    def get_sample(self):
+        """
+        :return: The sampled items. If fewer than `capacity` items were added, returns all of them.
+        :rtype: list
+        """
+        return list(self._sample)
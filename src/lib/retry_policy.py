@@ -0,0 +1,49 @@
+import time
+
+from core_data_modules.logging import Logger
+
+log = Logger(__name__)
+
+
+class RetryPolicy(object):
+    def __init__(self, retryable_exceptions, max_retries=5, initial_backoff_seconds=1):
+        """
+        Retries operations which fail with transient errors, with exponential backoff.
+
+        If a retryable exception has a `retry_after` attribute (e.g. `temba_client.exceptions.TembaRateExceededError`),
+        the next retry waits for at least that many seconds.
+
+        :param retryable_exceptions: Types of exception to retry on. Any other exception is raised immediately.
+        :type retryable_exceptions: tuple of type
+        :param max_retries: Maximum number of times to retry an operation before giving up.
+        :type max_retries: int
+        :param initial_backoff_seconds: Time to wait before the first retry. This doubles after each retry.
+        :type initial_backoff_seconds: float
+        """
+        self.retryable_exceptions = retryable_exceptions
+        self.max_retries = max_retries
+        self.initial_backoff_seconds = initial_backoff_seconds
+
+    def run(self, description, f, *args, **kwargs):
+        """
+        Calls `f(*args, **kwargs)`, retrying if it raises one of the retryable exceptions.
+
+        :param description: Description of the operation, for logging.
+        :type description: str
+        :param f: Operation to run.
+        :type f: callable
+        :return: The value returned by `f`.
+        """
+        backoff_seconds = self.initial_backoff_seconds
+        for attempt in range(self.max_retries + 1):
+            try:
+                return f(*args, **kwargs)
+            except self.retryable_exceptions as ex:
+                if attempt == self.max_retries:
+                    raise
+
+                wait_seconds = max(backoff_seconds, getattr(ex, "retry_after", None) or 0)
+                log.warning(f"{description} failed ({type(ex).__name__}); retrying in {wait_seconds}s "
+                            f"(retry {attempt + 1}/{self.max_retries})...")
+                time.sleep(wait_seconds)
+                backoff_seconds *= 2
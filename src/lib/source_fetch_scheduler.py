@@ -0,0 +1,129 @@
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from core_data_modules.logging import Logger
+
+log = Logger(__name__)
+
+
+class SourceFetchScheduler(object):
+    def __init__(self, max_concurrent_fetches, max_concurrent_fetches_per_group):
+        """
+        Runs the fetches of independent raw data sources concurrently.
+
+        Each fetch belongs to a group (e.g. the type of its source). At most `max_concurrent_fetches` fetches run at
+        once in total, and at most `max_concurrent_fetches_per_group[group]` fetches of each group run at once, so
+        that e.g. the number of Rapid Pro workspaces being fetched at the same time can be limited separately from
+        the number of bucket downloads.
+
+        Fetches are queued per group, and a fetch is only submitted to the thread pool once both its group and the
+        pool have a free slot, so a fetch waiting for its group never holds a pool thread that a fetch of another
+        group could use.
+
+        Fetches are not retried here. Sources which make many requests are expected to retry their own transient
+        failures (e.g. `RapidProFlowFetcher` retries each flow), so that one failed request doesn't re-fetch the
+        whole source.
+
+        :param max_concurrent_fetches: Maximum number of fetches to run at once.
+        :type max_concurrent_fetches: int
+        :param max_concurrent_fetches_per_group: Dictionary of group -> maximum number of fetches of that group to
+                                                 run at once. Groups not in this dictionary are only limited by
+                                                 `max_concurrent_fetches`.
+        :type max_concurrent_fetches_per_group: dict of str -> int
+        """
+        self.max_concurrent_fetches = max_concurrent_fetches
+        self.max_concurrent_fetches_per_group = max_concurrent_fetches_per_group
+
+        self._fetches = []  # of (name, group, f, args)
+
+    def add_fetch(self, name, group, f, *args):
+        """
+        Schedules a fetch, to be run by `SourceFetchScheduler.run_all`.
+
+        :param name: Name of the fetch, for logging and timing reports.
+        :type name: str
+        :param group: Group the fetch belongs to, for concurrency limits.
+        :type group: str
+        :param f: Function to call to run the fetch.
+        :type f: callable
+        :param args: Arguments to call `f` with.
+        """
+        self._fetches.append((name, group, f, args))
+
+    @staticmethod
+    def _run_fetch(name, f, args):
+        log.info(f"Fetching from {name}...")
+        start_time = time.time()
+        f(*args)
+        duration_seconds = time.time() - start_time
+        log.info(f"Fetched from {name} in {duration_seconds:.1f}s")
+        return duration_seconds
+
+    def _group_has_capacity(self, group, running_per_group):
+        limit = self.max_concurrent_fetches_per_group.get(group)
+        return limit is None or running_per_group.get(group, 0) < limit
+
+    def run_all(self):
+        """
+        Runs all the scheduled fetches, and logs a report of how long each one took.
+
+        If any fetch fails, no more fetches are started, the fetches which are already running are allowed to finish,
+        and the first failure is raised.
+
+        :return: Dictionary of fetch name -> time taken in seconds, in the order the fetches were added.
+        :rtype: dict of str -> float
+        """
+        start_time = time.time()
+
+        queues = OrderedDict()  # of group -> list of (name, f, args) waiting to run, in the order they were added
+        for name, group, f, args in self._fetches:
+            queues.setdefault(group, []).append((name, f, args))
+
+        durations = dict()  # of fetch name -> seconds
+        failure = None
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_fetches) as executor:
+            running = dict()  # of future -> (name, group)
+            running_per_group = dict()  # of group -> number of fetches of that group which are running
+            while True:
+                # Submit queued fetches, taking one from each group in turn, until the pool or every group with
+                # queued fetches is full.
+                submitted = True
+                while failure is None and submitted and len(running) < self.max_concurrent_fetches:
+                    submitted = False
+                    for group, queue in queues.items():
+                        if len(queue) == 0 or not self._group_has_capacity(group, running_per_group):
+                            continue
+                        if len(running) == self.max_concurrent_fetches:
+                            break
+                        name, f, args = queue.pop(0)
+                        running[executor.submit(self._run_fetch, name, f, args)] = (name, group)
+                        running_per_group[group] = running_per_group.get(group, 0) + 1
+                        submitted = True
+
+                if len(running) == 0:
+                    break
+
+                done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, group = running.pop(future)
+                    running_per_group[group] -= 1
+                    try:
+                        durations[name] = future.result()
+                    except Exception as ex:
+                        log.error(f"Fetching from {name} failed: {ex}")
+                        if failure is None:
+                            failure = ex
+
+        if failure is not None:
+            not_started = [name for queue in queues.values() for name, _, _ in queue]
+            if len(not_started) > 0:
+                log.error(f"Not fetching from {not_started} because an earlier fetch failed")
+            raise failure
+
+        durations = {name: durations[name] for name, _, _, _ in self._fetches}
+        log.info(f"Fetched from {len(durations)} sources in {time.time() - start_time:.1f}s:")
+        for name, duration_seconds in durations.items():
+            log.info(f"    {name}: {duration_seconds:.1f}s")
+
+        return durations
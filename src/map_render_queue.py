@@ -0,0 +1,181 @@
+import multiprocessing
+import time
+
+from core_data_modules.logging import Logger
+
+log = Logger(__name__)
+
+COUNTY = "county"
+CONSTITUENCY = "constituency"
+
+COUNTIES_GEOJSON_PATH = "geojson/kenya_counties.geojson"
+CONSTITUENCIES_GEOJSON_PATH = "geojson/kenya_constituencies.geojson"
+LAKES_GEOJSON_PATH = "geojson/kenya_lakes.geojson"
+
+CONSTITUENCY_INSET = dict(inset_region=(36.62, -1.46, 37.12, -1.09), zoom=3, inset_position=(35.60, -2.95))
+
+# Map renderers built once per worker process by `_init_worker`, keyed by geography.
+_worker_renderers = dict()
+_worker_dpi = None
+
+
+def _geometry_levels(dpi, simplification_tolerance):
+    """
+    :return: List of (geojson path, `GeometryCache.load` keyword arguments).
+    :rtype: list of (str, dict)
+    """
+    if simplification_tolerance == 0:
+        levels = dict(dpi=None, tolerance=None)
+    elif simplification_tolerance is None:
+        levels = dict(dpi=dpi, tolerance=None)
+    else:
+        levels = dict(dpi=None, tolerance=simplification_tolerance)
+
+    return [
+        (LAKES_GEOJSON_PATH, dict(levels, zoom=1)),
+        (COUNTIES_GEOJSON_PATH, dict(levels, zoom=1)),
+        (CONSTITUENCIES_GEOJSON_PATH, dict(levels, zoom=CONSTITUENCY_INSET["zoom"]))
+    ]
+
+
+def _init_worker(geometry_cache_dir, dpi, simplification_tolerance):
+    # The plotting and GIS libraries (matplotlib, geopandas, mapclassify) are slow to import, so they are only imported
+    # once maps are actually rendered, rather than whenever this module is imported.
+    import matplotlib
+    matplotlib.use("Agg")  # Maps are only ever saved to file, and workers have no display.
+    from src.geometry_cache import GeometryCache
+    from src.mapping_utils import FrequencyMapRenderer
+
+    global _worker_dpi
+    _worker_dpi = dpi
+
+    geometry_cache = GeometryCache(geometry_cache_dir)
+    lakes_map, counties_map, constituencies_map = [
+        geometry_cache.load(path, **level) for path, level in _geometry_levels(dpi, simplification_tolerance)
+    ]
+
+    # Keep only Kenya's great lakes
+    lakes_map = lakes_map[lakes_map.LAKE_AVF.isin({"lake_turkana", "lake_victoria"})]
+
+    _worker_renderers[COUNTY] = FrequencyMapRenderer(
+        counties_map, "ADM1_AVF", water_bodies=lakes_map,
+        label_position_columns=("ADM1_LX", "ADM1_LY"), callout_position_columns=("ADM1_CALLX", "ADM1_CALLY"))
+
+    _worker_renderers[CONSTITUENCY] = FrequencyMapRenderer(
+        constituencies_map, "ADM2_AVF", water_bodies=lakes_map, inset=CONSTITUENCY_INSET)
+
+
+def _render_map(job):
+    renderer = _worker_renderers[job["geography"]]
+    renderer.render(job["frequencies"], job["output_path"], labels=job["labels"], dpi=_worker_dpi)
+
+    return job["output_path"]
+
+
+class MapRenderQueue(object):
+    def __init__(self, processes=None, dpi=1200, simplification_tolerance=None, geometry_cache_dir="geojson/cache",
+                 manifest=None):
+        """
+        Queue of Kenya choropleth maps to render in a pool of worker processes.
+
+        Each worker loads the county, constituency and lakes geojson and builds a `FrequencyMapRenderer` per geography
+        once when it starts, then renders the map jobs it is sent, so map generation scales across cores.
+
+        The geojson files are loaded through a `GeometryCache`, which is populated before the workers start.
+
+        If a manifest is given, maps whose frequencies, labels and render settings are unchanged since they were last
+        rendered are not queued again.
+
+        :param processes: Number of worker processes to use. If None, uses the number of CPUs.
+        :type processes: int | None
+        :param dpi: Resolution to save the maps at. For vector output formats, this only affects rasterized elements.
+        :type dpi: int
+        :param simplification_tolerance: Tolerance to simplify the geometry with, in degrees. If None, simplifies to
+                                         remove detail that isn't visible at `dpi`. If 0, doesn't simplify.
+        :type simplification_tolerance: float | None
+        :param geometry_cache_dir: Directory to cache the converted geojson files in.
+        :type geometry_cache_dir: str
+        :param manifest: Manifest of the analysis outputs to skip unchanged maps with and record rendered maps in,
+                         or None to always render every map.
+        :type manifest: src.analysis_manifest.AnalysisManifest | None
+        """
+        self.processes = processes
+        self.dpi = dpi
+        self.simplification_tolerance = simplification_tolerance
+        self.geometry_cache_dir = geometry_cache_dir
+        self.manifest = manifest
+        self._jobs = []
+        self._skipped_jobs = 0
+
+    def _add_job(self, geography, frequencies, output_path, labels):
+        input_hash = None
+        if self.manifest is not None:
+            input_hash = self.manifest.hash_inputs(
+                geography, frequencies, labels, self.dpi, self.simplification_tolerance)
+            if self.manifest.is_up_to_date(output_path, input_hash):
+                log.debug(f"Skipping map {output_path} because its inputs haven't changed")
+                self._skipped_jobs += 1
+                return
+
+        self._jobs.append({
+            "geography": geography,
+            "frequencies": frequencies,
+            "labels": labels,
+            "output_path": output_path,
+            "input_hash": input_hash
+        })
+
+    def add_county_map(self, frequencies, output_path, labels=None):
+        """
+        Queues a county-level choropleth map.
+
+        :param frequencies: Dictionary of county id -> frequency.
+        :type frequencies: dict of str -> int
+        :param output_path: Path to save the rendered map to.
+        :type output_path: str
+        :param labels: Dictionary of county id -> text to annotate the map with for each county, or None.
+        :type labels: dict of str -> str | None
+        """
+        self._add_job(COUNTY, frequencies, output_path, labels)
+
+    def add_constituency_map(self, frequencies, output_path):
+        """
+        Queues a constituency-level choropleth map, with an inset of Nairobi.
+
+        :param frequencies: Dictionary of constituency id -> frequency.
+        :type frequencies: dict of str -> int
+        :param output_path: Path to save the rendered map to.
+        :type output_path: str
+        """
+        self._add_job(CONSTITUENCY, frequencies, output_path, None)
+
+    def render_all(self):
+        """
+        Renders all the queued maps, blocking until they have all been saved.
+        """
+        jobs = self._jobs
+        self._jobs = []
+        if self._skipped_jobs > 0:
+            log.info(f"Skipped {self._skipped_jobs} maps whose inputs haven't changed")
+            self._skipped_jobs = 0
+        if len(jobs) == 0:
+            return
+
+        input_hashes = {job["output_path"]: job["input_hash"] for job in jobs}
+
+        start_time = time.time()
+
+        # Populate the geometry cache here, so that the workers don't all convert the same files concurrently.
+        from src.geometry_cache import GeometryCache
+        geometry_cache = GeometryCache(self.geometry_cache_dir)
+        for path, level in _geometry_levels(self.dpi, self.simplification_tolerance):
+            geometry_cache.ensure_cached(path, **level)
+
+        log.info(f"Rendering {len(jobs)} maps...")
+        with multiprocessing.Pool(self.processes, initializer=_init_worker,
+                                  initargs=(self.geometry_cache_dir, self.dpi, self.simplification_tolerance)) as pool:
+            for i, output_path in enumerate(pool.imap_unordered(_render_map, jobs)):
+                log.debug(f"Rendered map {i + 1}/{len(jobs)}: {output_path}")
+                if self.manifest is not None:
+                    self.manifest.record(output_path, input_hashes[output_path])
+        log.info(f"Rendered {len(jobs)} maps in {time.time() - start_time:.1f}s")
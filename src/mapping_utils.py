@@ -50,6 +50,35 @@ class MappingUtils(object):
         :param ax: Axes on which to draw the plot. If None, draws to a new figure.
         :type ax: matplotlib.pyplot.Axes | None
         """
+        colors, bin_edges, number_of_classes = cls.get_frequency_colors(geo_data, admin_id_column, frequencies)
+
+        # Plot the choropleth map.
+        ax = geo_data.plot(ax=ax, color=colors, linewidth=0.1, edgecolor="black")
+        ax.axis("off")
+
+        # Add the choropleth legend.
+        if show_legend:
+            cls.plot_frequency_legend(bin_edges, number_of_classes, ax)
+
+        # Add a label to each administrative region showing its absolute frequency.
+        if labels is not None:
+            cls.plot_frequency_labels(geo_data, admin_id_column, labels, label_position_columns,
+                                      callout_position_columns, ax)
+
+    @classmethod
+    def get_frequency_colors(cls, geo_data, admin_id_column, frequencies):
+        """
+        Classifies the given frequencies and returns the choropleth color of each administrative region.
+
+        :param geo_data: GeoData to get the colors for.
+        :type geo_data: geopandas.GeoDataFrame
+        :param admin_id_column: Column in `geo_data` of the administrative region ids.
+        :type admin_id_column: str
+        :param frequencies: Dictionary of admin_id -> frequency.
+        :type frequencies: dict of str -> int
+        :return: Tuple of (RGBA color of each row in `geo_data`, bin edges, number of classes).
+        :rtype: (numpy.ndarray of shape (len(geo_data), 4), list of int, int)
+        """
         # Class the frequencies using the Fisher-Jenks method, a standard GIS algorithm for choropleth classification.
         # Using this method prevents a region with a vastly higher frequency than the others (e.g. a capital city)
         # from using up all of the colour range, as would happen with a linear scale.
@@ -61,53 +90,86 @@ class MappingUtils(object):
         if number_of_classes > 0:
             bin_edges.extend(FisherJenks(np.array(frequencies_to_class), k=number_of_classes).bins)
 
-        # Get the color for each region by searching for the appropriate bin for each frequency.
-        colors = []
-        for i, admin_region in geo_data.iterrows():
-            frequency = frequencies[admin_region[admin_id_column]]
-            bin_id = [i for i, b in enumerate(bin_edges) if b >= frequency][0]  # Index of first bin edge >= frequency
-            colors.append(cls.AVF_COLOR_MAP(0 if bin_id == 0 else float(bin_id) / number_of_classes))
+        # Get the color for each region by searching for the appropriate bin for each frequency, i.e. the index of the
+        # first bin edge >= frequency.
+        region_frequencies = geo_data[admin_id_column].map(frequencies)
+        assert not region_frequencies.isna().any(), \
+            f"Missing frequencies for {admin_id_column}s {list(geo_data[admin_id_column][region_frequencies.isna()])}"
+        bin_ids = np.searchsorted(bin_edges, region_frequencies.to_numpy(), side="left")
+        colors = cls.AVF_COLOR_MAP(bin_ids / max(number_of_classes, 1))
 
-        # Plot the choropleth map.
-        ax = geo_data.plot(ax=ax, color=colors, linewidth=0.1, edgecolor="black")
-        ax.axis("off")
+        return colors, bin_edges, number_of_classes
 
-        # Add the choropleth legend.
-        if show_legend:
-            legend_elements = [
-                Patch(label="0", facecolor=cls.AVF_COLOR_MAP(0), linewidth=0.1, edgecolor="black")
-            ]
-            for bin_id in range(1, len(bin_edges)):
-                range_min = bin_edges[bin_id - 1] + 1
-                range_max = bin_edges[bin_id]
-                legend_elements.append(Patch(
-                    label=range_min if range_min == range_max else f"{range_min} - {range_max}",
-                    facecolor=cls.AVF_COLOR_MAP(float(bin_id) / number_of_classes),
-                    linewidth=0.1, edgecolor="black"
-                ))
-            ax.legend(handles=legend_elements, title="Participants", title_fontsize=6, loc="lower right",
-                      frameon=False, handlelength=1.8, handleheight=1.8, labelspacing=0, prop=dict(size=5.5))
+    @classmethod
+    def plot_frequency_legend(cls, bin_edges, number_of_classes, ax):
+        """
+        Draws a choropleth legend for the given bins to the bottom-right corner of the given axes, replacing any
+        existing legend.
 
-        # Add a label to each administrative region showing its absolute frequency.
+        :param bin_edges: Bin edges, as returned by `MappingUtils.get_frequency_colors`.
+        :type bin_edges: list of int
+        :param number_of_classes: Number of classes, as returned by `MappingUtils.get_frequency_colors`.
+        :type number_of_classes: int
+        :param ax: Axes on which to draw the legend.
+        :type ax: matplotlib.pyplot.Axes
+        """
+        legend_elements = [
+            Patch(label="0", facecolor=cls.AVF_COLOR_MAP(0), linewidth=0.1, edgecolor="black")
+        ]
+        for bin_id in range(1, len(bin_edges)):
+            range_min = bin_edges[bin_id - 1] + 1
+            range_max = bin_edges[bin_id]
+            legend_elements.append(Patch(
+                label=range_min if range_min == range_max else f"{range_min} - {range_max}",
+                facecolor=cls.AVF_COLOR_MAP(float(bin_id) / number_of_classes),
+                linewidth=0.1, edgecolor="black"
+            ))
+        ax.legend(handles=legend_elements, title="Participants", title_fontsize=6, loc="lower right",
+                  frameon=False, handlelength=1.8, handleheight=1.8, labelspacing=0, prop=dict(size=5.5))
+
+    @staticmethod
+    def plot_frequency_labels(geo_data, admin_id_column, labels, label_position_columns, callout_position_columns,
+                              ax):
+        """
+        Annotates each administrative region with its label.
+
+        See `MappingUtils.plot_frequency_map` for a description of the arguments.
+
+        :return: The annotations that were drawn.
+        :rtype: list of matplotlib.text.Annotation
+        """
         # The font size is currently hard-coded for Kenyan counties.
         # TODO: Modify once per-map configuration needs are better understood by testing on other maps.
-        if labels is not None:
-            for i, admin_region in geo_data.iterrows():
-                # Set label and callout positions from the features in the geo_data,
-                # translating from the geo_data format to the matplotlib format.
-                if callout_position_columns is None or pandas.isna(admin_region[callout_position_columns[0]]):
-                    # Draw label only.
-                    xy = (admin_region[label_position_columns[0]], admin_region[label_position_columns[1]])
-                    xytext = None
-                else:
-                    # Draw label and callout line.
-                    xy = (admin_region[callout_position_columns[0]], admin_region[callout_position_columns[1]])
-                    xytext = (admin_region[label_position_columns[0]], admin_region[label_position_columns[1]])
-
-                ax.annotate(text=labels[admin_region[admin_id_column]],
-                            xy=xy, xytext=xytext,
-                            arrowprops=dict(facecolor="black", arrowstyle="-", linewidth=0.1, shrinkA=0, shrinkB=0),
-                            ha="center", va="center", fontsize=3.8)
+        admin_ids = geo_data[admin_id_column].to_numpy()
+        label_xs = geo_data[label_position_columns[0]].to_numpy()
+        label_ys = geo_data[label_position_columns[1]].to_numpy()
+        if callout_position_columns is None:
+            callout_xs = np.full(len(geo_data), np.nan)
+            callout_ys = callout_xs
+        else:
+            callout_xs = geo_data[callout_position_columns[0]].to_numpy(dtype=float)
+            callout_ys = geo_data[callout_position_columns[1]].to_numpy(dtype=float)
+
+        annotations = []
+        for admin_id, label_x, label_y, callout_x, callout_y in zip(admin_ids, label_xs, label_ys, callout_xs,
+                                                                    callout_ys):
+            # Set label and callout positions from the features in the geo_data,
+            # translating from the geo_data format to the matplotlib format.
+            if pandas.isna(callout_x):
+                # Draw label only.
+                xy = (label_x, label_y)
+                xytext = None
+            else:
+                # Draw label and callout line.
+                xy = (callout_x, callout_y)
+                xytext = (label_x, label_y)
+
+            annotations.append(ax.annotate(
+                text=labels[admin_id],
+                xy=xy, xytext=xytext,
+                arrowprops=dict(facecolor="black", arrowstyle="-", linewidth=0.1, shrinkA=0, shrinkB=0),
+                ha="center", va="center", fontsize=3.8))
+        return annotations
 
     @classmethod
     def plot_inset_frequency_map(cls, geo_data, admin_id_column, frequencies, inset_region, inset_position, zoom, ax):
@@ -130,6 +192,20 @@ class MappingUtils(object):
         :param ax: Axes on which to draw the plot. If None, draws to a new figure.
         :type ax: matplotlib.pyplot.Axes
         """
+        inset_ax = cls.make_inset_axes(inset_region, inset_position, zoom, ax)
+        cls.plot_frequency_map(geo_data, admin_id_column, frequencies, ax=inset_ax, show_legend=False)
+        inset_ax.axis("on")
+
+    @staticmethod
+    def make_inset_axes(inset_region, inset_position, zoom, ax):
+        """
+        Creates zoomed inset axes on another axes, and draws a rectangle around the inset region on that axes.
+
+        See `MappingUtils.plot_inset_frequency_map` for a description of the arguments.
+
+        :return: The inset axes.
+        :rtype: matplotlib.pyplot.Axes
+        """
         inset_ax = zoomed_inset_axes(ax, zoom=zoom, loc="center", bbox_to_anchor=inset_position,
                                      bbox_transform=ax.transData)
         plt.setp(inset_ax.spines.values(), linewidth=0.2, color="black")
@@ -143,8 +219,7 @@ class MappingUtils(object):
         inset_ax.xaxis.set_visible(False)
         inset_ax.yaxis.set_visible(False)
 
-        cls.plot_frequency_map(geo_data, admin_id_column, frequencies, ax=inset_ax, show_legend=False)
-        inset_ax.axis("on")
+        return inset_ax
 
     @classmethod
     def plot_water_bodies(cls, geo_data, ax=None):
@@ -160,3 +235,95 @@ class MappingUtils(object):
         :type ax: matplotlib.pyplot.Artist | None
         """
         geo_data.plot(ax=ax, linewidth=0.1, edgecolor="black", facecolor=cls.WATER_COLOR)
+
+
+class FrequencyMapRenderer(object):
+    def __init__(self, geo_data, admin_id_column, water_bodies=None, label_position_columns=None,
+                 callout_position_columns=None, inset=None):
+        """
+        Renders many choropleth frequency maps of the same geo data, plotting the geometry only once.
+
+        The figure, axes, region polygons, water bodies and optional inset are built when the renderer is constructed.
+        Each call to `render` then only updates the region face colors, the legend and the labels before saving.
+
+        :param geo_data: GeoData to plot.
+        :type geo_data: geopandas.GeoDataFrame
+        :param admin_id_column: Column in `geo_data` of the administrative region ids.
+        :type admin_id_column: str
+        :param water_bodies: GeoData of water bodies to draw over the regions, or None.
+        :type water_bodies: geopandas.GeoDataFrame | None
+        :param label_position_columns: See `MappingUtils.plot_frequency_map`.
+        :type label_position_columns: (str, str) | None
+        :param callout_position_columns: See `MappingUtils.plot_frequency_map`.
+        :type callout_position_columns: (str, str) | None
+        :param inset: Inset map to draw, as a dictionary with keys "inset_region", "inset_position" and "zoom"
+                      (see `MappingUtils.plot_inset_frequency_map`), or None.
+        :type inset: dict | None
+        """
+        self.geo_data = geo_data
+        self.admin_id_column = admin_id_column
+        self.label_position_columns = label_position_columns
+        self.callout_position_columns = callout_position_columns
+
+        # geopandas draws one patch per polygon, so multi-polygon regions are made up of several patches.
+        # Record which region each patch belongs to, so region colors can be expanded to patch colors.
+        parts = [len(geom.geoms) if geom.geom_type.startswith("Multi") else 1 for geom in geo_data.geometry]
+        self._patch_regions = np.repeat(np.arange(len(geo_data)), parts)
+
+        self.fig, self.ax = plt.subplots()
+        self._region_collections = [self._plot_regions(self.ax)]
+        self.ax.axis("off")
+
+        if inset is not None:
+            inset_ax = MappingUtils.make_inset_axes(inset["inset_region"], inset["inset_position"], inset["zoom"],
+                                                    self.ax)
+            self._region_collections.append(self._plot_regions(inset_ax))
+
+        if water_bodies is not None:
+            MappingUtils.plot_water_bodies(water_bodies, ax=self.ax)
+
+        self._annotations = []
+
+    def _plot_regions(self, ax):
+        self.geo_data.plot(ax=ax, color=MappingUtils.AVF_COLOR_MAP(0), linewidth=0.1, edgecolor="black")
+        collection = ax.collections[-1]
+        assert len(collection.get_paths()) == len(self._patch_regions), \
+            "Number of plotted patches does not match the number of polygons in the geo data"
+        return collection
+
+    def render(self, frequencies, output_path, labels=None, dpi=1200):
+        """
+        Colors the map with the given frequencies and saves it to a file.
+
+        :param frequencies: Dictionary of admin_id -> frequency.
+        :type frequencies: dict of str -> int
+        :param output_path: Path to save the map to.
+        :type output_path: str
+        :param labels: Dictionary of admin_id -> text to annotate the map with for each administrative region, or None.
+        :type labels: dict of str -> str | None
+        :param dpi: Resolution to save the map at.
+        :type dpi: int
+        """
+        colors, bin_edges, number_of_classes = MappingUtils.get_frequency_colors(
+            self.geo_data, self.admin_id_column, frequencies)
+        patch_colors = colors[self._patch_regions]
+        for collection in self._region_collections:
+            collection.set_facecolor(patch_colors)
+
+        MappingUtils.plot_frequency_legend(bin_edges, number_of_classes, self.ax)
+
+        for annotation in self._annotations:
+            annotation.remove()
+        self._annotations = []
+        if labels is not None:
+            self._annotations = MappingUtils.plot_frequency_labels(
+                self.geo_data, self.admin_id_column, labels, self.label_position_columns,
+                self.callout_position_columns, self.ax)
+
+        self.fig.savefig(output_path, dpi=dpi, bbox_inches="tight")
+
+    def close(self):
+        """
+        Closes the figure used by this renderer.
+        """
+        plt.close(self.fig)
@@ -0,0 +1,29 @@
+from unittest import mock
+
+
+def _init_fake_worker(geometry_cache_dir, dpi, simplification_tolerance):
+    pass
+
+
+def _render_fake_map(job):
+    with open(job["output_path"], "w") as f:
+        f.write(f"{job['geography']} map of {sorted(job['frequencies'].items())}")
+
+    return job["output_path"]
+
+
+def patch_map_rendering():
+    """
+    Patches `MapRenderQueue` to write a placeholder file for each map instead of rendering it, so that the queueing,
+    manifest and worker pool logic can be tested without the geojson files or the plotting libraries.
+
+    The fakes are module-level functions, so they can be sent to the worker processes like the real ones.
+
+    :return: Patcher, for use as a context manager or decorator.
+    """
+    return mock.patch.multiple(
+        "src.map_render_queue",
+        _init_worker=_init_fake_worker,
+        _render_map=_render_fake_map,
+        _geometry_levels=lambda dpi, simplification_tolerance: []
+    )
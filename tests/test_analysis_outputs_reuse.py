@@ -0,0 +1,117 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from automated_analysis import export_csv
+from src.analysis_manifest import AnalysisManifest
+from src.map_render_queue import MapRenderQueue
+from tests.fake_map_rendering import patch_map_rendering
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestAnalysisOutputsReuse(unittest.TestCase):
+    def setUp(self):
+        self.data_root = tempfile.mkdtemp()
+        self.outputs_dir = f"{self.data_root}/Outputs"
+        self.analysis_dir = f"{self.outputs_dir}/Automated Analysis"
+
+    def tearDown(self):
+        shutil.rmtree(self.data_root)
+
+    def run_analysis(self, rows_by_csv, frequencies_by_map, regenerate_all=False):
+        """
+        Simulates one run of the generate outputs and automated analysis stages, exporting the given CSVs and maps with
+        `automated_analysis.export_csv` and `MapRenderQueue`.
+
+        :return: Names of the outputs which were written, and the manifest after the run.
+        :rtype: (list of str, AnalysisManifest)
+        """
+        # Stage 3 clears its own outputs before generating them again.
+        subprocess.run([f"{REPO_ROOT}/run_scripts/clear_generated_outputs.sh", self.outputs_dir], check=True)
+        with open(f"{self.outputs_dir}/messages.csv", "w") as f:
+            f.write("generated")
+
+        # Mark the outputs of the previous run, so that the outputs written by this run can be told apart.
+        os.makedirs(f"{self.analysis_dir}/maps", exist_ok=True)
+        for name in list(rows_by_csv) + list(frequencies_by_map):
+            if os.path.exists(f"{self.analysis_dir}/{name}"):
+                os.utime(f"{self.analysis_dir}/{name}", (0, 0))
+
+        # Stage 5 writes only the analysis outputs which have changed.
+        manifest = AnalysisManifest.load(self.analysis_dir)
+        if regenerate_all:
+            manifest.invalidate_all()
+        for name, rows in rows_by_csv.items():
+            export_csv(rows, list(rows[0].keys()), f"{self.analysis_dir}/{name}", manifest)
+
+        map_render_queue = MapRenderQueue(processes=2, manifest=manifest)
+        for name, frequencies in frequencies_by_map.items():
+            map_render_queue.add_county_map(frequencies, f"{self.analysis_dir}/{name}")
+        with patch_map_rendering():
+            map_render_queue.render_all()
+
+        manifest.remove_stale_outputs()
+        manifest.save()
+
+        written = [name for name in list(rows_by_csv) + list(frequencies_by_map)
+                   if os.stat(f"{self.analysis_dir}/{name}").st_mtime != 0]
+        return written, manifest
+
+    def test_second_run_skips_unchanged_outputs(self):
+        rows_by_csv = {"engagement.csv": [{"Episode": "s01e01", "Messages": 10}],
+                       "themes.csv": [{"Theme": "health", "Participants": 4}]}
+        frequencies_by_map = {"maps/county_total.png": {"nairobi": 3, "mombasa": 1},
+                              "maps/county_health.png": {"nairobi": 2, "mombasa": 0}}
+        output_paths = [f"{self.analysis_dir}/{name}" for name in list(rows_by_csv) + list(frequencies_by_map)]
+
+        written, manifest = self.run_analysis(rows_by_csv, frequencies_by_map)
+        self.assertEqual(written, ["engagement.csv", "themes.csv", "maps/county_total.png", "maps/county_health.png"])
+        manifest.mark_uploaded(manifest.get_changed_outputs(output_paths))
+        manifest.save()
+
+        rows_by_csv["themes.csv"] = [{"Theme": "health", "Participants": 5}]
+        frequencies_by_map["maps/county_health.png"] = {"nairobi": 2, "mombasa": 1}
+        written, manifest = self.run_analysis(rows_by_csv, frequencies_by_map)
+        self.assertEqual(written, ["themes.csv", "maps/county_health.png"])
+        self.assertEqual(manifest.get_changed_outputs(output_paths),
+                         [f"{self.analysis_dir}/themes.csv", f"{self.analysis_dir}/maps/county_health.png"])
+
+    def test_regenerated_outputs_are_uploaded_again(self):
+        rows_by_csv = {"engagement.csv": [{"Episode": "s01e01", "Messages": 10}]}
+        frequencies_by_map = {"maps/county_total.png": {"nairobi": 3, "mombasa": 1}}
+        output_paths = [f"{self.analysis_dir}/engagement.csv", f"{self.analysis_dir}/maps/county_total.png"]
+
+        _, manifest = self.run_analysis(rows_by_csv, frequencies_by_map)
+        manifest.mark_uploaded(manifest.get_changed_outputs(output_paths))
+        manifest.save()
+
+        # Regenerate from the same inputs e.g. after changing how the maps are styled.
+        written, manifest = self.run_analysis(rows_by_csv, frequencies_by_map, regenerate_all=True)
+        self.assertEqual(written, ["engagement.csv", "maps/county_total.png"])
+        self.assertEqual(manifest.get_changed_outputs(output_paths), output_paths)
+
+        manifest.mark_uploaded(output_paths)
+        manifest.save()
+        _, manifest = self.run_analysis(rows_by_csv, frequencies_by_map)
+        self.assertEqual(manifest.get_changed_outputs(output_paths), [])
+
+    def test_removed_outputs_are_deleted(self):
+        self.run_analysis({"engagement.csv": [{"Episode": "s01e01"}]},
+                          {"maps/county_total.png": {"nairobi": 3}, "maps/county_health.png": {"nairobi": 2}})
+
+        written, manifest = self.run_analysis({"engagement.csv": [{"Episode": "s01e01"}]},
+                                              {"maps/county_total.png": {"nairobi": 3}})
+        self.assertEqual(written, [])
+        self.assertFalse(os.path.exists(f"{self.analysis_dir}/maps/county_health.png"))
+        self.assertEqual(sorted(manifest.entries), ["engagement.csv", "maps/county_total.png"])
+
+    def test_generated_outputs_are_cleared(self):
+        os.makedirs(f"{self.outputs_dir}/ICR")
+        with open(f"{self.outputs_dir}/production.csv", "w") as f:
+            f.write("stale")
+
+        self.run_analysis({"engagement.csv": [{"Episode": "s01e01"}]}, {})
+        self.assertEqual(sorted(os.listdir(self.outputs_dir)), ["Automated Analysis", "messages.csv"])
@@ -0,0 +1,92 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from core_data_modules.cleaners import Codes
+from core_data_modules.data_models.code_scheme import CodeTypes
+
+import automated_analysis
+from src.lib import PipelineConfiguration
+from src.lib.configuration_objects import CodingModes
+from tests.fake_map_rendering import patch_map_rendering
+
+
+def normal_code(code_scheme, i=0):
+    return [code for code in code_scheme.codes if code.code_type == CodeTypes.NORMAL][i]
+
+
+def make_label(code):
+    return {"CodeID": code.code_id, "SchemeID": "test", "DateTimeUTC": "2021-01-01T00:00:00+00:00"}
+
+
+def make_coded_value(coding_configuration, code):
+    if coding_configuration.coding_mode == CodingModes.SINGLE:
+        return make_label(code)
+    return [make_label(code)]
+
+
+class TestAutomatedAnalysis(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open("configuration/pipeline_config.json") as f:
+            cls.pipeline_configuration = PipelineConfiguration.from_configuration_file(f)
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def make_datasets(self, theme_of_uid):
+        """
+        :param theme_of_uid: Dictionary of individual uid -> index of the normal RQA code they sent a message about.
+        :type theme_of_uid: dict of str -> int
+        :return: Analysis snapshots of (messages, individuals), with one message from each individual.
+        :rtype: (list of dict, list of dict)
+        """
+        messages = []
+        individuals = []
+        for uid, theme in theme_of_uid.items():
+            message = {"uid": uid, automated_analysis.CONSENT_WITHDRAWN_KEY: Codes.FALSE}
+            for plan in PipelineConfiguration.RQA_CODING_PLANS:
+                message[plan.raw_field] = f"message {theme} from {uid}"
+                for cc in plan.coding_configurations:
+                    message[cc.coded_field] = make_coded_value(cc, normal_code(cc.code_scheme, theme))
+            messages.append(message)
+
+            individual = dict(message)
+            for plan in PipelineConfiguration.SURVEY_CODING_PLANS:
+                for cc in plan.coding_configurations:
+                    individual[cc.coded_field] = make_coded_value(cc, normal_code(cc.code_scheme))
+            individuals.append(individual)
+
+        return messages, individuals
+
+    def test_main_exports_sample_messages(self):
+        messages, individuals = self.make_datasets({"uid-1": 0, "uid-2": 0, "uid-3": 1})
+
+        with patch_map_rendering():
+            automated_analysis.main("test", self.pipeline_configuration, messages, individuals, self.output_dir)
+
+        with open(f"{self.output_dir}/sample_messages.csv") as f:
+            samples = list(csv.DictReader(f))
+        rqa_plan = PipelineConfiguration.RQA_CODING_PLANS[0]
+        rqa_scheme = rqa_plan.coding_configurations[0].code_scheme
+        self.assertEqual(
+            sorted((sample["Episode"], sample["Code"], sample["Sample Message"]) for sample in samples),
+            sorted([
+                (rqa_plan.raw_field, normal_code(rqa_scheme, 0).string_value, "message 0 from uid-1"),
+                (rqa_plan.raw_field, normal_code(rqa_scheme, 0).string_value, "message 0 from uid-2"),
+                (rqa_plan.raw_field, normal_code(rqa_scheme, 1).string_value, "message 1 from uid-3")
+            ])
+        )
+
+        # The maps are rendered after the samples are exported, and the manifest is saved last.
+        self.assertTrue(os.path.exists(f"{self.output_dir}/maps/counties/county_total_participants.png"))
+        with open(f"{self.output_dir}/manifest.json") as f:
+            manifest_entries = json.load(f)
+        self.assertIn("sample_messages.csv", manifest_entries)
+        self.assertIn("maps/counties/county_total_participants.png", manifest_entries)
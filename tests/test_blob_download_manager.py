@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from src.lib.blob_download_manager import BlobDownloadManager, LocalDirectoryBucket, compute_crc32c
+
+
+class CountingLocalDirectoryBucket(LocalDirectoryBucket):
+    def __init__(self, root_dir):
+        """
+        `LocalDirectoryBucket` which records the blobs it downloads.
+        """
+        super().__init__(root_dir)
+        self.downloaded_blob_urls = []
+
+    def download_to_file(self, blob_url, f):
+        self.downloaded_blob_urls.append(blob_url)
+        super().download_to_file(blob_url, f)
+
+
+class CompositeLocalDirectoryBucket(CountingLocalDirectoryBucket):
+    def get_checksums(self, blob_url):
+        # Report checksums like Google Cloud Storage does for composite blobs, which only have a CRC32C.
+        path = self._get_path(blob_url)
+        assert os.path.exists(path), f"Blob '{blob_url}' does not exist"
+        return None, compute_crc32c(path)
+
+
+class FailingLocalDirectoryBucket(LocalDirectoryBucket):
+    def download_to_file(self, blob_url, f):
+        f.write(b"partial")
+        raise ConnectionError("Connection lost")
+
+
+class TestBlobDownloadManager(unittest.TestCase):
+    BLOB_URLS = ["gs://test-bucket/flow-1.jsonl", "gs://test-bucket/flow-2.jsonl"]
+
+    def setUp(self):
+        self.bucket_dir = tempfile.mkdtemp()
+        self.output_dir = tempfile.mkdtemp()
+        os.makedirs(f"{self.bucket_dir}/test-bucket")
+
+        self.blob_urls_to_output_paths = dict()
+        for i, blob_url in enumerate(self.BLOB_URLS):
+            self.write_blob(blob_url, f"contents of blob {i}")
+            self.blob_urls_to_output_paths[blob_url] = f"{self.output_dir}/flow-{i + 1}.jsonl"
+
+    def tearDown(self):
+        shutil.rmtree(self.bucket_dir)
+        shutil.rmtree(self.output_dir)
+
+    def write_blob(self, blob_url, contents):
+        with open(f"{self.bucket_dir}/{blob_url[len('gs://'):]}", "w") as f:
+            f.write(contents)
+
+    def read_output(self, blob_url):
+        with open(self.blob_urls_to_output_paths[blob_url]) as f:
+            return f.read()
+
+    def assert_downloads(self, bucket):
+        manager = BlobDownloadManager(bucket, max_concurrent_downloads=2)
+
+        self.assertEqual(manager.download_changed(self.blob_urls_to_output_paths), self.BLOB_URLS)
+        self.assertEqual(self.read_output(self.BLOB_URLS[0]), "contents of blob 0")
+
+        # Nothing has changed, so nothing is downloaded again.
+        bucket.downloaded_blob_urls.clear()
+        self.assertEqual(manager.download_changed(self.blob_urls_to_output_paths), [])
+        self.assertEqual(bucket.downloaded_blob_urls, [])
+
+        # Only the changed blob is downloaded again.
+        self.write_blob(self.BLOB_URLS[1], "new contents of blob 1")
+        self.assertEqual(manager.download_changed(self.blob_urls_to_output_paths), [self.BLOB_URLS[1]])
+        self.assertEqual(bucket.downloaded_blob_urls, [self.BLOB_URLS[1]])
+        self.assertEqual(self.read_output(self.BLOB_URLS[1]), "new contents of blob 1")
+
+        # A local copy which was modified is replaced.
+        with open(self.blob_urls_to_output_paths[self.BLOB_URLS[0]], "w") as f:
+            f.write("modified locally")
+        self.assertEqual(manager.download_changed(self.blob_urls_to_output_paths), [self.BLOB_URLS[0]])
+        self.assertEqual(self.read_output(self.BLOB_URLS[0]), "contents of blob 0")
+
+    def test_download_changed_compares_md5s(self):
+        self.assert_downloads(CountingLocalDirectoryBucket(self.bucket_dir))
+
+    def test_download_changed_compares_crc32cs_of_composite_blobs(self):
+        self.assert_downloads(CompositeLocalDirectoryBucket(self.bucket_dir))
+
+    def test_failed_download_leaves_no_partial_files(self):
+        manager = BlobDownloadManager(FailingLocalDirectoryBucket(self.bucket_dir))
+
+        with self.assertRaises(ConnectionError):
+            manager.download_changed(self.blob_urls_to_output_paths)
+        self.assertEqual(os.listdir(self.output_dir), [])
@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from src.lib.cached_uuid_table import CachedUuidTable
+
+
+class InMemoryUuidTable(object):
+    def __init__(self):
+        """
+        In-memory stand-in for a `FirestoreUuidTable`, which records the batch lookups made in it.
+        """
+        self.data_to_uuid = dict()
+        self.batches = []  # of list of the data or uuids requested in each batch lookup
+
+    def data_to_uuid_batch(self, list_of_data_requested):
+        self.batches.append(sorted(list_of_data_requested))
+        for data in list_of_data_requested:
+            if data not in self.data_to_uuid:
+                self.data_to_uuid[data] = f"avf-phone-uuid-{len(self.data_to_uuid)}"
+        return {data: self.data_to_uuid[data] for data in list_of_data_requested}
+
+    def uuid_to_data_batch(self, uuids_to_lookup):
+        self.batches.append(sorted(uuids_to_lookup))
+        uuid_to_data = {uuid: data for data, uuid in self.data_to_uuid.items()}
+        return {uuid: uuid_to_data[uuid] for uuid in uuids_to_lookup}
+
+
+class TestCachedUuidTable(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache_path = f"{self.cache_dir}/phone_number_uuid_cache.enc"
+        self.encryption_key = Fernet.generate_key()
+        self.remote_table = InMemoryUuidTable()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_cache_hits_make_no_remote_lookups(self):
+        table = CachedUuidTable(self.remote_table, self.cache_path, self.encryption_key)
+        uuid = table.data_to_uuid("+254700000001")
+        self.assertEqual(len(self.remote_table.batches), 1)
+
+        self.assertEqual(table.data_to_uuid("+254700000001"), uuid)
+        self.assertEqual(table.uuid_to_data(uuid), "+254700000001")
+        self.assertEqual(len(self.remote_table.batches), 1)
+        self.assertEqual(table.remote_lookups, 1)
+
+    def test_misses_are_looked_up_in_one_batch(self):
+        table = CachedUuidTable(self.remote_table, self.cache_path, self.encryption_key)
+        table.data_to_uuid("+254700000001")
+
+        uuids = table.data_to_uuid_batch(["+254700000001", "+254700000002", "+254700000003", "+254700000002"])
+        self.assertEqual(self.remote_table.batches, [["+254700000001"], ["+254700000002", "+254700000003"]])
+        self.assertEqual(uuids, {data: self.remote_table.data_to_uuid[data]
+                                 for data in ["+254700000001", "+254700000002", "+254700000003"]})
+
+        # Uuids which were never looked up through the cache are also fetched in one batch.
+        self.remote_table.data_to_uuid_batch(["+254700000004", "+254700000005"])
+        self.remote_table.batches.clear()
+        uuids_to_lookup = [uuids["+254700000002"], self.remote_table.data_to_uuid["+254700000004"],
+                           self.remote_table.data_to_uuid["+254700000005"]]
+        self.assertEqual(table.uuid_to_data_batch(uuids_to_lookup),
+                         {uuid: data for data, uuid in self.remote_table.data_to_uuid.items()
+                          if uuid in uuids_to_lookup})
+        self.assertEqual(self.remote_table.batches, [sorted(uuids_to_lookup[1:])])
+
+    def test_save_and_load_round_trip(self):
+        table = CachedUuidTable(self.remote_table, self.cache_path, self.encryption_key)
+        uuids = table.data_to_uuid_batch(["+254700000001", "+254700000002"])
+        table.save()
+
+        # The cache file doesn't contain the raw data in plain text.
+        with open(self.cache_path, "rb") as f:
+            self.assertNotIn(b"+254700000001", f.read())
+
+        self.remote_table.batches.clear()
+        loaded_table = CachedUuidTable(self.remote_table, self.cache_path, self.encryption_key)
+        self.assertEqual(loaded_table.data_to_uuid_batch(["+254700000001", "+254700000002"]), uuids)
+        self.assertEqual(loaded_table.uuid_to_data(uuids["+254700000002"]), "+254700000002")
+        self.assertEqual(self.remote_table.batches, [])
+
+        # Saving again without any new mappings leaves the file as it was.
+        modified_time = os.stat(self.cache_path).st_mtime_ns
+        loaded_table.save()
+        self.assertEqual(os.stat(self.cache_path).st_mtime_ns, modified_time)
+
+    def test_cache_cannot_be_loaded_with_another_key(self):
+        table = CachedUuidTable(self.remote_table, self.cache_path, self.encryption_key)
+        table.data_to_uuid("+254700000001")
+        table.save()
+
+        with self.assertRaises(InvalidToken):
+            CachedUuidTable(self.remote_table, self.cache_path, Fernet.generate_key())
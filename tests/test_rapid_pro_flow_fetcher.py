@@ -0,0 +1,226 @@
+import json
+import os
+import shutil
+import socketserver
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from temba_client.exceptions import TembaRateExceededError
+from temba_client.v2 import TembaClient
+
+from src.lib.rapid_pro_flow_fetcher import RapidProFlowFetcher
+from src.lib.retry_policy import RetryPolicy
+
+PAGE_SIZE = 2
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+
+class StubRapidProServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        """
+        Local plain-HTTP server implementing the parts of the Rapid Pro API v2 which `RapidProFlowFetcher` uses:
+        listing the flows, and listing the runs of a flow (optionally only those modified after a date), with
+        pagination.
+        """
+        super().__init__(("localhost", 0), StubRapidProRequestHandler)
+        self.url = f"http://localhost:{self.server_address[1]}"
+        self.flows = dict()  # of flow uuid -> flow name
+        self.runs = []  # of serialized run
+        self.rate_limited_pages = set()  # of (flow uuid, page number) to reject once with HTTP 429
+        self._lock = threading.Lock()
+
+    def add_flow(self, name):
+        self.flows[f"flow-{len(self.flows) + 1}"] = name
+
+    def add_run(self, flow_name, contact_uuid, modified_on):
+        flow_uuid = [uuid for uuid, name in self.flows.items() if name == flow_name][0]
+        run_id = len(self.runs) + 1
+        self.runs.append({
+            "id": run_id, "uuid": f"run-{run_id}",
+            "flow": {"uuid": flow_uuid, "name": flow_name},
+            "contact": {"uuid": contact_uuid, "name": None},
+            "start": None, "responded": True, "path": [],
+            "values": {"rqa": {"name": "RQA", "value": f"answer {run_id}", "category": "All Responses",
+                               "node": "node-1", "time": modified_on.strftime(DATE_FORMAT)}},
+            "created_on": modified_on.strftime(DATE_FORMAT), "modified_on": modified_on.strftime(DATE_FORMAT),
+            "exited_on": modified_on.strftime(DATE_FORMAT), "exit_type": "completed"
+        })
+
+    def modify_run(self, run_id, modified_on):
+        run = self.runs[run_id - 1]
+        run["values"]["rqa"]["value"] += " (edited)"
+        run["modified_on"] = modified_on.strftime(DATE_FORMAT)
+
+    def get_flows_page(self):
+        return {"next": None, "previous": None, "results": [
+            {"uuid": uuid, "name": name, "type": "message", "archived": False, "labels": [], "expires": 10080,
+             "created_on": "2021-01-01T00:00:00.000000Z", "runs": {"active": 0, "completed": 0, "interrupted": 0,
+                                                                   "expired": 0},
+             "results": [], "parent_refs": []}
+            for uuid, name in self.flows.items()
+        ]}
+
+    def get_runs_page(self, flow_uuid, after, page):
+        with self._lock:
+            if (flow_uuid, page) in self.rate_limited_pages:
+                self.rate_limited_pages.remove((flow_uuid, page))
+                return None
+
+        runs = [run for run in self.runs if run["flow"]["uuid"] == flow_uuid and
+                (after is None or datetime.strptime(run["modified_on"], DATE_FORMAT) >= after)]
+        runs.sort(key=lambda run: (run["modified_on"], run["id"]), reverse=True)
+
+        next_url = None
+        if (page + 1) * PAGE_SIZE < len(runs):
+            next_url = f"{self.url}/api/v2/runs.json?flow={flow_uuid}&page={page + 1}"
+            if after is not None:
+                next_url += f"&after={after.strftime(DATE_FORMAT)}"
+        return {"next": next_url, "previous": None, "results": runs[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]}
+
+
+class StubRapidProRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        if url.path == "/api/v2/flows.json":
+            body = self.server.get_flows_page()
+        elif url.path == "/api/v2/runs.json":
+            after = datetime.strptime(params["after"], DATE_FORMAT) if "after" in params else None
+            body = self.server.get_runs_page(params["flow"], after, int(params.get("page", 0)))
+        else:
+            body = None
+            self.send_error(404)
+            return
+
+        if body is None:
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.end_headers()
+            return
+
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubRapidProClient(object):
+    def __init__(self, server, token):
+        """
+        Client of a `StubRapidProServer`, implementing the parts of `RapidProClient`'s interface which
+        `RapidProFlowFetcher` uses, over the Rapid Pro API client.
+
+        Like `RapidProClient`, it writes each page of runs to the raw export log as soon as it is downloaded, so a
+        request which fails part-way through an export leaves a partial export in the log it was given.
+        """
+        self.rapid_pro = TembaClient(server, token)
+
+    def get_flow_id(self, flow_name):
+        matching_flows = [flow for flow in self.rapid_pro.get_flows().all() if flow.name == flow_name]
+        assert len(matching_flows) == 1, f"Found {len(matching_flows)} flows named '{flow_name}'"
+        return matching_flows[0].uuid
+
+    def get_raw_runs_for_flow_id(self, flow_id, raw_export_log_file=None, modified_after=None):
+        raw_runs = []
+        for page in self.rapid_pro.get_runs(flow=flow_id, after=modified_after).iterfetches():
+            for run in page:
+                raw_export_log_file.write(f"{json.dumps(run.serialize())}\n")
+            raw_runs.extend(page)
+        return raw_runs
+
+    def update_raw_runs_with_latest_modified(self, flow_id, raw_runs, raw_export_log_file=None,
+                                             ignore_archives=False):
+        latest_modified = max(run.modified_on for run in raw_runs)
+        runs_by_id = {run.id: run for run in raw_runs}
+        for run in self.get_raw_runs_for_flow_id(flow_id, raw_export_log_file, latest_modified):
+            runs_by_id[run.id] = run
+        return sorted(runs_by_id.values(), key=lambda run: (run.modified_on, run.id), reverse=True)
+
+
+def read_dir(dir_path):
+    """
+    :return: Dictionary of path relative to `dir_path` -> contents, for every file in `dir_path`.
+    :rtype: dict of str -> str
+    """
+    contents = dict()
+    for root, _, file_names in os.walk(dir_path):
+        for file_name in file_names:
+            path = os.path.join(root, file_name)
+            with open(path) as f:
+                contents[os.path.relpath(path, dir_path)] = f.read()
+    return contents
+
+
+class TestRapidProFlowFetcher(unittest.TestCase):
+    FLOWS = ["activation_flow_1", "activation_flow_2", "survey_flow"]
+
+    def setUp(self):
+        self.server = StubRapidProServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        start = datetime(2021, 1, 1)
+        for flow in self.FLOWS:
+            self.server.add_flow(flow)
+        for i in range(15):
+            self.server.add_run(self.FLOWS[i % len(self.FLOWS)], f"contact-{i % 4}", start + timedelta(minutes=i))
+
+        self.raw_data_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.raw_data_dir)
+
+    def fetch(self, raw_data_dir, max_concurrent_fetches):
+        fetcher = RapidProFlowFetcher(
+            self.server.url, "test-token", max_concurrent_fetches=max_concurrent_fetches,
+            retry_policy=RetryPolicy((TembaRateExceededError,), max_retries=2, initial_backoff_seconds=0),
+            client_factory=StubRapidProClient
+        )
+        os.makedirs(raw_data_dir, exist_ok=True)
+        raw_runs_by_flow = fetcher.fetch_flows(self.FLOWS, raw_data_dir)
+        return {flow: [run.serialize() for run in raw_runs] for flow, raw_runs in raw_runs_by_flow.items()}
+
+    def test_concurrent_fetch_matches_sequential_fetch(self):
+        sequential_dir = f"{self.raw_data_dir}/sequential"
+        concurrent_dir = f"{self.raw_data_dir}/concurrent"
+
+        # Full fetch.
+        self.assertEqual(self.fetch(sequential_dir, 1), self.fetch(concurrent_dir, len(self.FLOWS)))
+        self.assertEqual(read_dir(sequential_dir), read_dir(concurrent_dir))
+
+        # Incremental fetch, after some runs were added and modified.
+        self.server.add_run(self.FLOWS[0], "contact-5", datetime(2021, 1, 2))
+        self.server.modify_run(2, datetime(2021, 1, 2, 1))
+        sequential_runs = self.fetch(sequential_dir, 1)
+        self.assertEqual(sequential_runs, self.fetch(concurrent_dir, len(self.FLOWS)))
+        self.assertEqual(read_dir(sequential_dir), read_dir(concurrent_dir))
+
+        self.assertEqual(len(sequential_runs[self.FLOWS[0]]), 6)
+        self.assertIn("answer 2 (edited)", json.dumps(sequential_runs[self.FLOWS[1]]))
+
+    def test_retries_do_not_duplicate_the_raw_export_log(self):
+        expected_dir = f"{self.raw_data_dir}/expected"
+        expected_runs = self.fetch(expected_dir, len(self.FLOWS))
+
+        # Rate-limit the second page of a flow's runs once, after the first page has been written to the log.
+        self.server.rate_limited_pages.add(("flow-2", 1))
+        retried_dir = f"{self.raw_data_dir}/retried"
+        self.assertEqual(self.fetch(retried_dir, len(self.FLOWS)), expected_runs)
+        self.assertEqual(len(self.server.rate_limited_pages), 0)
+
+        self.assertEqual(read_dir(retried_dir), read_dir(expected_dir))
+        with open(f"{retried_dir}/{self.FLOWS[1]}_log.jsonl") as f:
+            self.assertEqual(len(f.readlines()), len(expected_runs[self.FLOWS[1]]))
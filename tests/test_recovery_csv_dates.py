@@ -0,0 +1,28 @@
+import unittest
+from datetime import datetime
+
+import pytz
+
+from fetch_raw_data import parse_recovery_csv_date
+
+TIMEZONE = pytz.timezone("Africa/Nairobi")
+
+
+class TestParseRecoveryCSVDate(unittest.TestCase):
+    def test_zero_padded_dates(self):
+        self.assertEqual(parse_recovery_csv_date("01/02/2020 03:04", TIMEZONE),
+                         TIMEZONE.localize(datetime(2020, 2, 1, 3, 4)))
+        self.assertEqual(parse_recovery_csv_date("01/02/2020 03:04:05", TIMEZONE),
+                         TIMEZONE.localize(datetime(2020, 2, 1, 3, 4, 5)))
+
+    def test_dates_which_are_not_zero_padded(self):
+        self.assertEqual(parse_recovery_csv_date("1/2/2020 3:04", TIMEZONE),
+                         TIMEZONE.localize(datetime(2020, 2, 1, 3, 4)))
+        self.assertEqual(parse_recovery_csv_date("1/2/2020 3:04:05", TIMEZONE),
+                         TIMEZONE.localize(datetime(2020, 2, 1, 3, 4, 5)))
+        self.assertEqual(parse_recovery_csv_date("12/11/2020 3:04", TIMEZONE),
+                         TIMEZONE.localize(datetime(2020, 11, 12, 3, 4)))
+
+    def test_invalid_dates(self):
+        with self.assertRaises(ValueError):
+            parse_recovery_csv_date("2020-02-01 03:04", TIMEZONE)
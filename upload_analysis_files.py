@@ -7,6 +7,7 @@ from core_data_modules.logging import Logger
 from storage.google_cloud import google_cloud_utils
 from storage.google_drive import drive_client_wrapper
 
+from src.analysis_manifest import AnalysisManifest
 from src.lib import PipelineConfiguration
 
 log = Logger(__name__)
@@ -85,23 +86,35 @@ if __name__ == "__main__":
                                                   target_folder_is_shared_with_me=True, recursive=True,
                                                   fix_duplicates=True)
 
-            paths_to_upload = glob(f"{automated_analysis_input_dir}/*.csv")
-            log.info(f"Uploading {len(paths_to_upload)} CSVs to Drive...")
+            # Only upload the automated analysis outputs which have changed since they were last uploaded.
+            manifest = AnalysisManifest.load(automated_analysis_input_dir)
+
+            paths_to_upload = manifest.get_changed_outputs(glob(f"{automated_analysis_input_dir}/*.csv"))
+            log.info(f"Uploading {len(paths_to_upload)} changed CSVs to Drive...")
             drive_client_wrapper.update_or_create_batch(
                 paths_to_upload, pipeline_configuration.drive_upload.automated_analysis_dir,
                 target_folder_is_shared_with_me=True, recursive=True, fix_duplicates=True)
+            manifest.mark_uploaded(paths_to_upload)
+            manifest.save()
 
-            paths_to_upload = glob(f"{automated_analysis_input_dir}/maps/counties/*.png")
-            log.info(f"Uploading {len(paths_to_upload)} county maps to Drive...")
+            map_format = pipeline_configuration.automated_analysis.map_format
+            paths_to_upload = manifest.get_changed_outputs(
+                glob(f"{automated_analysis_input_dir}/maps/counties/*.{map_format}"))
+            log.info(f"Uploading {len(paths_to_upload)} changed county maps to Drive...")
             drive_client_wrapper.update_or_create_batch(
                 paths_to_upload, f"{pipeline_configuration.drive_upload.automated_analysis_dir}/maps/counties",
                 target_folder_is_shared_with_me=True, recursive=True, fix_duplicates=True)
+            manifest.mark_uploaded(paths_to_upload)
+            manifest.save()
 
-            paths_to_upload = glob(f"{automated_analysis_input_dir}/maps/constituencies/*.png")
-            log.info(f"Uploading {len(paths_to_upload)} constituency maps to Drive")
+            paths_to_upload = manifest.get_changed_outputs(
+                glob(f"{automated_analysis_input_dir}/maps/constituencies/*.{map_format}"))
+            log.info(f"Uploading {len(paths_to_upload)} changed constituency maps to Drive")
             drive_client_wrapper.update_or_create_batch(
                 paths_to_upload, f"{pipeline_configuration.drive_upload.automated_analysis_dir}/maps/constituencies/",
                 target_folder_is_shared_with_me=True, recursive=True, fix_duplicates=True)
+            manifest.mark_uploaded(paths_to_upload)
+            manifest.save()
         else:
             assert pipeline_run_mode == "auto-code-only", "pipeline run mode must be either auto-code-only or all-stages"
             production_csv_drive_dir = os.path.dirname(pipeline_configuration.drive_upload.production_upload_path)